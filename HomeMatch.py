@@ -1,24 +1,89 @@
 #A starter file for the HomeMatch application if you want to build your solution in a Python program instead of a notebook. 
 
+import contextvars
 import os
-import json
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.output_parsers import StructuredOutputParser, ResponseSchema
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+# Only lightweight modules are imported here; langchain, chromadb and openai are loaded by the
+# stage that first needs them (see benchmarks/bench_startup.py)
 from generate_listings import load_or_generate_listings
-from vector_database import setup_vector_database_from_listings, query_similar_listings
+from vector_database import setup_vector_database_from_listings, query_similar_listings, build_chroma_filter, metadata_matches, search_by_vectors
 from personalized_descriptions import generate_personalized_listings
-from metadata_extraction import extract_search_parameters_llm
+from metadata_extraction import extract_search_parameters
+from instrumentation import print_stage_summary, span, tracing_enabled
 
 # Check if environment variables are set
 if "OPENAI_API_KEY" not in os.environ or "OPENAI_API_BASE" not in os.environ:
     print("Warning: OPENAI_API_KEY or OPENAI_API_BASE environment variables are not set.")
     print("Please set these environment variables before running the application.")
 
-def find_matching_listings(vectorstore, user_preferences, n_results=3):
-    # Extract metadata filters from user preferences using LLM
-    metadata_filters = extract_search_parameters_llm(user_preferences)
+def find_matching_listings_speculative(vectorstore, user_preferences, n_results=3, overfetch=10, timings=None, chat_model=None, extraction_cache=None):
+    # Low-latency variant: the unfiltered semantic search (and its query embedding) runs at the
+    # same time as the LLM filter extraction. The extracted filters are then applied to the
+    # over-fetched candidates, and a filtered query is only issued if too few of them match.
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    
+    def timed(stage, fn, *args, **kwargs):
+        stage_start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings[stage] = time.perf_counter() - stage_start
+        return result
+    
+    def embed_and_search():
+        query_embedding = timed("embedding", vectorstore._embedding_function.embed_query, user_preferences)
+        candidates = timed("unfiltered_search", search_by_vectors, vectorstore, [query_embedding], n_results * overfetch, None)[0]
+        return query_embedding, candidates
+    
+    # Both run in a copy of the caller's context (e.g. batch_matching's quiet flag)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        extraction = executor.submit(contextvars.copy_context().run, timed, "extraction", extract_search_parameters, user_preferences,
+                                     chat_model=chat_model, cache=extraction_cache)
+        search = executor.submit(contextvars.copy_context().run, embed_and_search)
+        metadata_filters = extraction.result()
+        query_embedding, candidates = search.result()
+    
+    where = build_chroma_filter(metadata_filters, verbose=False)
+    if where is None:
+        results = candidates[:n_results]
+    else:
+        print(f"Applying metadata filters: {where}")
+        results = [(doc, score) for doc, score in candidates if metadata_matches(doc.metadata, where)][:n_results]
+        if len(results) < n_results:
+            # Not enough matches among the over-fetched candidates, ask the store directly
+            print(f"Only {len(results)} of {len(candidates)} candidates match the filters, running filtered search...")
+            with span("filter_fallback", reason="overfetch_exhausted"):
+                try:
+                    results = timed("filtered_search", search_by_vectors, vectorstore, [query_embedding], n_results, where)[0]
+                except Exception as e:
+                    print(f"Error applying metadata filters: {e}")
+                    print("Falling back to semantic search without filters")
+                    results = candidates[:n_results]
+        if not results:
+            print("No matches found with metadata filters, falling back to semantic search...")
+            results = candidates[:n_results]
+    
+    timings["total"] = time.perf_counter() - start
+    print("Stage timings: " + ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in timings.items()))
+    print(f"Found {len(results)} matching listings")
+    return results
+
+def find_matching_listings(vectorstore, user_preferences, n_results=3, low_latency=False, timings=None, chat_model=None, extraction_cache=None,
+                           retrieval="vector", lexical_index=None, diversity=None):
+    # In low-latency mode, filter extraction and semantic search run concurrently (plain vector
+    # retrieval only; the other retrieval modes and MMR re-ranking with `diversity` go through
+    # query_similar_listings).
+    # Stage timings (extraction, search, total) are written into `timings` when a dict is passed.
+    if low_latency and retrieval == "vector" and not diversity:
+        return find_matching_listings_speculative(vectorstore, user_preferences, n_results=n_results, timings=timings,
+                                                  chat_model=chat_model, extraction_cache=extraction_cache)
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    
+    # Extract metadata filters from user preferences (rule-based fast path, LLM when ambiguous)
+    metadata_filters = extract_search_parameters(user_preferences, chat_model=chat_model, cache=extraction_cache)
+    timings["extraction"] = time.perf_counter() - start
     
     # Print the extracted metadata filters
     if metadata_filters:
@@ -31,27 +96,39 @@ def find_matching_listings(vectorstore, user_preferences, n_results=3):
             vectorstore, 
             user_preferences, 
             n_results=n_results,
-            metadata_filters=metadata_filters
+            metadata_filters=metadata_filters,
+            retrieval=retrieval,
+            lexical_index=lexical_index,
+            diversity=diversity
         )
         
         # If no results with filters, fall back to semantic search
         if not results:
             print("No matches found with metadata filters, falling back to semantic search...")
-            results = query_similar_listings(
-                vectorstore, 
-                user_preferences, 
-                n_results=n_results,
-                metadata_filters=None
-            )
+            with span("filter_fallback", reason="no_matches"):
+                results = query_similar_listings(
+                    vectorstore, 
+                    user_preferences, 
+                    n_results=n_results,
+                    metadata_filters=None,
+                    retrieval=retrieval,
+                    lexical_index=lexical_index,
+                    diversity=diversity
+                )
     else:
         # No metadata filters, just do semantic search
         results = query_similar_listings(
         vectorstore, 
         user_preferences, 
         n_results=n_results,
-            metadata_filters=None
+            metadata_filters=None,
+            retrieval=retrieval,
+            lexical_index=lexical_index,
+            diversity=diversity
     )
     
+    timings["search"] = time.perf_counter() - start - timings["extraction"]
+    timings["total"] = time.perf_counter() - start
     print(f"Found {len(results)} matching listings")
     return results
 
@@ -120,7 +197,7 @@ def main():
         
         # Step 5: Generate personalized descriptions
         print("\nStep 5: Generating personalized descriptions...")
-        personalized_listings = generate_personalized_listings(matched_listings, combined_preferences)
+        personalized_listings = generate_personalized_listings(matched_listings, combined_preferences, concurrency=len(matched_listings))
         
         # Step 6: Display personalized listings
         print("\nStep 6: Displaying personalized listings...")
@@ -136,6 +213,10 @@ def main():
     else:
         print("Sorry, no matching listings were found for your preferences.")
         print("Please try again with different preferences.")
+    
+    # With HOMEMATCH_TRACE=1, show where the time went
+    if tracing_enabled():
+        print_stage_summary()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+
+# Files of an IVF index, stored next to the NumPy store's embeddings.npy
+IVF_FILES = ["ivf.npz", "ivf_vectors.npy"]
+
+
+def _assign(vectors, centroids, batch_size=65536):
+    # Nearest centroid (highest dot product, all vectors unit length) of every vector
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), batch_size):
+        assignment[start:start + batch_size] = np.argmax(np.asarray(vectors[start:start + batch_size]) @ centroids.T, axis=1)
+    return assignment
+
+
+def _normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class IVFIndex:
+    # Approximate nearest-neighbour index (IVF-Flat) over unit-normalized embeddings. Spherical
+    # k-means splits the vectors into n_lists clusters; the vectors are stored a second time,
+    # grouped by cluster, so a query scores its nprobe closest clusters as contiguous slices.
+    # nprobe is the recall/latency knob: nprobe == n_lists is an exact search.
+    def __init__(self, centroids, list_offsets, list_rows, vectors, nprobe):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.vectors = vectors
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, embeddings, path, n_lists=None, nprobe=None, iterations=10, train_size=None, seed=0, batch_size=65536):
+        # Train centroids on a sample of the (unit-normalized) embeddings, then file every vector under
+        # its nearest centroid. Defaults: 2 * sqrt(n) lists, 64 training vectors per list, nprobe = 1%
+        # of the lists (at least 8).
+        num_rows = len(embeddings)
+        n_lists = min(num_rows, n_lists or max(1, int(2 * np.sqrt(num_rows))))
+        nprobe = min(n_lists, nprobe or max(8, n_lists // 100))
+        if train_size is not None and train_size < n_lists:
+            raise ValueError(f"train_size ({train_size}) must be at least n_lists ({n_lists}): every centroid starts from a training vector")
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(num_rows, size=min(num_rows, train_size or n_lists * 64), replace=False))
+        sample = np.asarray(embeddings[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = _assign(sample, centroids, batch_size)
+            order = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=n_lists)
+            filled = np.flatnonzero(counts)
+            sums = np.add.reduceat(sample[order], (np.cumsum(counts) - counts)[filled])
+            centroids[filled] = _normalize(sums)
+            # Clusters that lost all their vectors restart from random sample vectors
+            empty = np.flatnonzero(counts == 0)
+            centroids[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+
+        assignment = _assign(embeddings, centroids, batch_size)
+        list_rows = np.argsort(assignment, kind="stable").astype(np.int32)
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=list_offsets[1:])
+
+        vectors = np.lib.format.open_memmap(os.path.join(path, "ivf_vectors.npy"), mode="w+", dtype=np.float32, shape=embeddings.shape)
+        for start in range(0, num_rows, batch_size):
+            # Read each batch in ascending row order (sequential on a memory-mapped source)
+            batch = list_rows[start:start + batch_size]
+            order = np.argsort(batch)
+            chunk = np.empty((len(batch), embeddings.shape[1]), dtype=np.float32)
+            chunk[order] = embeddings[batch[order]]
+            vectors[start:start + len(batch)] = chunk
+        vectors.flush()
+        del vectors
+        np.savez(os.path.join(path, "ivf.npz"), centroids=centroids, list_offsets=list_offsets, list_rows=list_rows, nprobe=nprobe)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(os.path.join(path, "ivf.npz")) as data:
+            centroids, list_offsets, list_rows, nprobe = data["centroids"], data["list_offsets"], data["list_rows"], int(data["nprobe"])
+        vectors = np.load(os.path.join(path, "ivf_vectors.npy"), mmap_mode="r")
+        return cls(centroids, list_offsets, list_rows, vectors, nprobe)
+
+    @staticmethod
+    def exists(path):
+        return all(os.path.exists(os.path.join(path, name)) for name in IVF_FILES)
+
+    @staticmethod
+    def remove(path):
+        for name in IVF_FILES:
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+
+    def n_lists(self):
+        return len(self.centroids)
+
+    def search(self, queries, k, nprobe=None, mask=None):
+        # For each unit-normalized query, the top-k (rows, similarities) among the vectors filed under
+        # its nprobe nearest centroids, optionally restricted to rows where `mask` is True
+        nprobe = min(self.n_lists(), nprobe or self.nprobe)
+        centroid_scores = queries @ self.centroids.T
+        if nprobe < self.n_lists():
+            probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.n_lists()), centroid_scores.shape)
+        results = []
+        for query, lists in zip(queries, probes):
+            starts, ends = self.list_offsets[lists], self.list_offsets[lists + 1]
+            rows = np.concatenate([self.list_rows[start:end] for start, end in zip(starts, ends)])
+            similarities = np.concatenate([self.vectors[start:end] @ query for start, end in zip(starts, ends)])
+            if mask is not None:
+                keep = mask[rows]
+                rows, similarities = rows[keep], similarities[keep]
+            top = np.argpartition(-similarities, k - 1)[:k] if len(similarities) > k else np.arange(len(similarities))
+            top = top[np.argsort(-similarities[top])]
+            results.append((rows[top], similarities[top]))
+        return results
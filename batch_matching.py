@@ -0,0 +1,314 @@
+import argparse
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from HomeMatch import find_matching_listings
+from instrumentation import enable_tracing, print_stage_summary, start_metrics_server, write_trace
+from metadata_extraction import get_chat_model
+from personalized_descriptions import generate_personalized_listings, get_llm
+from vector_database import listing_id
+
+# Offline matching of a backlog of buyer profiles: profiles are streamed from a JSONL file through
+# a bounded worker pool, and results are appended to a JSONL file that doubles as the checkpoint.
+
+
+class CallCounter:
+    # Transparent proxy around an API client that counts calls to its request methods
+    def __init__(self, client, methods=("invoke", "stream", "embed_query", "embed_documents", "embed_queries")):
+        self._client = client
+        self._methods = set(methods)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name not in self._methods:
+            return attribute
+
+        def counted(*args, **kwargs):
+            with self._lock:
+                self.calls += 1
+            return attribute(*args, **kwargs)
+        return counted
+
+
+def profile_preferences(profile):
+    # A profile is either {"preferences": "..."} or question/answer lists like collect_user_preferences()
+    if profile.get("preferences"):
+        return profile["preferences"]
+    answers = profile.get("answers", [])
+    questions = profile.get("questions", [""] * len(answers))
+    return "\n".join(f"{q}: {a}" if q else a for q, a in zip(questions, answers))
+
+
+def read_profiles(profiles_file):
+    # Lazily yield (profile_id, preferences) pairs; profiles without an "id" are numbered by line
+    with open(profiles_file, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            profile = json.loads(line)
+            yield str(profile.get("id", line_number)), profile_preferences(profile)
+
+
+def read_completed_profiles(output_file):
+    # Ids of profiles already matched successfully. The file is compacted to those records, so
+    # failed profiles are retried without leaving their error records behind and the output keeps
+    # one record per profile id. Corrupt lines, like a partial last line from a crash mid-write,
+    # are dropped.
+    completed = set()
+    kept = []
+    compact = False
+    with open(output_file, "rb") as f:
+        for line_number, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+                if not line.endswith(b"\n"):
+                    raise ValueError("Incomplete line")
+            except ValueError:
+                print(f"Dropping corrupt record on line {line_number} of {output_file}")
+                compact = True
+                continue
+            if record.get("error") or record["id"] in completed:
+                compact = True
+                continue
+            completed.add(record["id"])
+            kept.append(line)
+    if compact:
+        temp_path = f"{output_file}.tmp"
+        with open(temp_path, "wb") as f:
+            f.writelines(kept)
+        os.replace(temp_path, output_file)
+    return completed
+
+
+# Set in the worker threads while they run a profile with quiet=True. Threads the pipeline starts
+# itself (speculative search, personalization) run in a copy of the caller's context, so they
+# inherit it.
+_quiet = contextvars.ContextVar("quiet", default=False)
+
+
+class _QuietStdout:
+    # sys.stdout stand-in that drops writes made in a quiet context and passes every other
+    # thread's output through to the stream it replaced
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        if _quiet.get():
+            return len(text)
+        return self._stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+@contextlib.contextmanager
+def quiet_stdout():
+    # Filter sys.stdout for the duration and restore it afterwards
+    stream = _QuietStdout(sys.stdout)
+    sys.stdout = stream
+    try:
+        yield
+    finally:
+        if sys.stdout is stream:
+            sys.stdout = stream._stream
+
+
+def serialize_matches(matches, descriptions=None):
+    # JSON-ready view of (Document, score) matches, optionally with their personalized descriptions
+    descriptions = descriptions or [None] * len(matches)
+    return [
+        {
+            "listing_id": listing_id(doc.metadata["content_hash"]) if doc.metadata.get("content_hash") else None,
+            "score": float(score),
+            "metadata": {key: value for key, value in doc.metadata.items() if key != "content_hash"},
+            "listing_text": doc.page_content,
+            "personalized_description": description
+        }
+        for (doc, score), description in zip(matches, descriptions)
+    ]
+
+
+def match_profile(vectorstore, profile_id, user_preferences, n_results=3, personalize=True, low_latency=False,
+                  chat_model=None, llm=None, extraction_cache=None, description_cache=None, retrieval="vector", lexical_index=None,
+                  diversity=None):
+    # Run extraction, retrieval and personalization for one profile; returns the output record
+    # with per-stage timings in seconds
+    start = time.perf_counter()
+    timings = {}
+    matches = find_matching_listings(vectorstore, user_preferences, n_results=n_results, low_latency=low_latency, timings=timings,
+                                     chat_model=chat_model, extraction_cache=extraction_cache, retrieval=retrieval, lexical_index=lexical_index,
+                                     diversity=diversity)
+    timings["matching"] = timings.pop("total")
+    descriptions = [None] * len(matches)
+    if personalize and matches:
+        personalization_start = time.perf_counter()
+        personalized = generate_personalized_listings(matches, user_preferences, concurrency=len(matches), llm=llm, cache=description_cache)
+        descriptions = [listing["personalized_description"] for listing in personalized]
+        timings["personalization"] = time.perf_counter() - personalization_start
+    timings["total"] = time.perf_counter() - start
+    return {"id": profile_id, "matches": serialize_matches(matches, descriptions), "timings": timings}
+
+
+def latency_percentiles(latencies):
+    # p50/p95/p99 per stage, in milliseconds
+    return {
+        stage: dict(zip(("p50", "p95", "p99"), (np.percentile(values, [50, 95, 99]) * 1000).tolist()))
+        for stage, values in latencies.items() if values
+    }
+
+
+def match_profiles(vectorstore, profiles_file, output_file="matches.jsonl", n_results=3, workers=8, max_in_flight=None,
+                   personalize=True, low_latency=False, resume=True, chat_model=None, llm=None, extraction_cache=None,
+                   description_cache=None, quiet=True, progress_every=100, retrieval="vector", lexical_index=None, diversity=None):
+    # Match every profile in profiles_file and append one JSON record per profile to output_file as
+    # soon as it is done (completion order). At most max_in_flight profiles (default 2 * workers)
+    # are queued or running, so the input is never read far ahead of the pool. With resume=True,
+    # profiles already in output_file are skipped. Returns throughput, per-stage latency
+    # percentiles and API-call counts. With quiet=True the worker threads' pipeline output is
+    # silenced; other threads keep printing.
+    max_in_flight = max_in_flight or workers * 2
+    completed = set()
+    if resume and os.path.exists(output_file):
+        completed = read_completed_profiles(output_file)
+        print(f"Resuming: {len(completed)} profiles already in '{output_file}'")
+
+    # Count every request that leaves the process
+    extraction_llm = CallCounter(chat_model or get_chat_model())
+    personalization_llm = CallCounter(llm or get_llm())
+    embedding_function = vectorstore._embedding_function
+    embeddings = CallCounter(embedding_function)
+    vectorstore._embedding_function = embeddings
+
+    latencies = {}
+    processed = failed = skipped = 0
+    start = time.perf_counter()
+
+    def run(profile_id, preferences):
+        token = _quiet.set(quiet)
+        try:
+            return match_profile(vectorstore, profile_id, preferences, n_results, personalize, low_latency,
+                                 extraction_llm, personalization_llm, extraction_cache, description_cache, retrieval, lexical_index, diversity)
+        finally:
+            _quiet.reset(token)
+
+    def record_result(f, profile_id, future):
+        nonlocal processed, failed
+        try:
+            record = future.result()
+            for stage, seconds in record["timings"].items():
+                latencies.setdefault(stage, []).append(seconds)
+        except Exception as e:
+            record = {"id": profile_id, "error": f"{type(e).__name__}: {e}"}
+            failed += 1
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        processed += 1
+        if progress_every and processed % progress_every == 0:
+            print(f"Matched {processed} profiles ({processed / (time.perf_counter() - start):.1f} profiles/sec)", file=sys.stderr)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = {}
+    try:
+        with quiet_stdout() if quiet else contextlib.nullcontext(), open(output_file, "a" if resume else "w", encoding="utf-8") as f:
+            for profile_id, preferences in read_profiles(profiles_file):
+                if profile_id in completed:
+                    skipped += 1
+                    continue
+                # Backpressure: wait for a slot before reading the next profile
+                while len(pending) >= max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record_result(f, pending.pop(future), future)
+                pending[executor.submit(run, profile_id, preferences)] = profile_id
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record_result(f, pending.pop(future), future)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        vectorstore._embedding_function = embedding_function
+
+    elapsed = time.perf_counter() - start
+    return {
+        "profiles": processed,
+        "failed": failed,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "profiles_per_second": processed / elapsed if elapsed else 0.0,
+        "latency_ms": latency_percentiles(latencies),
+        "api_calls": {
+            "extraction_llm": extraction_llm.calls,
+            "personalization_llm": personalization_llm.calls,
+            "embeddings": embeddings.calls
+        }
+    }
+
+
+def print_batch_stats(stats):
+    print(f"\nMatched {stats['profiles']} profiles in {stats['seconds']:.1f}s "
+          f"({stats['profiles_per_second']:.2f} profiles/sec, {stats['failed']} failed, {stats['skipped']} skipped)")
+    print(f"{'stage':<18}  {'p50_ms':>9}  {'p95_ms':>9}  {'p99_ms':>9}")
+    for stage, percentiles in stats["latency_ms"].items():
+        print(f"{stage:<18}  {percentiles['p50']:>9.1f}  {percentiles['p95']:>9.1f}  {percentiles['p99']:>9.1f}")
+    print("API calls: " + ", ".join(f"{name}={calls}" for name, calls in stats["api_calls"].items()))
+
+
+def main():
+    from generate_listings import load_or_generate_listings
+    from vector_database import RETRIEVAL_MODES, setup_lexical_index, setup_vector_database_from_listings
+
+    parser = argparse.ArgumentParser(description="Match a JSONL file of buyer profiles against the listings")
+    parser.add_argument("profiles_file", help='JSONL file with one {"id": ..., "preferences": "..."} profile per line')
+    parser.add_argument("--output", default="matches.jsonl")
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--no-personalize", action="store_true", help="Only extract filters and retrieve listings")
+    parser.add_argument("--low-latency", action="store_true")
+    parser.add_argument("--restart", action="store_true", help="Overwrite the output file instead of resuming")
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy", "sharded"])
+    parser.add_argument("--dedup", action="store_true", help="Drop near-duplicate listings before indexing")
+    parser.add_argument("--shard-workers", type=int, default=0, help="Sharded backend: worker processes scanning borough shards in parallel")
+    parser.add_argument("--retrieval", default="vector", choices=RETRIEVAL_MODES,
+                        help="hybrid fuses BM25 with vector search; lexical answers from BM25 without embedding calls")
+    parser.add_argument("--diversity", type=float,
+                        help="Re-rank over-fetched vector results with MMR; 0-1, higher trades relevance for variety")
+    parser.add_argument("--nprobe", type=int,
+                        help="NumPy backends: search through an IVF index probing this many lists per query (built on first use)")
+    parser.add_argument("--quantization", choices=["int8"],
+                        help="NumPy backends: scan a low-precision copy of the embeddings, re-ranking the best matches at full precision")
+    parser.add_argument("--trace-file", help="Write per-stage spans to this JSON trace file")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port while running")
+    args = parser.parse_args()
+    
+    if args.trace_file or args.metrics_port:
+        enable_tracing(keep_spans=bool(args.trace_file))
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    vectorstore = setup_vector_database_from_listings(load_or_generate_listings(dedup=args.dedup), backend=args.backend,
+                                                      ann={"nprobe": args.nprobe} if args.nprobe and args.backend != "chroma" else None,
+                                                      quantization=args.quantization, shard_workers=args.shard_workers)
+    lexical_index = setup_lexical_index(vectorstore) if args.retrieval != "vector" else None
+    stats = match_profiles(vectorstore, args.profiles_file, args.output, n_results=args.n_results, workers=args.workers,
+                           personalize=not args.no_personalize, low_latency=args.low_latency, resume=not args.restart,
+                           retrieval=args.retrieval, lexical_index=lexical_index, diversity=args.diversity)
+    print_batch_stats(stats)
+    if args.trace_file or args.metrics_port:
+        print_stage_summary()
+    if args.trace_file:
+        write_trace(args.trace_file)
+        print(f"Trace written to {args.trace_file}")
+
+
+if __name__ == "__main__":
+    main()
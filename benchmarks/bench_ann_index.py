@@ -0,0 +1,115 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import IVFIndex
+
+# Recall@k versus latency of the IVF index against exact search, on synthetic clustered unit vectors
+# (listing embeddings are far from uniform; uniform random vectors would make any IVF look bad).
+# Queries are drawn from the same distribution but are not part of the corpus. Exact search is the
+# same matrix product NumpyVectorStore runs over its memory-mapped embeddings.
+
+
+def make_embeddings(path, num_vectors, dim, num_clusters, spread, seed=0, batch_size=100000):
+    # Write a clustered corpus to a memory-mapped .npy file batch by batch and return it with fresh queries
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(num_clusters, dim)).astype(np.float32)
+
+    def sample(count):
+        vectors = centers[rng.integers(num_clusters, size=count)] + spread * rng.normal(size=(count, dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    embeddings = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(num_vectors, dim))
+    for start in range(0, num_vectors, batch_size):
+        embeddings[start:start + batch_size] = sample(min(batch_size, num_vectors - start))
+    embeddings.flush()
+    return np.load(path, mmap_mode="r"), sample(1000)
+
+
+def exact_top_k(embeddings, queries, k, batch_size=200000):
+    # Ground truth: top-k rows per query, merging the top-k of each batch of the corpus
+    candidate_rows, candidate_scores = [], []
+    for start in range(0, len(embeddings), batch_size):
+        scores = queries @ np.asarray(embeddings[start:start + batch_size]).T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        candidate_rows.append(top + start)
+        candidate_scores.append(np.take_along_axis(scores, top, axis=1))
+    rows, scores = np.concatenate(candidate_rows, axis=1), np.concatenate(candidate_scores, axis=1)
+    return np.take_along_axis(rows, np.argpartition(-scores, k - 1, axis=1)[:, :k], axis=1)
+
+
+def time_exact(embeddings, queries, k):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        similarities = embeddings @ query
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top[np.argsort(-similarities[top])]
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+def time_ivf(index, queries, k, nprobe):
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = index.search(query[None, :], k, nprobe)[0]
+        latencies.append(time.perf_counter() - start)
+        found.append(rows)
+    return percentiles(latencies), found
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall@k and latency of the IVF index against exact search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--dim", type=int, default=128, help="Embedding dimension (ada-002 has 1536; memory grows with it)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--nprobes", type=int, nargs="+", default=[1, 4, 16, 64, 128, 256])
+    parser.add_argument("--n-lists", type=int, help="IVF lists (default: 2 * sqrt(n))")
+    parser.add_argument("--clusters", type=int, help="Clusters in the synthetic data (default: one per 50 vectors)")
+    parser.add_argument("--spread", type=float, default=1.0, help="Noise around each cluster center, relative to its norm per dimension")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp()
+        try:
+            embeddings, queries = make_embeddings(os.path.join(workdir, "embeddings.npy"), size, args.dim, args.clusters or size // 50, args.spread)
+            queries = queries[:args.num_queries]
+            truth = exact_top_k(embeddings, queries, args.k)
+            embeddings = np.load(os.path.join(workdir, "embeddings.npy"))  # in RAM, like a warm memory map
+
+            start = time.perf_counter()
+            index = IVFIndex.build(embeddings, workdir, n_lists=args.n_lists)
+            build_seconds = time.perf_counter() - start
+            index.vectors = np.asarray(index.vectors)
+
+            exact_p50, exact_p95 = time_exact(embeddings, queries, args.k)
+            print(f"\n{size} vectors, dim {args.dim}: IVF build {build_seconds:.1f}s, {index.n_lists()} lists "
+                  f"(~{size // index.n_lists()} vectors each)")
+            print(f"{'search':>12}  {'recall@' + str(args.k):>9}  {'p50 ms':>7}  {'p95 ms':>7}  {'speedup':>7}")
+            print(f"{'exact':>12}  {1.0:>9.3f}  {exact_p50:>7.2f}  {exact_p95:>7.2f}  {1.0:>6.1f}x")
+            for nprobe in sorted(set(min(nprobe, index.n_lists()) for nprobe in args.nprobes)):
+                (p50, p95), found = time_ivf(index, queries, args.k, nprobe)
+                recall = np.mean([len(np.intersect1d(rows, expected)) / args.k for rows, expected in zip(found, truth)])
+                print(f"{'nprobe=' + str(nprobe):>12}  {recall:>9.3f}  {p50:>7.2f}  {p95:>7.2f}  {exact_p50 / p50:>6.1f}x")
+            del embeddings, index
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
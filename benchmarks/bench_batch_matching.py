@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_matching import match_profiles, print_batch_stats
+from extraction_cache import ExtractionCache
+from numpy_index import NumpyVectorStore
+from vector_database import prepare_listing_records
+from fake_llm import FakeChatModel, FakeEmbeddings, fake_listing
+
+# Throughput of offline profile matching for different worker pool sizes, with fake LLM latency
+
+PROFILE_TEMPLATES = [
+    "{bedrooms} bedrooms, at least 1 bathroom, close to the U-Bahn",
+    "A quiet {bedrooms}-bedroom flat in {borough} with a balcony",
+    "Something cozy for a family of {bedrooms} near parks and cafés",  # ambiguous: goes to the LLM
+    "Looking for a spacious {bedrooms}-bedroom place with at least 80 square meters"
+]
+BOROUGHS = ["Mitte", "Kreuzberg", "Neukölln", "Wedding"]
+
+
+def fake_extraction(prompt_text):
+    # Schema-complete JSON answer for the extraction prompt
+    return json.dumps({key: "" for key in ["bedrooms", "bathrooms", "min_price", "max_price", "min_size", "max_size", "boroughs"]})
+
+
+def write_profiles(path, num_profiles):
+    rng = random.Random(0)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(num_profiles):
+            text = rng.choice(PROFILE_TEMPLATES).format(bedrooms=rng.randint(1, 4), borough=rng.choice(BOROUGHS))
+            f.write(json.dumps({"id": f"profile-{i}", "preferences": text}) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch matching of buyer profiles")
+    parser.add_argument("--num-listings", type=int, default=2000)
+    parser.add_argument("--num-profiles", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM time to first token in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.001, help="Fake delay between tokens in seconds")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    embeddings = FakeEmbeddings(dim=256, latency=0.0, per_text_latency=0.0)
+    corpus = [fake_listing(f"listing {i} in the {BOROUGHS[i % len(BOROUGHS)]} borough with {i % 4 + 1} bedrooms") for i in range(args.num_listings)]
+    vectorstore = NumpyVectorStore.from_records(prepare_listing_records(corpus), embeddings, os.path.join(workdir, "numpy_index"))
+    embeddings.latency = 0.02
+    profiles_file = os.path.join(workdir, "profiles.jsonl")
+    write_profiles(profiles_file, args.num_profiles)
+
+    for workers in args.workers:
+        print(f"\n=== {workers} workers ===")
+        stats = match_profiles(
+            vectorstore, profiles_file, os.path.join(workdir, f"matches_{workers}.jsonl"), n_results=args.n_results, workers=workers,
+            resume=False, chat_model=FakeChatModel(latency=args.latency, response_fn=fake_extraction),
+            llm=FakeChatModel(latency=args.latency, token_latency=args.token_latency),
+            extraction_cache=ExtractionCache(os.path.join(workdir, f"extraction_cache_{workers}.sqlite")), progress_every=0
+        )
+        print_batch_stats(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_database import build_vector_database, query_similar_listings, query_similar_listings_batch
+from fake_llm import FakeEmbeddings, fake_listing
+
+# Compare query_similar_listings_batch with a loop over query_similar_listings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched multi-query search")
+    parser.add_argument("--num-listings", type=int, default=2000)
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake embedding round-trip latency in seconds")
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings(dim=args.dim, latency=0.0, per_text_latency=0.0)
+    corpus = [fake_listing(f"listing {i} in the Mitte borough with {i % 4 + 1} bedrooms") for i in range(args.num_listings)]
+    vectorstore = build_vector_database(corpus, os.path.join(tempfile.mkdtemp(), "chroma_db"), embeddings)
+
+    # Saved buyer profiles with a mix of filters, as the nightly matching job would see them
+    rng = random.Random(0)
+    queries = [f"buyer profile {i}: apartment with a balcony near the U-Bahn" for i in range(args.num_queries)]
+    filters = [rng.choice([None, {"bedrooms": "2"}, {"bedrooms": "3", "bathrooms": "2"}]) for _ in queries]
+
+    embeddings.latency = args.latency
+    embeddings.calls = 0
+    start = time.perf_counter()
+    loop_results = []
+    for query, query_filters in zip(queries, filters):
+        loop_results.append(query_similar_listings(vectorstore, query, args.n_results, query_filters))
+    loop_time = time.perf_counter() - start
+    loop_calls = embeddings.calls
+
+    embeddings.calls = 0
+    start = time.perf_counter()
+    batch_results = query_similar_listings_batch(vectorstore, queries, args.n_results, filters)
+    batch_time = time.perf_counter() - start
+    batch_calls = embeddings.calls
+
+    same = all(
+        [doc.page_content for doc, _ in a] == [doc.page_content for doc, _ in b]
+        for a, b in zip(loop_results, batch_results)
+    )
+    print(f"\n{args.num_queries} queries over {args.num_listings} listings (results identical: {same})")
+    print(f"{'mode':<6}  {'seconds':>8}  {'queries/sec':>11}  {'embedding_calls':>15}")
+    print(f"{'loop':<6}  {loop_time:>8.2f}  {args.num_queries / loop_time:>11.1f}  {loop_calls:>15}")
+    print(f"{'batch':<6}  {batch_time:>8.2f}  {args.num_queries / batch_time:>11.1f}  {batch_calls:>15}")
+
+
+if __name__ == "__main__":
+    main()
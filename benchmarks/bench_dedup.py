@@ -0,0 +1,126 @@
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import NearDuplicateDetector
+from vector_database import prepare_listing_records
+
+# Near-duplicate detection over a synthetic listing stream: throughput next to the metadata extraction
+# and hashing that prepare_listing_records does anyway, peak memory, and precision/recall against
+# the planted duplicates. A planted duplicate is an earlier listing with a few words changed, the
+# way a cycled prompt at temperature 0 rephrases the same apartment.
+
+BOROUGHS = ["Mitte", "Friedrichshain-Kreuzberg", "Pankow", "Charlottenburg-Wilmersdorf", "Spandau", "Steglitz-Zehlendorf",
+            "Tempelhof-Schöneberg", "Neukölln", "Treptow-Köpenick", "Marzahn-Hellersdorf", "Lichtenberg", "Reinickendorf"]
+FEATURES = ["a sunny balcony", "a private garden", "high stucco ceilings", "a roof terrace", "oak parquet floors", "a fitted kitchen",
+            "floor heating", "a lift", "a quiet courtyard view", "a guest toilet", "a walk-in wardrobe", "a cellar storage room",
+            "large windows", "a renovated bathroom", "an open-plan living area", "a bike room", "a home office nook", "a fireplace"]
+SURROUNDINGS = ["cafés", "parks", "nightlife", "U-Bahn connections", "farmers markets", "schools", "the canal", "galleries",
+                "bakeries", "playgrounds", "the S-Bahn ring", "a lake", "bike lanes", "theatres", "sports clubs", "street food"]
+ADJECTIVES = ["bright", "spacious", "charming", "modern", "cosy", "elegant", "quiet", "renovated", "airy", "stylish"]
+
+
+def make_listing(rng):
+    borough = rng.choice(BOROUGHS)
+    bedrooms = rng.randint(1, 5)
+    size = 35 + bedrooms * 25 + rng.randint(0, 30)
+    price = size * rng.randint(4000, 9000) // 1000 * 1000
+    features = rng.sample(FEATURES, 4)
+    surroundings = rng.sample(SURROUNDINGS, 4)
+    return (
+        f"Borough: {borough}  \nPrice: €{price:,}  \nBedrooms: {bedrooms}  \nBathrooms: {max(1, bedrooms - rng.randint(0, 2))}  \n"
+        f"Size: {size} m²  \n\n"
+        f"Description: This {rng.choice(ADJECTIVES)} {bedrooms}-bedroom apartment on the {rng.randint(1, 6)}. floor offers "
+        f"{', '.join(features[:3])} and {features[3]}. Built in {rng.randint(1890, 2022)}, it has been {rng.choice(ADJECTIVES)} "
+        f"throughout and is available from {rng.choice(['January', 'March', 'May', 'July', 'September', 'November'])}.\n\n"
+        f"Neighborhood Description: {borough} offers {', '.join(surroundings[:3])} and {surroundings[3]}, "
+        f"with {rng.choice(ADJECTIVES)} streets within {rng.randint(2, 15)} minutes' walk."
+    )
+
+
+def perturb(rng, text, edits):
+    # Replace `edits` random words, keeping the layout
+    words = text.split(" ")
+    for _ in range(edits):
+        words[rng.randrange(len(words))] = rng.choice(ADJECTIVES)
+    return " ".join(words)
+
+
+def make_stream(size, duplicate_rate, edits, seed=0):
+    # (listings, original position per planted duplicate)
+    rng = random.Random(seed)
+    listings, planted = [], {}
+    for i in range(size):
+        if listings and rng.random() < duplicate_rate:
+            original = rng.randrange(len(listings))
+            planted[i] = planted.get(original, original)
+            listings.append(perturb(rng, listings[original], rng.randint(1, edits)))
+        else:
+            listings.append(make_listing(rng))
+    return listings, planted
+
+
+def planted_jaccard(listings, planted, detector):
+    # Exact Jaccard similarity of each planted duplicate's shingle set with its original's
+    similarities = {}
+    items = list(planted.items())
+    for start in range(0, len(items), 10000):
+        batch = items[start:start + 10000]
+        shingles, counts = detector._shingle_hashes([listings[i] for pair in batch for i in pair])
+        sets = [set(chunk) for chunk in np.split(shingles.tolist(), np.cumsum(counts)[:-1])]
+        for (duplicate, _), first, second in zip(batch, sets[::2], sets[1::2]):
+            similarities[duplicate] = len(first & second) / len(first | second)
+    return similarities
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MinHash/LSH near-duplicate detection over a listing stream")
+    parser.add_argument("--size", type=int, default=1000000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2, help="Fraction of listings that are planted near-duplicates")
+    parser.add_argument("--edits", type=int, default=3, help="Up to this many words changed per planted duplicate")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--prepare-sample", type=int, default=50000, help="Listings run through prepare_listing_records for comparison")
+    args = parser.parse_args()
+
+    listings, planted = make_stream(args.size, args.duplicate_rate, args.edits)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    detector = NearDuplicateDetector(threshold=args.threshold)
+    start = time.perf_counter()
+    for batch_start in range(0, len(listings), args.batch_size):
+        detector.add_batch(listings[batch_start:batch_start + args.batch_size])
+    dedup_seconds = time.perf_counter() - start
+    peak_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss) / 1024
+
+    sample = listings[:args.prepare_sample]
+    start = time.perf_counter()
+    prepare_listing_records(sample)
+    prepare_rate = len(sample) / (time.perf_counter() - start)
+
+    # A flagged listing is correct when it was planted; its original may be another copy of the
+    # same listing, so compare the planted roots
+    flagged = detector.duplicates
+    true_positives = sum(1 for i, original in flagged.items() if i in planted and planted.get(original, original) == planted[i])
+    precision = true_positives / len(flagged) if flagged else 1.0
+    recall = true_positives / len(planted) if planted else 1.0
+    # Recall counting only the planted duplicates that really are above the threshold
+    similar = [i for i, similarity in planted_jaccard(listings, planted, NearDuplicateDetector()).items() if similarity >= args.threshold]
+    similar_recall = sum(1 for i in similar if i in flagged) / len(similar) if similar else 1.0
+
+    print(f"\n{args.size} listings, {len(planted)} planted near-duplicates (1-{args.edits} words changed), threshold {args.threshold}")
+    print(f"dedup:                   {args.size / dedup_seconds:>9.0f} listings/s  ({dedup_seconds:.1f}s, about {peak_mb:.0f} MB added peak RSS)")
+    print(f"prepare_listing_records: {prepare_rate:>9.0f} listings/s  (on {len(sample)} listings)")
+    print(f"precision {precision:.3f}, recall {recall:.3f} (on the {len(similar)} with Jaccard >= {args.threshold}: {similar_recall:.3f})")
+    print(detector.report())
+
+
+if __name__ == "__main__":
+    main()
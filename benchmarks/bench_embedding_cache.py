@@ -0,0 +1,72 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_cache import CachedEmbeddings
+from fake_llm import FakeEmbeddings, fake_listing
+
+# Rebuild cost with and without the embedding cache when a small fraction of listings changed
+
+
+def make_corpus(num_listings):
+    return [fake_listing(f"listing {i} in the Mitte borough with {i % 4 + 1} bedrooms") for i in range(num_listings)]
+
+
+def embed_corpus(embeddings, corpus, batch_size):
+    # Embed in batches, the way Chroma.from_texts hands documents to the embedding function
+    for start in range(0, len(corpus), batch_size):
+        embeddings.embed_documents(corpus[start:start + batch_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark re-indexing with the embedding cache")
+    parser.add_argument("--num-listings", type=int, default=10000)
+    parser.add_argument("--changed-fraction", type=float, default=0.01)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake embedding round-trip latency in seconds")
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.num_listings)
+    changed = list(corpus)
+    for i in random.Random(0).sample(range(args.num_listings), int(args.num_listings * args.changed_fraction)):
+        changed[i] = changed[i] + " Recently renovated."
+
+    cache_dir = tempfile.mkdtemp()
+    rows = []
+
+    # Uncached rebuild: every listing goes to the embedding model
+    model = FakeEmbeddings(dim=args.dim, latency=args.latency)
+    start = time.perf_counter()
+    embed_corpus(model, changed, args.batch_size)
+    rows.append(("uncached rebuild", time.perf_counter() - start, model.calls, model.texts_embedded, None))
+
+    # Cold cache build of the original corpus
+    model = FakeEmbeddings(dim=args.dim, latency=args.latency)
+    cached = CachedEmbeddings(model, cache_dir=cache_dir)
+    start = time.perf_counter()
+    embed_corpus(cached, corpus, args.batch_size)
+    rows.append(("cold cache build", time.perf_counter() - start, model.calls, model.texts_embedded, cached.cache.stats()))
+
+    # Rebuild after the change, from a freshly opened cache as a new process would see it
+    model = FakeEmbeddings(dim=args.dim, latency=args.latency)
+    cached = CachedEmbeddings(model, cache_dir=cache_dir)
+    start = time.perf_counter()
+    embed_corpus(cached, changed, args.batch_size)
+    rows.append(("cached rebuild", time.perf_counter() - start, model.calls, model.texts_embedded, cached.cache.stats()))
+
+    print(f"\n{args.num_listings} listings, {args.changed_fraction:.1%} changed")
+    print(f"{'scenario':<18}  {'seconds':>8}  {'api_calls':>9}  {'texts_embedded':>14}  {'hits':>6}  {'misses':>6}")
+    for name, elapsed, calls, texts, stats in rows:
+        hits = stats["hits"] if stats else "-"
+        misses = stats["misses"] if stats else "-"
+        print(f"{name:<18}  {elapsed:>8.2f}  {calls:>9}  {texts:>14}  {hits:>6}  {misses:>6}")
+
+
+if __name__ == "__main__":
+    main()
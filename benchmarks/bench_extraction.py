@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metadata_extraction import extract_search_parameters, extract_search_parameters_fast, extract_search_parameters_llm
+
+# Accuracy and latency of the rule-based fast path versus the LLM path on a labelled set of
+# preference strings. The LLM path needs OPENAI_API_KEY/OPENAI_API_BASE and only runs with --with-llm.
+
+CASES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extraction_cases.jsonl")
+
+
+def normalize(filters):
+    return {key: str(value).strip() for key, value in filters.items() if str(value).strip()}
+
+
+def evaluate(name, extract, cases, repeat=1):
+    correct = 0
+    latencies = []
+    for case in cases:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            filters = extract(case["text"])
+        latencies.append((time.perf_counter() - start) / repeat)
+        correct += normalize(filters) == normalize(case["filters"])
+    latencies.sort()
+    return {
+        "name": name,
+        "accuracy": correct / len(cases),
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fast-path vs LLM search parameter extraction")
+    parser.add_argument("--cases", default=CASES_FILE)
+    parser.add_argument("--with-llm", action="store_true", help="Also run the LLM path (makes API calls)")
+    args = parser.parse_args()
+
+    with open(args.cases, "r", encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    # Coverage: how often the fast path is confident, and how often it is right when it is
+    confident_cases = []
+    for case in cases:
+        filters, confident = extract_search_parameters_fast(case["text"])
+        if confident:
+            confident_cases.append((case, filters))
+    precision = sum(normalize(f) == normalize(c["filters"]) for c, f in confident_cases) / max(1, len(confident_cases))
+
+    rows = [evaluate("fast path (confident only)", lambda text: extract_search_parameters_fast(text)[0], [c for c, _ in confident_cases], repeat=1000)]
+    if args.with_llm:
+        sys.stdout = open(os.devnull, "w")
+        # Bypass the extraction cache so every case pays for a real round trip
+        rows.append(evaluate("llm", lambda text: extract_search_parameters_llm(text, cache=False), cases))
+        rows.append(evaluate("fast path + llm fallback", lambda text: extract_search_parameters(text, cache=False), cases))
+        sys.stdout = sys.__stdout__
+
+    print(f"\n{len(cases)} labelled cases, fast path confident on {len(confident_cases)} ({len(confident_cases) / len(cases):.0%}), "
+          f"correct on {precision:.0%} of those")
+    print(f"{'extractor':<28}  {'accuracy':>8}  {'mean_ms':>9}  {'p95_ms':>9}")
+    for row in rows:
+        print(f"{row['name']:<28}  {row['accuracy']:>8.0%}  {row['mean_ms']:>9.3f}  {row['p95_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
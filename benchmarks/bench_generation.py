@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_listings import generate_listings
+from fake_llm import FakeChatModel
+
+# Throughput benchmark for generate_listings against a local fake chat model
+
+
+def run(num_listings, concurrency, latency, error_rate, requests_per_minute=None):
+    llm = FakeChatModel(latency=latency, error_rate=error_rate)
+    output_file = os.path.join(tempfile.mkdtemp(), "listings.json")
+    start = time.perf_counter()
+    listings = generate_listings(
+        num_listings=num_listings,
+        output_file=output_file,
+        concurrency=concurrency,
+        requests_per_minute=requests_per_minute,
+        llm=llm
+    )
+    elapsed = time.perf_counter() - start
+    return listings, elapsed, llm.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent listing generation")
+    parser.add_argument("--num-listings", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake completion latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    baseline = None
+    rows = []
+    for concurrency in args.concurrency:
+        listings, elapsed, calls = run(args.num_listings, concurrency, args.latency, args.error_rate)
+        if baseline is None:
+            baseline = listings
+        # Output must not depend on the concurrency level
+        assert listings == baseline, f"Output order differs at concurrency={concurrency}"
+        rows.append((concurrency, elapsed, args.num_listings / elapsed, calls))
+
+    print("\nconcurrency  seconds  listings/sec  llm_calls")
+    for concurrency, elapsed, throughput, calls in rows:
+        print(f"{concurrency:>11}  {elapsed:>7.2f}  {throughput:>12.1f}  {calls:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexical_index import BM25Index
+from numpy_index import NumpyVectorStore
+from vector_database import prepare_listing_records, query_similar_listings, setup_lexical_index
+from fake_llm import FakeEmbeddings, fake_listing
+
+# Build and query cost of the BM25 lexical index at several corpus sizes, next to NumPy vector
+# search and hybrid (fused) retrieval over the same listings. Embeddings are in-process fakes with
+# zero latency, so the vector numbers are a lower bound: a real query embedding adds a network call.
+
+BOROUGHS = ["Mitte", "Kreuzberg", "Neukölln", "Wedding", "Moabit"]
+AMENITIES = ["balcony", "gym", "Altbau charm", "elevator", "parquet floors", "fitted kitchen", "bike cellar", "rooftop terrace",
+             "floor heating", "concierge", "sauna", "dishwasher", "bathtub", "guest toilet", "underfloor storage", "home office"]
+TRANSPORT = ["U-Bahn", "S-Bahn", "tram", "bus", "Ringbahn", "bike lanes"]
+QUERIES = ["balcony close to the U-Bahn", "Altbau with parquet floors", "gym and sauna in the building", "quiet flat near the tram",
+           "rooftop terrace and elevator", "home office with a bathtub", "S-Bahn and bike lanes, fitted kitchen"]
+
+
+def make_corpus(num_listings):
+    # fake_listing plus a varied amenity sentence, so the vocabulary looks more like real listings
+    rng = random.Random(0)
+    return [
+        fake_listing(f"listing {i} in the {BOROUGHS[i % 5]} borough with {i % 4 + 1} bedrooms")
+        + f" Features: {', '.join(rng.sample(AMENITIES, 3))}. Near the {rng.choice(TRANSPORT)} at Straße {rng.randint(1, 5000)}."
+        for i in range(num_listings)
+    ]
+
+
+def time_queries(fn, num_queries):
+    latencies = []
+    for i in range(num_queries):
+        start = time.perf_counter()
+        fn(QUERIES[i % len(QUERIES)] + f" {i}", {"bedrooms": "2", "boroughs": "Mitte"} if i % 2 else None)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the BM25 lexical index and hybrid retrieval")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=256)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp()
+        corpus = make_corpus(size)
+        with redirect_stdout(io.StringIO()):
+            vectorstore = NumpyVectorStore.from_records(prepare_listing_records(corpus), FakeEmbeddings(dim=args.dim, latency=0.0, per_text_latency=0.0),
+                                                        os.path.join(workdir, "numpy_index"))
+            start = time.perf_counter()
+            lexical_index = setup_lexical_index(vectorstore, os.path.join(workdir, "lexical_index"))
+            build_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            BM25Index.load(os.path.join(workdir, "lexical_index"))
+            load_seconds = time.perf_counter() - start
+            index_bytes = os.path.getsize(os.path.join(workdir, "lexical_index", "lexical_index.npz"))
+
+            timings = {
+                mode: time_queries(lambda query, filters: query_similar_listings(vectorstore, query, args.n_results, filters, retrieval=mode,
+                                                                                 lexical_index=lexical_index), args.num_queries)
+                for mode in ["lexical", "vector", "hybrid"]
+            }
+        rows.append((size, build_seconds, load_seconds, index_bytes, len(lexical_index.terms), timings))
+
+    print(f"\n{'listings':>9}  {'build_s':>7}  {'load_s':>6}  {'MiB':>6}  {'terms':>7}  "
+          + "  ".join(f"{mode + ' p50/p95 ms':>22}" for mode in ["lexical", "vector", "hybrid"]))
+    for size, build_seconds, load_seconds, index_bytes, terms, timings in rows:
+        print(f"{size:>9}  {build_seconds:>7.2f}  {load_seconds:>6.2f}  {index_bytes / 2 ** 20:>6.1f}  {terms:>7}  "
+              + "  ".join(f"{timings[mode][0]:>13.2f} / {timings[mode][1]:>6.2f}" for mode in ["lexical", "vector", "hybrid"]))
+    print("\nHalf of the queries carry a bedrooms + borough filter. Lexical queries make no embedding call.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_database import extract_listing_metadata, extract_listing_metadata_batch
+
+# Micro-benchmark for listing metadata parsing on a synthetic corpus
+
+
+def legacy_extract_listing_metadata(listing_text):
+    # The previous line-by-line parser, kept here as the baseline
+    metadata = {}
+    lines = listing_text.strip().split('\n')
+    for i, line in enumerate(lines):
+        if ':' in line and i < 5:
+            key, value = line.split(':', 1)
+            key = key.strip().lower()
+            value = value.strip()
+            if key in ('bedrooms', 'bathrooms', 'size'):
+                match = re.search(r'(\d+)', value)
+                metadata[key] = int(match.group(1)) if match else value
+            elif key == 'price':
+                match = re.search(r'€([\d,]+)', value)
+                metadata[key] = int(match.group(1).replace(',', '')) if match else value
+            else:
+                metadata[key] = value
+    return metadata
+
+
+def make_corpus(num_listings):
+    rng = random.Random(0)
+    boroughs = ["Mitte", "Kreuzberg", "Prenzlauer Berg", "Charlottenburg", "Neukölln", "Friedrichshain", "Schöneberg", "Wedding", "Moabit", "Wilmersdorf"]
+    description = "Description: A bright apartment with high ceilings and a balcony. " * 8
+    return [
+        f"Borough: {rng.choice(boroughs)}  \nPrice: €{rng.randint(200, 2500) * 1000:,}  \nBedrooms: {rng.randint(1, 4)}  \n"
+        f"Bathrooms: {rng.randint(1, 3)}  \nSize: {rng.randint(40, 220)} m²  \n\n{description}\n\nNeighborhood Description: Close to the U-Bahn."
+        for _ in range(num_listings)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark listing metadata parsing")
+    parser.add_argument("--num-listings", type=int, default=1000000)
+    args = parser.parse_args()
+
+    print(f"Generating {args.num_listings} synthetic listings...")
+    corpus = make_corpus(args.num_listings)
+
+    rows = []
+    for name, parse in [
+        ("legacy per-listing", lambda texts: [legacy_extract_listing_metadata(text) for text in texts]),
+        ("compiled per-listing", lambda texts: [extract_listing_metadata(text) for text in texts]),
+        ("batch columns", extract_listing_metadata_batch)
+    ]:
+        start = time.perf_counter()
+        parse(corpus)
+        elapsed = time.perf_counter() - start
+        rows.append((name, elapsed))
+
+    print(f"\n{'parser':<22}  {'seconds':>8}  {'listings/sec':>12}")
+    for name, elapsed in rows:
+        print(f"{name:<22}  {elapsed:>8.2f}  {args.num_listings / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from numpy_index import NumpyVectorStore
+from vector_database import maximal_marginal_relevance
+from bench_quantization import ArrayEmbeddings
+
+# MMR diversity re-ranking: how varied the top-k gets per diversity weight (distinct boroughs and
+# buildings, similarity among the results, relevance kept), what the over-fetch plus re-ranking
+# adds to a query, and the vectorized selection against a per-pair Python loop.
+# Embeddings are synthetic: borough directions, buildings clustered around them, and listings
+# clustered tightly around their building, so the plain top-k is mostly one building.
+
+BOROUGHS = ["Mitte", "Friedrichshain-Kreuzberg", "Pankow", "Charlottenburg-Wilmersdorf", "Spandau", "Steglitz-Zehlendorf",
+            "Tempelhof-Schöneberg", "Neukölln", "Treptow-Köpenick", "Marzahn-Hellersdorf", "Lichtenberg", "Reinickendorf"]
+
+
+def unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def make_corpus(size, dim, buildings, seed=0):
+    # (embeddings, borough index and building index per listing)
+    rng = np.random.default_rng(seed)
+    borough_centers = unit(rng.normal(size=(len(BOROUGHS), dim)))
+    building_boroughs = rng.integers(len(BOROUGHS), size=buildings)
+    building_centers = unit(borough_centers[building_boroughs] + 1.5 * unit(rng.normal(size=(buildings, dim))))
+    listing_buildings = rng.integers(buildings, size=size)
+    embeddings = unit(building_centers[listing_buildings] + 0.5 * unit(rng.normal(size=(size, dim)))).astype(np.float32)
+    return embeddings, building_boroughs[listing_buildings], listing_buildings
+
+
+def mmr_python(query_embedding, embeddings, k, diversity):
+    # Reference selection with per-pair Python loops
+    embeddings = [list(map(float, row / np.linalg.norm(row))) for row in embeddings]
+    query = list(map(float, query_embedding / np.linalg.norm(query_embedding)))
+
+    def dot(a, b):
+        return sum(x * y for x, y in zip(a, b))
+
+    relevance = [dot(row, query) for row in embeddings]
+    picks = []
+    while len(picks) < min(k, len(embeddings)):
+        best, best_score = None, float("-inf")
+        for i, row in enumerate(embeddings):
+            if i in picks:
+                continue
+            redundancy = max((dot(row, embeddings[j]) for j in picks), default=0.0)
+            score = (1.0 - diversity) * relevance[i] - diversity * redundancy if picks else relevance[i]
+            if score > best_score:
+                best, best_score = i, score
+        picks.append(best)
+    return picks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MMR diversity re-ranking with over-fetch")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--buildings", type=int, default=20000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--overfetch", type=int, default=4)
+    parser.add_argument("--diversity", type=float, nargs="+", default=[0.0, 0.3, 0.5, 0.7])
+    parser.add_argument("--num-queries", type=int, default=200)
+    args = parser.parse_args()
+
+    embeddings, boroughs, buildings = make_corpus(args.size, args.dim, args.buildings)
+    # Queries are noisy copies of random listings
+    rng = np.random.default_rng(1)
+    queries = unit(embeddings[rng.integers(args.size, size=args.num_queries)] + 0.3 * unit(rng.normal(size=(args.num_queries, args.dim))))
+    workdir = tempfile.mkdtemp()
+    try:
+        records = {f"listing-{i}": (f"listing {i}", {"borough": BOROUGHS[b], "content_hash": str(i)}) for i, b in enumerate(boroughs.tolist())}
+        with redirect_stdout(io.StringIO()):
+            vectorstore = NumpyVectorStore.from_records(records, ArrayEmbeddings(embeddings), os.path.join(workdir, "numpy_index"), batch_size=20000)
+
+        print(f"\n{args.size} listings, {args.buildings} buildings in {len(BOROUGHS)} boroughs, dim {args.dim}; "
+              f"top {args.k} from {args.k * args.overfetch} candidates")
+        print(f"{'diversity':>9}  {'boroughs':>8}  {'buildings':>9}  {'pairwise sim':>12}  {'query sim':>9}  {'ms/query':>8}")
+        for diversity in args.diversity:
+            picked_rows = []
+            start = time.perf_counter()
+            for query in queries:
+                if diversity:
+                    results, candidate_embeddings = vectorstore.similarity_search_with_embeddings(query, k=args.k * args.overfetch)
+                    results = [results[i] for i in maximal_marginal_relevance(query, candidate_embeddings, args.k, diversity)]
+                else:
+                    results = vectorstore.similarity_search_by_vectors([query], k=args.k)[0]
+                picked_rows.append([int(doc.metadata["content_hash"]) for doc, _ in results])
+            milliseconds = (time.perf_counter() - start) / len(queries) * 1000
+            picked = np.array(picked_rows)
+            vectors = embeddings[picked]
+            pairwise = np.einsum("qid,qjd->qij", vectors, vectors)[:, ~np.eye(args.k, dtype=bool)].mean()
+            relevance = np.einsum("qid,qd->qi", vectors, queries).mean()
+            distinct_boroughs = np.mean([len(set(row)) for row in boroughs[picked].tolist()])
+            distinct_buildings = np.mean([len(set(row)) for row in buildings[picked].tolist()])
+            print(f"{diversity:>9.1f}  {distinct_boroughs:>8.2f}  {distinct_buildings:>9.2f}  {pairwise:>12.3f}  {relevance:>9.3f}  {milliseconds:>8.2f}")
+
+        print(f"\n{'candidates':>10}  {'k':>3}  {'vectorized us':>13}  {'python loops us':>15}")
+        for candidates, k in [(12, 3), (40, 10), (200, 20)]:
+            candidate_embeddings = embeddings[:candidates]
+            timings = []
+            for select in (maximal_marginal_relevance, mmr_python):
+                repeats = 200 if select is maximal_marginal_relevance else 5
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    picks = select(queries[0], candidate_embeddings, k, 0.5)
+                timings.append((time.perf_counter() - start) / repeats * 1e6)
+                if select is maximal_marginal_relevance:
+                    expected = picks
+            assert picks == expected, "selections differ"
+            print(f"{candidates:>10}  {k:>3}  {timings[0]:>13.0f}  {timings[1]:>15.0f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
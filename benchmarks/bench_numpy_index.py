@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Latency and memory of the NumPy exact-search backend versus Chroma at several corpus sizes.
+# Every build and every query phase runs in its own process so peak RSS is measured in isolation.
+
+
+def make_corpus(num_listings):
+    from fake_llm import fake_listing
+    boroughs = ["Mitte", "Kreuzberg", "Neukölln", "Wedding", "Moabit"]
+    return [fake_listing(f"listing {i} in the {boroughs[i % 5]} borough with {i % 4 + 1} bedrooms") for i in range(num_listings)]
+
+
+def build(backend, size, path, dim):
+    from vector_database import build_vector_database, prepare_listing_records
+    from numpy_index import NumpyVectorStore
+    from fake_llm import FakeEmbeddings
+
+    embeddings = FakeEmbeddings(dim=dim, latency=0.0, per_text_latency=0.0)
+    corpus = make_corpus(size)
+    start = time.perf_counter()
+    if backend == "numpy":
+        NumpyVectorStore.from_records(prepare_listing_records(corpus), embeddings, path)
+    else:
+        build_vector_database(corpus, path, embeddings)
+    return {"build_seconds": time.perf_counter() - start}
+
+
+def query(backend, size, path, dim, num_queries):
+    from langchain.vectorstores import Chroma
+    from vector_database import query_similar_listings
+    from numpy_index import NumpyVectorStore
+    from fake_llm import FakeEmbeddings
+
+    embeddings = FakeEmbeddings(dim=dim, latency=0.0, per_text_latency=0.0)
+    start = time.perf_counter()
+    if backend == "numpy":
+        vectorstore = NumpyVectorStore.load(path, embeddings)
+    else:
+        vectorstore = Chroma(persist_directory=path, embedding_function=embeddings)
+        vectorstore._collection.count()
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    for i in range(num_queries):
+        metadata_filters = {"bedrooms": "2"} if i % 2 else None
+        start = time.perf_counter()
+        query_similar_listings(vectorstore, f"bright apartment with balcony {i}", 5, metadata_filters)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "load_seconds": load_seconds,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def run_worker(args):
+    # Silence the pipeline's progress prints so stdout carries only the JSON result
+    sys.stdout = open(os.devnull, "w")
+    if args.worker == "build":
+        result = build(args.backend, args.size, args.path, args.dim)
+    else:
+        result = query(args.backend, args.size, args.path, args.dim, args.num_queries)
+    sys.stdout = sys.__stdout__
+    print(json.dumps(result))
+
+
+def spawn(phase, backend, size, path, args):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker", phase, "--backend", backend,
+        "--size", str(size), "--path", path, "--dim", str(args.dim), "--num-queries", str(args.num_queries)
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NumPy exact-search backend against Chroma")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 500000])
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension (OpenAI ada-002 uses 1536)")
+    parser.add_argument("--num-queries", type=int, default=50)
+    parser.add_argument("--chroma-max-size", type=int, default=100000, help="Skip Chroma above this corpus size")
+    parser.add_argument("--worker", choices=["build", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    rows = []
+    for size in args.sizes:
+        for backend in ["numpy", "chroma"]:
+            if backend == "chroma" and size > args.chroma_max_size:
+                continue
+            path = os.path.join(tempfile.mkdtemp(), backend)
+            result = spawn("build", backend, size, path, args)
+            result.update(spawn("query", backend, size, path, args))
+            rows.append((size, backend, result))
+            print(f"finished {backend} at {size} listings", file=sys.stderr)
+
+    print(f"\n{'listings':>8}  {'backend':<7}  {'build_s':>8}  {'load_s':>7}  {'p50_ms':>7}  {'p95_ms':>7}  {'peak_rss_mb':>11}")
+    for size, backend, r in rows:
+        print(f"{size:>8}  {backend:<7}  {r['build_seconds']:>8.1f}  {r['load_seconds']:>7.2f}  {r['p50_ms']:>7.1f}  {r['p95_ms']:>7.1f}  {r['peak_rss_mb']:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+from personalized_descriptions import generate_personalized_listings
+from fake_llm import FakeChatModel, fake_listing
+
+# Time-to-first-token and total time for sequential vs concurrent streaming personalization
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent streaming personalization")
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake time to first token in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Fake delay between tokens in seconds")
+    args = parser.parse_args()
+
+    matches = [
+        (Document(page_content=fake_listing(f"listing {i}"), metadata={"borough": "Mitte", "bedrooms": 2}), 0.1 * i)
+        for i in range(args.n_results)
+    ]
+    preferences = "A bright two-bedroom apartment close to the U-Bahn."
+
+    rows = []
+    for concurrency in [1, args.n_results]:
+        llm = FakeChatModel(latency=args.latency, token_latency=args.token_latency)
+        first_output = []
+        start = time.perf_counter()
+
+        def on_token(i, token):
+            if not first_output:
+                first_output.append(time.perf_counter() - start)
+
+        if concurrency == 1:
+            # Sequential baseline: nothing can be shown until the first full completion is back
+            generate_personalized_listings(matches[:1], preferences, llm=llm)
+            first_output.append(time.perf_counter() - start)
+            generate_personalized_listings(matches[1:], preferences, llm=llm)
+        else:
+            generate_personalized_listings(matches, preferences, concurrency=concurrency, on_token=on_token, llm=llm)
+        rows.append((concurrency, first_output[0], time.perf_counter() - start))
+
+    one_completion = args.latency + args.token_latency * len(matches[0][0].page_content.split())
+    print(f"\n{args.n_results} listings, one completion takes ~{one_completion:.2f}s")
+    print(f"{'concurrency':>11}  {'first_output_s':>14}  {'total_s':>8}")
+    for concurrency, first_output_s, total in rows:
+        print(f"{concurrency:>11}  {first_output_s:>14.2f}  {total:>8.2f}")
+
+if __name__ == "__main__":
+    main()
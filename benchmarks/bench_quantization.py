@@ -0,0 +1,97 @@
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from numpy_index import NumpyVectorStore
+from bench_ann_index import make_embeddings
+
+# Memory footprint, query latency and recall loss of the quantized first pass (int8 copy,
+# best rerank * k candidates re-scored from the float32 memory map) against the float32 scan of the
+# NumPy store. Embeddings are synthetic clustered unit vectors at the ada-002 dimension by default.
+
+BOROUGHS = ["Mitte", "Kreuzberg", "Neukölln", "Wedding", "Moabit"]
+
+
+class ArrayEmbeddings:
+    # Embedding function that looks texts "listing <i>" up in a precomputed matrix
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return self.vectors[[int(text.split()[1]) for text in texts]]
+
+
+def make_store(path, vectors):
+    records = {
+        f"listing-{i}": (f"listing {i}", {"bedrooms": i % 4 + 1, "price": 300000 + i % 1000 * 1000, "borough": BOROUGHS[i % 5], "content_hash": ""})
+        for i in range(len(vectors))
+    }
+    return NumpyVectorStore.from_records(records, ArrayEmbeddings(vectors), path, batch_size=20000)
+
+
+def run_queries(vectorstore, queries, k):
+    # Half the queries carry a bedrooms + borough filter (a fifth of them match), like bench_lexical_index
+    latencies = []
+    found = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        results = vectorstore.similarity_search_by_vectors([query], k=k, filter={"bedrooms": 2, "borough": "Mitte"} if i % 2 else None)[0]
+        latencies.append(time.perf_counter() - start)
+        found.append({document.page_content for document, _ in results})
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized embedding storage with full-precision re-ranking")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 300000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=50)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[2, 4, 8], help="Candidates re-ranked at full precision, as multiples of k")
+    parser.add_argument("--dtypes", nargs="+", default=["int8"])
+    parser.add_argument("--spread", type=float, default=1.0, help="Noise around each cluster center of the synthetic data")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp()
+        try:
+            vectors, queries = make_embeddings(os.path.join(workdir, "source.npy"), size, args.dim, size // 50, args.spread)
+            with redirect_stdout(io.StringIO()):
+                vectorstore = make_store(os.path.join(workdir, "numpy_index"), vectors)
+            del vectors
+            os.remove(os.path.join(workdir, "source.npy"))
+            queries = queries[:args.num_queries]
+            float32_bytes = vectorstore.embeddings.nbytes
+
+            run_queries(vectorstore, queries[:5], args.k)  # warm up the page cache
+            exact_p50, exact_p95, truth = run_queries(vectorstore, queries, args.k)
+            print(f"\n{size} vectors, dim {args.dim}: float32 embeddings {float32_bytes / 2 ** 20:.0f} MiB")
+            print(f"{'first pass':>10}  {'rerank':>6}  {'scanned MiB':>11}  {'build_s':>7}  {'recall@' + str(args.k):>9}  {'p50 ms':>7}  {'p95 ms':>7}")
+            print(f"{'float32':>10}  {'-':>6}  {float32_bytes / 2 ** 20:>11.0f}  {'-':>7}  {1.0:>9.3f}  {exact_p50:>7.2f}  {exact_p95:>7.2f}")
+            for dtype in args.dtypes:
+                start = time.perf_counter()
+                quantized = vectorstore.build_quantized(dtype)
+                build_seconds = time.perf_counter() - start
+                for rerank in args.rerank:
+                    quantized.rerank = rerank
+                    p50, p95, found = run_queries(vectorstore, queries, args.k)
+                    recall = np.mean([len(expected & result) / len(expected) for expected, result in zip(truth, found)])
+                    print(f"{dtype:>10}  {rerank:>6}  {quantized.nbytes() / 2 ** 20:>11.0f}  {build_seconds:>7.1f}  {recall:>9.3f}  {p50:>7.2f}  {p95:>7.2f}")
+            del vectorstore, quantized
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print("\nScanned MiB is the data each query reads in its first pass; re-ranking adds rerank * k float32 rows.")
+
+
+if __name__ == "__main__":
+    main()
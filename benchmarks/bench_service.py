@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai_server import free_port, openai_or_fake_embeddings, start_fake_openai_server
+
+# Load test for matching_service.py: the service runs in its own process against the local fake
+# OpenAI-compatible server (benchmarks/fake_openai_server.py, also its own process), and a closed-loop
+# client keeps `concurrency` requests in flight. Reports sustained QPS, tail latency and coalescing.
+
+PROFILE_TEMPLATES = [
+    "A quiet {bedrooms}-bedroom flat in {borough} with a balcony",
+    "{bedrooms} bedrooms, at least 1 bathroom, close to the U-Bahn",
+    "Something cozy near parks and cafés in {borough}, ideally with a garden"
+]
+BOROUGHS = ["Mitte", "Kreuzberg", "Neukölln", "Wedding"]
+
+
+def make_profiles(num_profiles):
+    rng = random.Random(0)
+    return [
+        rng.choice(PROFILE_TEMPLATES).format(bedrooms=rng.randint(1, 4), borough=rng.choice(BOROUGHS))
+        for _ in range(num_profiles)
+    ]
+
+
+def serve(port, num_listings, workers, dim):
+    # Service process: build the corpus index once, then serve until terminated
+    from aiohttp import web
+    from extraction_cache import ExtractionCache
+    from matching_service import MatchingService, configure_http_pool, create_app
+    from numpy_index import NumpyVectorStore
+    from vector_database import prepare_listing_records
+    from fake_llm import fake_listing
+
+    workdir = tempfile.mkdtemp()
+    configure_http_pool(workers * 4)
+    embedding_function = openai_or_fake_embeddings(dim)
+    corpus = [fake_listing(f"listing {i} in the {BOROUGHS[i % len(BOROUGHS)]} borough with {i % 4 + 1} bedrooms") for i in range(num_listings)]
+    vectorstore = NumpyVectorStore.from_records(prepare_listing_records(corpus), embedding_function, os.path.join(workdir, "numpy_index"))
+    service = MatchingService(vectorstore, max_workers=workers, extraction_cache=ExtractionCache(os.path.join(workdir, "extraction_cache.sqlite")))
+    sys.stdout = open(os.devnull, "w")
+    web.run_app(create_app(service), host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+async def wait_until_ready(session, url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return await response.json()
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+
+async def run_load(base_url, profiles, concurrency, duration, stream, seed):
+    import aiohttp
+
+    rng = random.Random(seed)
+    latencies = []
+    first_event = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client(session):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            payload = {"preferences": rng.choice(profiles)}
+            start = time.perf_counter()
+            try:
+                if stream:
+                    async with session.post(f"{base_url}/match/stream", json=payload) as response:
+                        response.raise_for_status()
+                        first = True
+                        async for line in response.content:
+                            if first:
+                                first_event.append(time.perf_counter() - start)
+                                first = False
+                            if json.loads(line).get("event") == "error":
+                                raise RuntimeError(line)
+                else:
+                    async with session.post(f"{base_url}/match", json=payload) as response:
+                        response.raise_for_status()
+                        await response.json()
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120)) as session:
+        before = await wait_until_ready(session, f"{base_url}/health")
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        after = await wait_until_ready(session, f"{base_url}/health")
+    return elapsed, latencies, first_event, errors, after["coalesced"] - before["coalesced"]
+
+
+def percentile_ms(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HomeMatch HTTP service")
+    parser.add_argument("--num-listings", type=int, default=1000)
+    parser.add_argument("--num-profiles", type=int, default=50, help="Distinct preference texts the clients pick from")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake chat time to first token in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--stream", action="store_true", help="Use /match/stream instead of /match")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.num_listings, args.workers, args.dim)
+        return
+
+    fake_server, base_url = start_fake_openai_server(latency=args.latency, token_latency=args.token_latency, dim=args.dim)
+    service_port = free_port()
+    env = dict(os.environ, OPENAI_API_KEY="sk-fake", OPENAI_API_BASE=base_url)
+    processes = [
+        fake_server,
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "--port", str(service_port), "--num-listings", str(args.num_listings),
+                          "--workers", str(args.workers), "--dim", str(args.dim)], env=env)
+    ]
+    profiles = make_profiles(args.num_profiles)
+    rows = []
+    try:
+        for concurrency in args.concurrency:
+            elapsed, latencies, first_event, errors, coalesced = asyncio.run(
+                run_load(f"http://127.0.0.1:{service_port}", profiles, concurrency, args.duration, args.stream, seed=concurrency)
+            )
+            rows.append((concurrency, len(latencies) / elapsed, percentile_ms(latencies, 0.5), percentile_ms(latencies, 0.95),
+                         percentile_ms(latencies, 0.99), percentile_ms(first_event, 0.5), errors, coalesced))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    print(f"\n{args.num_listings} listings, {args.num_profiles} distinct profiles, {args.duration:.0f}s per level, "
+          f"{'/match/stream' if args.stream else '/match'}")
+    print(f"{'concurrency':>11}  {'qps':>7}  {'p50_ms':>8}  {'p95_ms':>8}  {'p99_ms':>8}  {'first_ms':>8}  {'errors':>6}  {'coalesced':>9}")
+    for row in rows:
+        print(f"{row[0]:>11}  {row[1]:>7.1f}  {row[2]:>8.0f}  {row[3]:>8.0f}  {row[4]:>8.0f}  {row[5]:>8.0f}  {row[6]:>6}  {row[7]:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from numpy_index import NumpyVectorStore
+from sharded_index import ShardedVectorStore
+from bench_ann_index import make_embeddings
+from bench_quantization import ArrayEmbeddings
+
+# Borough sharding of the NumPy store: unrestricted queries fanned out over 1..N worker processes,
+# and borough-restricted queries that scan only their shards, against the unsharded store.
+# Embeddings are synthetic clustered unit vectors; the borough sizes are skewed like Berlin's.
+
+BOROUGHS = ["Mitte", "Friedrichshain-Kreuzberg", "Pankow", "Charlottenburg-Wilmersdorf", "Spandau", "Steglitz-Zehlendorf",
+            "Tempelhof-Schöneberg", "Neukölln", "Treptow-Köpenick", "Marzahn-Hellersdorf", "Lichtenberg", "Reinickendorf"]
+
+
+def make_store(store_class, path, vectors):
+    weights = np.linspace(2.0, 1.0, len(BOROUGHS))
+    boroughs = np.random.default_rng(0).choice(len(BOROUGHS), size=len(vectors), p=weights / weights.sum())
+    records = {
+        f"listing-{i}": (f"listing {i}", {"bedrooms": i % 4 + 1, "borough": BOROUGHS[borough], "content_hash": ""})
+        for i, borough in enumerate(boroughs.tolist())
+    }
+    with redirect_stdout(io.StringIO()):
+        return store_class.from_records(records, ArrayEmbeddings(vectors), path, batch_size=20000)
+
+
+def time_queries(vectorstore, queries, k, batch_size, filters):
+    # Per-call latency percentiles (ms) and queries per second, cycling through `filters`
+    latencies = []
+    start = time.perf_counter()
+    for i, batch_start in enumerate(range(0, len(queries), batch_size)):
+        call_start = time.perf_counter()
+        vectorstore.similarity_search_by_vectors(queries[batch_start:batch_start + batch_size], k=k, filter=filters[i % len(filters)])
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000, len(queries) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the borough-sharded index and its process-pool fan-out")
+    parser.add_argument("--size", type=int, default=500000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1, help="Queries per search call")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--max-shard-rows", type=int, default=50000)
+    parser.add_argument("--parallel-min-rows", type=int, default=100000, help="Smaller scans stay in process")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        vectors, queries = make_embeddings(os.path.join(workdir, "source.npy"), args.size, args.dim, args.size // 50, 1.0)
+        queries = queries[:args.num_queries]
+        unsharded = make_store(NumpyVectorStore, os.path.join(workdir, "numpy_index"), vectors)
+        sharded = make_store(ShardedVectorStore, os.path.join(workdir, "sharded_index"), vectors)
+        sharded.max_shard_rows = args.max_shard_rows
+        sharded.parallel_min_rows = args.parallel_min_rows
+        del vectors
+        print(f"\n{args.size} vectors, dim {args.dim}, {os.cpu_count()} CPUs; shards: "
+              + ", ".join(f"{name}={rows}" for name, rows in sharded.shard_sizes().items()))
+
+        unrestricted = [None]
+        restricted = [{"borough": name} for name in BOROUGHS] + [{"borough": {"$in": BOROUGHS[i:i + 2]}} for i in range(0, len(BOROUGHS), 2)]
+        print(f"\n{'store':<24}  {'queries':<12}  {'p50 ms':>7}  {'p95 ms':>7}  {'queries/s':>9}")
+        for label, filters in [("unrestricted", unrestricted), ("1-2 boroughs", restricted)]:
+            time_queries(unsharded, queries[:10], args.k, args.batch_size, filters)  # warm up the page cache
+            p50, p95, qps = time_queries(unsharded, queries, args.k, args.batch_size, filters)
+            print(f"{'unsharded':<24}  {label:<12}  {p50:>7.2f}  {p95:>7.2f}  {qps:>9.1f}")
+            for workers in args.workers:
+                sharded.start_workers(workers)
+                time_queries(sharded, queries[:10], args.k, args.batch_size, filters)  # warm up the pool
+                p50, p95, qps = time_queries(sharded, queries, args.k, args.batch_size, filters)
+                print(f"{f'sharded, {workers} worker(s)':<24}  {label:<12}  {p50:>7.2f}  {p95:>7.2f}  {qps:>9.1f}")
+            sharded.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("\n1 worker scans the shards in process, as do scans below --parallel-min-rows (most borough-restricted queries).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from numpy_index import NumpyVectorStore
+from standing_queries import ProfileIndex
+from vector_database import build_chroma_filter
+from bench_ann_index import make_embeddings
+from bench_quantization import ArrayEmbeddings
+
+# Alerting saved profiles about a batch of new listings: reverse matching (the new listings against
+# the profile index) versus re-running every profile against the whole corpus, as ops does today.
+# Embeddings are synthetic clustered unit vectors; profile filters are random bedroom minimums,
+# price caps and borough sets. The re-run is timed on a sample of profiles and extrapolated.
+
+BOROUGHS = ["Mitte", "Kreuzberg", "Neukölln", "Wedding", "Moabit", "Pankow", "Spandau", "Lichtenberg"]
+
+
+def random_metadata(rng, i):
+    return {"bedrooms": rng.randint(1, 5), "price": rng.randrange(200000, 1500000, 1000), "size": rng.randint(30, 200),
+            "borough": BOROUGHS[i % len(BOROUGHS)], "content_hash": ""}
+
+
+def random_filters(rng):
+    filters = {}
+    if rng.random() < 0.7:
+        filters["bedrooms"] = rng.randint(1, 4)
+    if rng.random() < 0.5:
+        filters["max_price"] = rng.randrange(400000, 1500000, 50000)
+    if rng.random() < 0.6:
+        filters["boroughs"] = rng.sample(BOROUGHS, rng.randint(1, 3))
+    return filters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reverse matching of saved profiles against new listings")
+    parser.add_argument("--corpus-size", type=int, default=100000)
+    parser.add_argument("--profiles", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--new-listings", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--min-similarity", type=float, default=0.5)
+    parser.add_argument("--rerun-sample", type=int, default=200, help="Profiles actually re-run against the corpus")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    workdir = tempfile.mkdtemp()
+    try:
+        # Listings and profiles come from the same clustered distribution, so similar pairs exist
+        total = args.corpus_size + args.new_listings + max(args.profiles)
+        vectors, _ = make_embeddings(os.path.join(workdir, "source.npy"), total, args.dim, total // 50, 1.0)
+        permutation = np.random.default_rng(1).permutation(total)
+        listing_vectors = np.asarray(vectors[np.sort(permutation[:args.corpus_size + args.new_listings])])
+        profile_vectors = np.asarray(vectors[np.sort(permutation[args.corpus_size + args.new_listings:])])
+        metadatas = [random_metadata(rng, i) for i in range(len(listing_vectors))]
+        new_vectors, new_metadatas = listing_vectors[args.corpus_size:], metadatas[args.corpus_size:]
+
+        records = {f"listing-{i}": (f"listing {i}", metadatas[i]) for i in range(args.corpus_size + args.new_listings)}
+        with redirect_stdout(io.StringIO()):
+            vectorstore = NumpyVectorStore.from_records(records, ArrayEmbeddings(listing_vectors), os.path.join(workdir, "numpy_index"),
+                                                        batch_size=20000)
+
+        print(f"\n{args.corpus_size} listings + {args.new_listings} new, dim {args.dim}, min similarity {args.min_similarity}")
+        print(f"{'profiles':>9}  {'build_s':>7}  {'reverse_s':>9}  {'alerts':>7}  {'rerun_s (est.)':>14}  {'speedup':>8}")
+        for num_profiles in args.profiles:
+            filters = [random_filters(rng) for _ in range(num_profiles)]
+            start = time.perf_counter()
+            profile_index = ProfileIndex.build([f"profile-{i}" for i in range(num_profiles)], profile_vectors[:num_profiles], filters)
+            build_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            matches = profile_index.match(new_vectors, new_metadatas, args.min_similarity)
+            reverse_seconds = time.perf_counter() - start
+
+            # Today's path: every profile searches the whole corpus with its filters
+            sample = range(min(args.rerun_sample, num_profiles))
+            start = time.perf_counter()
+            for i in sample:
+                vectorstore.similarity_search_by_vectors(profile_vectors[i:i + 1], k=10, filter=build_chroma_filter(filters[i], verbose=False))
+            rerun_seconds = (time.perf_counter() - start) / len(sample) * num_profiles
+
+            alerts = sum(len(profiles) for profiles in matches)
+            print(f"{num_profiles:>9}  {build_seconds:>7.2f}  {reverse_seconds:>9.2f}  {alerts:>7}  {rerun_seconds:>14.1f}  {rerun_seconds / reverse_seconds:>7.0f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("\nReverse matching cost grows with new listings x profiles; the re-run grows with corpus size x profiles.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Cold-start cost of the entry points: every module is imported in a fresh interpreter with
+# `python -X importtime`, which reports the cumulative import time of each module. Also shows which
+# heavy dependencies an import pulls in and, per top-level package, where the import time goes.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["HomeMatch", "check_chroma", "batch_matching", "matching_service", "vector_database", "metadata_extraction",
+                   "personalized_descriptions", "generate_listings"]
+HEAVY_PACKAGES = ["langchain", "chromadb", "openai", "pydantic", "aiohttp", "numpy"]
+
+# Runs in the child process after the import: report which heavy packages got loaded
+PROBE = "import sys, json; print(json.dumps([p for p in {packages!r} if p in sys.modules]))"
+
+
+def parse_importtime(stderr):
+    # `import time: self [us] | cumulative | imported package` lines -> [(name, self_us, cumulative_us)]
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def import_once(module):
+    # Returns (cumulative import time of `module` in seconds, process wall time, loaded heavy packages, per-package self time)
+    code = f"import {module}; " + PROBE.format(packages=HEAVY_PACKAGES)
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-fake"), OPENAI_API_BASE=os.environ.get("OPENAI_API_BASE", "http://127.0.0.1:9/v1"))
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    rows = parse_importtime(completed.stderr)
+    cumulative = next(cumulative_us for name, _, cumulative_us in reversed(rows) if name == module) / 1e6
+    by_package = {}
+    for name, self_us, _ in rows:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us / 1e6
+    return cumulative, wall, json.loads(completed.stdout.strip().splitlines()[-1]), by_package
+
+
+def bench_module(module, repeat):
+    import_once(module)  # warm up: byte-compile and fill the OS file cache
+    runs = [import_once(module) for _ in range(repeat)]
+    return {
+        "module": module,
+        "import_seconds": statistics.median(run[0] for run in runs),
+        "process_seconds": statistics.median(run[1] for run in runs),
+        "heavy_packages": runs[-1][2],
+        "by_package": runs[-1][3]
+    }
+
+
+def compare(results, baseline_file, tolerance):
+    # Print import time changes against a previous run; returns the modules that got slower beyond tolerance
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {row["module"]: row for row in json.load(f)["results"]}
+    regressions = []
+    print(f"\nComparison with {baseline_file}:")
+    for row in results:
+        before = baseline.get(row["module"])
+        if not before:
+            continue
+        change = row["import_seconds"] / before["import_seconds"] - 1
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"  {row['module']:<28}  {change:>+7.1%}{flag}")
+        if flag:
+            regressions.append(row)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import time of the HomeMatch entry points")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module (the median is reported)")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest packages listed per module")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Earlier results file to compare import times against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed import time increase before a regression is reported")
+    args = parser.parse_args()
+
+    results = [bench_module(module, args.repeat) for module in args.modules]
+
+    print(f"\n{'module':<28}  {'import_ms':>9}  {'process_ms':>10}  heavy dependencies loaded")
+    for row in results:
+        print(f"{row['module']:<28}  {row['import_seconds'] * 1000:>9.0f}  {row['process_seconds'] * 1000:>10.0f}  "
+              f"{', '.join(row['heavy_packages']) or '-'}")
+    print(f"\nHeaviest packages (self time, ms):")
+    for row in results:
+        top = sorted(row["by_package"].items(), key=lambda item: -item[1])[:args.top]
+        print(f"  {row['module']:<26}  " + ", ".join(f"{package}={seconds * 1000:.0f}" for package, seconds in top))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"python": sys.version.split()[0], "args": vars(args)}, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
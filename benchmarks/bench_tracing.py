@@ -0,0 +1,83 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instrumentation import enable_tracing, disable_tracing, metrics_snapshot, prometheus_metrics, span, write_trace
+from numpy_index import NumpyVectorStore
+from vector_database import prepare_listing_records, query_similar_listings
+from fake_llm import FakeEmbeddings, fake_listing
+
+# Cost of the instrumentation layer: per-span overhead with tracing off and on, and the effect on an
+# in-process search loop (NumPy backend, zero-latency fake embeddings) where overhead is most visible
+
+
+def per_call_ns(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def empty_block():
+    pass
+
+
+def span_block():
+    with span("bench"):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tracing overhead")
+    parser.add_argument("--iterations", type=int, default=1000000)
+    parser.add_argument("--num-listings", type=int, default=2000)
+    parser.add_argument("--num-queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    disable_tracing()
+    baseline_ns = per_call_ns(empty_block, args.iterations)
+    disabled_ns = per_call_ns(span_block, args.iterations)
+    enable_tracing()
+    enabled_ns = per_call_ns(span_block, args.iterations)
+    disable_tracing()
+
+    corpus = [fake_listing(f"listing {i} in the Mitte borough with {i % 4 + 1} bedrooms") for i in range(args.num_listings)]
+    vectorstore = NumpyVectorStore.from_records(prepare_listing_records(corpus), FakeEmbeddings(dim=256, latency=0.0, per_text_latency=0.0),
+                                                os.path.join(tempfile.mkdtemp(), "numpy_index"))
+    queries = [f"bright apartment near the U-Bahn {i}" for i in range(args.num_queries)]
+
+    def search_loop():
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            for i, query in enumerate(queries):
+                query_similar_listings(vectorstore, query, 3, {"bedrooms": "2"} if i % 2 else None)
+        return time.perf_counter() - start
+
+    search_loop()  # warm up
+    off_seconds = search_loop()
+    enable_tracing(keep_spans=True)
+    on_seconds = search_loop()
+    trace_file = os.path.join(tempfile.mkdtemp(), "trace.json")
+    write_trace(trace_file)
+    stages = metrics_snapshot()
+    metrics_lines = len(prometheus_metrics().splitlines())
+    disable_tracing()
+
+    print(f"\n{'span cost':<28}  {'ns/call':>8}")
+    print(f"{'empty function':<28}  {baseline_ns:>8.0f}")
+    print(f"{'span, tracing disabled':<28}  {disabled_ns:>8.0f}")
+    print(f"{'span, tracing enabled':<28}  {enabled_ns:>8.0f}")
+    print(f"\n{args.num_queries} searches: {off_seconds:.3f}s untraced, {on_seconds:.3f}s traced ({on_seconds / off_seconds - 1:+.1%})")
+    counts = ", ".join(f"{name}={stage['count']}" for name, stage in stages.items())
+    print(f"Traced stages: {counts}; "
+          f"{metrics_lines} Prometheus lines; trace file {os.path.getsize(trace_file) // 1024} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import hashlib
+import random
+import re
+import threading
+import time
+
+import numpy as np
+
+# Local stand-ins for ChatOpenAI and OpenAIEmbeddings so the pipeline can be benchmarked without network calls
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+def _seed(text):
+    # Stable integer seed derived from the prompt text
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def fake_listing(prompt_text):
+    # Build a deterministic listing in the same header format the real prompt asks for
+    rng = random.Random(_seed(prompt_text))
+    borough_match = re.search(r"in the (.+?) borough", prompt_text)
+    bedrooms_match = re.search(r"with (\d+) bedrooms", prompt_text)
+    borough = borough_match.group(1) if borough_match else "Mitte"
+    bedrooms = int(bedrooms_match.group(1)) if bedrooms_match else rng.randint(1, 4)
+    bathrooms = max(1, bedrooms - rng.randint(0, 2))
+    size = 35 + bedrooms * 25 + rng.randint(0, 30)
+    price = size * rng.randint(4000, 9000) // 1000 * 1000
+    return (
+        f"Borough: {borough}  \n"
+        f"Price: €{price:,}  \n"
+        f"Bedrooms: {bedrooms}  \n"
+        f"Bathrooms: {bathrooms}  \n"
+        f"Size: {size} m²  \n\n"
+        f"Description: A {bedrooms}-bedroom apartment in {borough} with {rng.choice(['a balcony', 'a garden', 'high ceilings', 'a roof terrace'])}.\n\n"
+        f"Neighborhood Description: {borough} offers {rng.choice(['cafés', 'parks', 'nightlife', 'U-Bahn connections'])}."
+    )
+
+
+class FakeChatModel:
+    # Mimics the parts of ChatOpenAI the pipeline uses, with injectable latency and failures
+    def __init__(self, latency=0.05, error_rate=0.0, response_fn=fake_listing, seed=0, token_latency=0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.response_fn = response_fn
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _prompt_text(self, prompt):
+        # Accept plain strings as well as lists of chat messages
+        if isinstance(prompt, str):
+            return prompt
+        return "\n".join(getattr(message, "content", str(message)) for message in prompt)
+
+    def invoke(self, prompt):
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail:
+            raise RuntimeError("Injected fake LLM failure")
+        text = self.response_fn(self._prompt_text(prompt))
+        time.sleep(self.token_latency * len(text.split()))
+        return FakeMessage(text)
+
+    def stream(self, prompt):
+        # First token after `latency`, then one word-sized chunk every `token_latency` seconds
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail:
+            raise RuntimeError("Injected fake LLM failure")
+        for i, word in enumerate(self.response_fn(self._prompt_text(prompt)).split(" ")):
+            if i:
+                time.sleep(self.token_latency)
+            yield FakeMessage(word if i == 0 else " " + word)
+
+
+def fake_embedding(text, dim=1536):
+    # Deterministic unit vector seeded by a hash of the text
+    rng = np.random.default_rng(_seed(text))
+    vector = rng.standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeEmbeddings:
+    # Mimics OpenAIEmbeddings: one simulated network round trip per call plus a per-text cost
+    def __init__(self, dim=1536, latency=0.05, per_text_latency=0.0005, model="fake-embedding"):
+        self.dim = dim
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.model = model
+        self.calls = 0
+        self.texts_embedded = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls += 1
+            self.texts_embedded += len(texts)
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [fake_embedding(text, self.dim).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
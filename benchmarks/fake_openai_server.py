@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm import FakeEmbeddings, fake_embedding, fake_listing
+
+# Local OpenAI-compatible stand-in (chat completions, streaming, embeddings) so the real
+# ChatOpenAI / OpenAIEmbeddings clients can be pointed at it through OPENAI_API_BASE.
+
+EXTRACTION_KEYS = ["bedrooms", "bathrooms", "min_price", "max_price", "min_size", "max_size", "boroughs"]
+
+
+def fake_completion(prompt_text):
+    # Templated answers: schema JSON for the extraction prompt, a listing-shaped text otherwise
+    if '"min_price"' in prompt_text:
+        return "```json\n" + json.dumps({key: "" for key in EXTRACTION_KEYS}) + "\n```"
+    return fake_listing(prompt_text)
+
+
+def _embedding_input(item):
+    # OpenAIEmbeddings sends token id lists when it checks the context length
+    return item if isinstance(item, str) else json.dumps(item)
+
+
+def _error_response(rng, error_rate):
+    # Injected failure shaped like the real API's: mostly rate limits, sometimes server errors
+    if not error_rate or rng.random() >= error_rate:
+        return None
+    if rng.random() < 0.7:
+        return web.json_response({"error": {"message": "Rate limit reached (injected)", "type": "requests", "code": "rate_limit_exceeded"}},
+                                 status=429, headers={"Retry-After": "0"})
+    return web.json_response({"error": {"message": "The server had an error (injected)", "type": "server_error", "code": None}}, status=500)
+
+
+def create_fake_openai_app(latency=0.05, token_latency=0.0, embedding_latency=0.01, dim=1536, error_rate=0.0, seed=0):
+    stats = {"chat_requests": 0, "embedding_requests": 0, "embedded_texts": 0, "injected_errors": 0}
+    rng = random.Random(seed)
+
+    async def chat_completions(request):
+        body = await request.json()
+        stats["chat_requests"] += 1
+        error = _error_response(rng, error_rate)
+        if error is not None:
+            stats["injected_errors"] += 1
+            return error
+        prompt_text = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        text = fake_completion(prompt_text)
+        model = body.get("model", "gpt-4o")
+        created = int(time.time())
+        await asyncio.sleep(latency)
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_latency * len(text.split()))
+            return web.json_response({
+                "id": f"chatcmpl-{stats['chat_requests']}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt_text.split()), "completion_tokens": len(text.split()),
+                          "total_tokens": len(prompt_text.split()) + len(text.split())}
+            })
+
+        # Server-sent events, one word-sized delta every token_latency seconds
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i, word in enumerate(text.split(" ")):
+            if i:
+                await asyncio.sleep(token_latency)
+            chunk = {
+                "id": f"chatcmpl-{stats['chat_requests']}",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}]
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def embeddings(request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        stats["embedding_requests"] += 1
+        error = _error_response(rng, error_rate)
+        if error is not None:
+            stats["injected_errors"] += 1
+            return error
+        stats["embedded_texts"] += len(inputs)
+        await asyncio.sleep(embedding_latency)
+        return web.json_response({
+            "object": "list",
+            "model": body.get("model", "text-embedding-ada-002"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(_embedding_input(item), dim).tolist()}
+                for i, item in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0}
+        })
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/embeddings", embeddings)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_openai_server(port=None, latency=0.05, token_latency=0.0, embedding_latency=0.01, dim=1536, error_rate=0.0, timeout=30):
+    # Launch the server in its own process and wait until it answers; returns (process, base_url).
+    # Point the OpenAI clients at it with OPENAI_API_BASE=base_url (and any OPENAI_API_KEY).
+    port = port or free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--port", str(port), "--latency", str(latency), "--token-latency", str(token_latency),
+         "--embedding-latency", str(embedding_latency), "--dim", str(dim), "--error-rate", str(error_rate)],
+        stdout=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}/v1"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=1):
+                return process, base_url
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("Fake OpenAI server did not start")
+            time.sleep(0.1)
+
+
+def openai_or_fake_embeddings(dim=1536, latency=0.01):
+    # The real OpenAIEmbeddings client, pointed at the fake server. langchain tokenizes every input
+    # with tiktoken, which needs its encoding files; without them (offline), embed in-process instead.
+    from vector_database import create_embedding_function
+    embedding_function = create_embedding_function(embedding_cache_dir=None)
+    try:
+        embedding_function.embed_query("warm up")
+        return embedding_function
+    except Exception as e:
+        print(f"OpenAIEmbeddings unavailable ({type(e).__name__}), using in-process fake embeddings", file=sys.stderr)
+        return FakeEmbeddings(dim=dim, latency=latency, per_text_latency=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Chat time to first token in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Delay between streamed tokens in seconds")
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 429 or 500")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_fake_openai_app(args.latency, args.token_latency, args.embedding_latency, args.dim, args.error_rate, args.seed)
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}/v1", flush=True)
+    web.run_app(app, host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai_server import openai_or_fake_embeddings, start_fake_openai_server
+from fake_llm import fake_listing
+
+# End-to-end benchmark suite: generation, indexing, extraction, search and personalization at several
+# corpus sizes and concurrency levels, with the real langchain clients talking to the local fake
+# OpenAI-compatible server. Results are written as JSON; --baseline compares against an earlier run.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extraction_cases.jsonl")
+BOROUGHS = ["Mitte", "Kreuzberg", "Neukölln", "Wedding", "Moabit"]
+
+
+def make_corpus(num_listings):
+    return [fake_listing(f"listing {i} in the {BOROUGHS[i % 5]} borough with {i % 4 + 1} bedrooms") for i in range(num_listings)]
+
+
+def percentile_ms(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+def measure(fn, items, concurrency):
+    # Call fn on every item from `concurrency` threads; returns (wall seconds, latencies, errors)
+    latencies = []
+    errors = 0
+
+    def timed(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(timed, item) for item in items]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    return time.perf_counter() - start, latencies, errors
+
+
+def result(stage, corpus_size, concurrency, ops, seconds, latencies=(), errors=0, **extra):
+    return dict({
+        "stage": stage,
+        "corpus_size": corpus_size,
+        "concurrency": concurrency,
+        "ops": ops,
+        "seconds": seconds,
+        "ops_per_second": ops / seconds if seconds else None,
+        "p50_ms": percentile_ms(latencies, 0.5),
+        "p95_ms": percentile_ms(latencies, 0.95),
+        "p99_ms": percentile_ms(latencies, 0.99),
+        "errors": errors
+    }, **extra)
+
+
+def bench_generation(workdir, num_listings, concurrency):
+    from generate_listings import generate_listings_jsonl
+    output_file = os.path.join(workdir, f"generated_{concurrency}.jsonl")
+    start = time.perf_counter()
+    generated = generate_listings_jsonl(num_listings=num_listings, output_file=output_file, concurrency=concurrency, resume=False)
+    return result("generation", num_listings, concurrency, generated, time.perf_counter() - start)
+
+
+def bench_indexing(workdir, corpus, embedding_function, backend):
+    from numpy_index import NumpyVectorStore
+    from vector_database import build_vector_database, prepare_listing_records
+    path = os.path.join(workdir, f"{backend}_{len(corpus)}")
+    start = time.perf_counter()
+    if backend == "numpy":
+        vectorstore = NumpyVectorStore.from_records(prepare_listing_records(corpus), embedding_function, path)
+    else:
+        vectorstore = build_vector_database(corpus, path, embedding_function)
+    return vectorstore, result("indexing", len(corpus), 1, len(corpus), time.perf_counter() - start, backend=backend)
+
+
+def bench_extraction(cases, concurrency):
+    from metadata_extraction import extract_search_parameters_fast, extract_search_parameters_llm
+    texts = [case["text"] for case in cases]
+    rows = []
+    seconds, latencies, errors = measure(lambda text: extract_search_parameters_llm(text, cache=False), texts, concurrency)
+    rows.append(result("extraction", None, concurrency, len(latencies), seconds, latencies, errors, path="llm"))
+    if concurrency == 1:
+        seconds, latencies, errors = measure(extract_search_parameters_fast, texts * 100, 1)
+        rows.append(result("extraction", None, 1, len(latencies), seconds, latencies, errors, path="fast"))
+    return rows
+
+
+def bench_search(vectorstore, backend, corpus_size, num_queries, concurrency):
+    from vector_database import query_similar_listings
+    filters = [None, {"bedrooms": "2"}, {"bedrooms": "3", "boroughs": "Mitte, Kreuzberg"}, {"max_price": "600000"}]
+    queries = [(f"bright apartment with a balcony near the U-Bahn {i}", filters[i % len(filters)]) for i in range(num_queries)]
+    seconds, latencies, errors = measure(lambda query: query_similar_listings(vectorstore, query[0], 3, query[1]), queries, concurrency)
+    return result("search", corpus_size, concurrency, len(latencies), seconds, latencies, errors, backend=backend)
+
+
+def bench_personalization(vectorstore, num_profiles, concurrency, n_results=3):
+    from personalized_descriptions import generate_personalized_listings
+    from vector_database import query_similar_listings
+    profiles = [f"Profile {i}: a quiet flat with a garden, close to cafés" for i in range(num_profiles)]
+    matches = query_similar_listings(vectorstore, profiles[0], n_results)
+    seconds, latencies, errors = measure(
+        lambda preferences: generate_personalized_listings(matches, preferences, concurrency=len(matches)), profiles, concurrency
+    )
+    return result("personalization", None, concurrency, len(latencies), seconds, latencies, errors, n_results=n_results)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(row):
+    return (row["stage"], row.get("backend"), row.get("path"), row["corpus_size"], row["concurrency"])
+
+
+def compare(results, baseline_file, tolerance):
+    # Print throughput changes against a previous run; returns the rows that regressed beyond tolerance
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {result_key(row): row for row in json.load(f)["results"]}
+    regressions = []
+    print(f"\nComparison with {baseline_file}:")
+    for row in results:
+        before = baseline.get(result_key(row))
+        if not before or not before["ops_per_second"] or not row["ops_per_second"]:
+            continue
+        change = row["ops_per_second"] / before["ops_per_second"] - 1
+        flag = "  REGRESSION" if change < -tolerance else ""
+        print(f"  {' / '.join(str(part) for part in result_key(row) if part is not None):<40}  {change:>+7.1%}{flag}")
+        if flag:
+            regressions.append(row)
+    return regressions
+
+
+def print_results(results):
+    stage_order = ["generation", "indexing", "extraction", "search", "personalization"]
+    results = sorted(results, key=lambda row: stage_order.index(row["stage"]))
+    print(f"\n{'stage':<16}  {'variant':<7}  {'corpus':>7}  {'conc':>4}  {'ops/sec':>9}  {'p50_ms':>8}  {'p95_ms':>8}  {'p99_ms':>8}  {'errors':>6}")
+    for row in results:
+        variant = row.get("backend") or row.get("path") or ""
+        cells = [f"{row[key]:>8.1f}" if row[key] is not None else f"{'-':>8}" for key in ("p50_ms", "p95_ms", "p99_ms")]
+        print(f"{row['stage']:<16}  {variant:<7}  {row['corpus_size'] or '-':>7}  {row['concurrency']:>4}  {row['ops_per_second']:>9.1f}  "
+              f"{'  '.join(cells)}  {row['errors']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end HomeMatch benchmark suite against a local fake OpenAI server")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Corpus sizes for indexing and search")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--backends", nargs="+", default=["numpy", "chroma"], choices=["numpy", "chroma"])
+    parser.add_argument("--stages", nargs="+", default=["generation", "indexing", "extraction", "search", "personalization"])
+    parser.add_argument("--num-generate", type=int, default=50, help="Listings generated per concurrency level")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--num-profiles", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake chat time to first token in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed throughput drop before a regression is reported")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_openai_server(latency=args.latency, token_latency=args.token_latency, embedding_latency=args.embedding_latency,
+                                                dim=args.dim, error_rate=args.error_rate)
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    os.environ["OPENAI_API_BASE"] = base_url
+    workdir = tempfile.mkdtemp()
+    results = []
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            embedding_function = openai_or_fake_embeddings(args.dim, latency=args.embedding_latency)
+            with open(CASES_FILE, "r", encoding="utf-8") as f:
+                cases = [json.loads(line) for line in f if line.strip()]
+            for concurrency in args.concurrency:
+                if "generation" in args.stages:
+                    results.append(bench_generation(workdir, args.num_generate, concurrency))
+                if "extraction" in args.stages:
+                    results.extend(bench_extraction(cases, concurrency))
+            for size in args.sizes:
+                corpus = make_corpus(size)
+                for backend in args.backends:
+                    if not {"indexing", "search", "personalization"} & set(args.stages):
+                        continue
+                    vectorstore, row = bench_indexing(workdir, corpus, embedding_function, backend)
+                    if "indexing" in args.stages:
+                        results.append(row)
+                    for concurrency in args.concurrency:
+                        if "search" in args.stages:
+                            results.append(bench_search(vectorstore, backend, size, args.num_queries, concurrency))
+                        if "personalization" in args.stages and size == args.sizes[0] and backend == args.backends[0]:
+                            results.append(bench_personalization(vectorstore, args.num_profiles, concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print_results(results)
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "embeddings": type(embedding_function).__name__,
+            "args": vars(args)
+        },
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
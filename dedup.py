@@ -0,0 +1,211 @@
+import hashlib
+
+import numpy as np
+
+from lexical_index import TOKEN_PATTERN
+
+# Odd 64-bit multipliers for mixing hashes (products wrap around modulo 2**64)
+MIX = np.uint64(0x9E3779B97F4A7C15)
+MIX2 = np.uint64(0xC2B2AE3D27D4EB4F)
+
+
+def _listing_text(listing):
+    # Listings are plain strings or dicts with a listing_text field, as in prepare_listing_records
+    return listing.get("listing_text", "") if isinstance(listing, dict) else listing
+
+
+def _token_hash(token):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class _Vocabulary(dict):
+    # Token -> id; lookups of new tokens assign the next id and remember the token, so hashes are
+    # only computed for tokens not seen before
+    def __init__(self):
+        super().__init__()
+        self.new_tokens = []
+
+    def __missing__(self, token):
+        self[token] = token_id = len(self)
+        self.new_tokens.append(token)
+        return token_id
+
+
+class NearDuplicateDetector:
+    # Streaming MinHash/LSH near-duplicate detector. Each text becomes a set of word shingles; a
+    # MinHash signature of num_perm values estimates the Jaccard similarity of two such sets. The
+    # signature is cut into `bands` bands, and texts sharing any band are candidate duplicates,
+    # confirmed when their signatures agree in at least `threshold` of the positions.
+    # Texts are added in batches: hashing, shingling and MinHash are vectorized over the batch, and
+    # band keys live in sorted NumPy arrays (merged like an LSM tree) rather than a dict, so a
+    # million listings take a few hundred MB.
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=3, seed=0):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self.perm_a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.perm_b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self.vocabulary = _Vocabulary()
+        self.token_hashes = np.zeros(0, dtype=np.uint64)
+        # Kept texts: 16-bit signatures for confirming candidates, indexed by kept position
+        self.signatures = np.zeros((1024, num_perm), dtype=np.uint16)
+        self.kept_ids = []
+        # Band key -> kept position, as sorted (keys, positions) runs of decreasing size
+        self.runs = []
+        self.seen = 0
+        self.duplicates = {}
+
+    def _shingle_hashes(self, texts):
+        # Hash of every word shingle of every text, and the number of shingles per text
+        token_ids = []
+        lengths = []
+        for text in texts:
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            token_ids.extend(map(self.vocabulary.__getitem__, tokens))
+            lengths.append(len(tokens))
+        new_tokens = self.vocabulary.new_tokens
+        if new_tokens:
+            self.token_hashes = np.concatenate([self.token_hashes, np.fromiter(map(_token_hash, new_tokens), dtype=np.uint64, count=len(new_tokens))])
+            new_tokens.clear()
+        hashes = self.token_hashes[np.asarray(token_ids, dtype=np.int64)]
+        lengths = np.asarray(lengths, dtype=np.int64)
+        starts = np.cumsum(lengths) - lengths
+        # Shingles of texts shorter than shingle_size are the whole text
+        size = self.shingle_size
+        counts = np.maximum(lengths - size + 1, np.minimum(lengths, 1))
+        first = np.repeat(starts, counts) + np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        span = np.minimum(np.repeat(lengths, counts), size)
+        shingles = np.zeros(len(first), dtype=np.uint64)
+        for offset in range(size):
+            valid = offset < span
+            shingles[valid] = shingles[valid] * MIX + hashes[first[valid] + offset]
+        return shingles, counts
+
+    def signatures_of(self, texts):
+        # (len(texts), num_perm) uint32 MinHash signatures; texts without tokens get all-max signatures
+        shingles, counts = self._shingle_hashes(texts)
+        result = np.full((len(texts), self.num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+        nonempty = np.flatnonzero(counts)
+        if len(nonempty):
+            offsets = (np.cumsum(counts) - counts)[nonempty]
+            # Universal hashing a * x + b (mod 2**64), keeping the high 32 bits; 16 permutations at a
+            # time to bound the temporaries
+            for start in range(0, self.num_perm, 16):
+                a, b = self.perm_a[start:start + 16, None], self.perm_b[start:start + 16, None]
+                permuted = ((shingles[None, :] * a + b) >> np.uint64(32)).astype(np.uint32)
+                result[nonempty, start:start + 16] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        return result
+
+    def _band_keys(self, signatures):
+        # (len(signatures), bands) uint64 keys, salted with the band number
+        rows = self.num_perm // self.bands
+        keys = np.zeros((len(signatures), self.bands), dtype=np.uint64)
+        for row in range(rows):
+            keys = keys * MIX + signatures[:, row::rows][:, :self.bands].astype(np.uint64)
+        return keys ^ (np.arange(self.bands, dtype=np.uint64) * MIX2)
+
+    def _lookup(self, keys):
+        # Kept position stored under each key (-1 when absent); a key is in at most one run
+        found = np.full(keys.size, -1, dtype=np.int64)
+        flat = keys.ravel()
+        for run_keys, run_positions in self.runs:
+            at = np.minimum(np.searchsorted(run_keys, flat), len(run_keys) - 1)
+            hit = run_keys[at] == flat
+            found[hit] = run_positions[at[hit]]
+        return found.reshape(keys.shape)
+
+    def _insert(self, keys, positions):
+        if not len(keys):
+            return
+        # Add keys (absent from every run) as a new sorted run, keeping the first position of keys
+        # repeated within the batch. Runs at most twice the size of the new one are merged into it,
+        # so there are O(log n) runs and each key is re-sorted O(log n) times overall.
+        order = np.argsort(keys, kind="stable")
+        keys, positions = keys[order], positions[order].astype(np.int32)
+        first = np.concatenate(([True], keys[1:] != keys[:-1]))
+        keys, positions = keys[first], positions[first]
+        while self.runs and len(self.runs[-1][0]) <= 2 * len(keys):
+            run_keys, run_positions = self.runs.pop()
+            keys, positions = np.concatenate([run_keys, keys]), np.concatenate([run_positions, positions])
+            order = np.argsort(keys, kind="stable")
+            keys, positions = keys[order], positions[order]
+        self.runs.append((keys, positions))
+
+    def add_batch(self, texts, ids=None):
+        # Add texts in order; returns, per text, the id of the earlier text it duplicates (None for
+        # new texts). Ids default to the running count of texts seen.
+        ids = list(range(self.seen, self.seen + len(texts))) if ids is None else list(ids)
+        self.seen += len(texts)
+        signatures = self.signatures_of(texts)
+        short = signatures.astype(np.uint16)
+        keys = self._band_keys(signatures)
+        stored = self._lookup(keys)
+        # Earliest row of the batch with each key, for candidates within the batch
+        flat = keys.ravel()
+        order = np.argsort(flat, kind="stable")
+        group_starts = np.concatenate(([True], flat[order][1:] != flat[order][:-1]))
+        earliest = np.empty(len(flat), dtype=np.int64)
+        earliest[order] = order[np.maximum.accumulate(np.where(group_starts, np.arange(len(flat)), 0))] // self.bands
+        earliest = earliest.reshape(keys.shape)
+        rows = np.arange(len(texts))[:, None]
+        has_candidates = ((stored >= 0) | (earliest < rows)).any(axis=1).tolist()
+        # Kept position each row of the batch resolves to (its own, or that of its original)
+        row_positions = np.zeros(len(texts), dtype=np.int64)
+        kept_rows = []
+        results = []
+        for i, text_id in enumerate(ids):
+            duplicate_of = None
+            if has_candidates[i]:
+                candidates = set(stored[i][stored[i] >= 0].tolist())
+                candidates.update(row_positions[earliest[i][earliest[i] < i]].tolist())
+                for position in sorted(candidates):
+                    if np.count_nonzero(self.signatures[position] == short[i]) >= self.threshold * self.num_perm:
+                        duplicate_of = position
+                        break
+            if duplicate_of is not None:
+                row_positions[i] = duplicate_of
+                results.append(self.kept_ids[duplicate_of])
+                self.duplicates[text_id] = self.kept_ids[duplicate_of]
+                continue
+            results.append(None)
+            position = row_positions[i] = len(self.kept_ids)
+            if position == len(self.signatures):
+                self.signatures = np.concatenate([self.signatures, np.zeros_like(self.signatures)])
+            self.signatures[position] = short[i]
+            self.kept_ids.append(text_id)
+            kept_rows.append(i)
+        # Keys of kept texts not stored yet; a key repeated within the batch keeps its first position
+        fresh = stored[kept_rows] < 0
+        self._insert(keys[kept_rows][fresh], np.broadcast_to(row_positions[kept_rows, None], fresh.shape)[fresh])
+        return results
+
+    def dedup_ratio(self):
+        return len(self.duplicates) / self.seen if self.seen else 0.0
+
+    def report(self):
+        return f"{self.seen} listings, {len(self.duplicates)} near-duplicates ({self.dedup_ratio():.1%}), {len(self.kept_ids)} kept"
+
+
+def deduplicate(listings, detector=None, batch_size=1000):
+    # Lazily yield the listings (strings or listing dicts) of an iterable that are not near-duplicates
+    # of an earlier one. The detector (a new one by default) keeps the counts and the duplicate ->
+    # original mapping, by position in the iterable.
+    detector = detector or NearDuplicateDetector()
+    batch = []
+    for listing in listings:
+        batch.append(listing)
+        if len(batch) >= batch_size:
+            yield from _kept(batch, detector)
+            batch = []
+    if batch:
+        yield from _kept(batch, detector)
+
+
+def _kept(batch, detector):
+    duplicates_of = detector.add_batch([_listing_text(listing) for listing in batch])
+    return [listing for listing, duplicate_of in zip(batch, duplicates_of) if duplicate_of is None]
@@ -0,0 +1,132 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+
+def normalize_preferences(user_preferences):
+    # Case and whitespace differences should not change the cache key
+    return normalize_text(user_preferences).lower()
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DescriptionCache:
+    # Persistent (SQLite) cache of personalized descriptions keyed by listing id, model parameters
+    # and the normalized preference text. With a similarity_threshold, a near-duplicate preference
+    # profile (cosine similarity of the preference embeddings >= threshold) for the same listing and
+    # model can reuse a cached description. Entries expire after ttl_seconds and the least recently
+    # used ones are evicted once more than max_entries are stored.
+    def __init__(self, path="./description_cache.sqlite", max_entries=10000, ttl_seconds=7 * 24 * 3600, similarity_threshold=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions ("
+            " key TEXT PRIMARY KEY,"
+            " listing_id TEXT NOT NULL,"
+            " model_key TEXT NOT NULL,"
+            " preference_embedding BLOB,"
+            " description TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS descriptions_listing ON descriptions (listing_id, model_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS descriptions_lru ON descriptions (last_access)")
+        self._conn.commit()
+
+    def _key(self, listing_id, model_key, user_preferences):
+        return hash_text(f"{listing_id}\0{model_key}\0{normalize_preferences(user_preferences)}")
+
+    def get(self, listing_id, model_key, user_preferences, preference_embedding=None):
+        # Return a cached description, or None on a miss
+        key = self._key(listing_id, model_key, user_preferences)
+        now = time.time()
+        oldest_valid = now - self.ttl_seconds if self.ttl_seconds else float("-inf")
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, description FROM descriptions WHERE key = ? AND created_at >= ?", (key, oldest_valid)
+            ).fetchone()
+            if row is None and self.similarity_threshold is not None and preference_embedding is not None:
+                row = self._nearest(listing_id, model_key, preference_embedding, oldest_valid)
+                if row is not None:
+                    self.semantic_hits += 1
+            elif row is not None:
+                self.exact_hits += 1
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE descriptions SET last_access = ? WHERE key = ?", (now, row[0]))
+            self._conn.commit()
+            return row[1]
+
+    def _nearest(self, listing_id, model_key, preference_embedding, oldest_valid):
+        # Most similar cached preference profile for this listing and model, if it clears the threshold
+        rows = self._conn.execute(
+            "SELECT key, description, preference_embedding FROM descriptions"
+            " WHERE listing_id = ? AND model_key = ? AND created_at >= ? AND preference_embedding IS NOT NULL",
+            (listing_id, model_key, oldest_valid)
+        ).fetchall()
+        if not rows:
+            return None
+        query = np.asarray(preference_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        stored = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        similarities = stored @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return rows[best][:2]
+
+    def put(self, listing_id, model_key, user_preferences, description, preference_embedding=None):
+        key = self._key(listing_id, model_key, user_preferences)
+        embedding_blob = None
+        if preference_embedding is not None:
+            vector = np.asarray(preference_embedding, dtype=np.float32)
+            embedding_blob = (vector / max(float(np.linalg.norm(vector)), 1e-12)).tobytes()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, listing_id, model_key, embedding_blob, description, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        # Drop expired entries, then the least recently used ones beyond the size cap
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM descriptions WHERE created_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            self._conn.execute(
+                "DELETE FROM descriptions WHERE key IN ("
+                " SELECT key FROM descriptions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "entries": len(self),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
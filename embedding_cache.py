@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from instrumentation import record_api_call, span
+from rate_limiter import estimate_tokens
+
+
+def normalize_text(text):
+    # Normalize unicode and whitespace so formatting-only edits (e.g. trailing spaces) hit the cache
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def embedding_cache_key(text, model_name):
+    # Hash of the embedding model name and the normalized text
+    payload = f"{model_name}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class EmbeddingCache:
+    # Persistent embedding store: a float32 matrix (memory-mapped for reads) plus an index file
+    # holding one cache key per row. Both files are append-only, so earlier rows never move.
+    # A cache directory supports one writing process at a time (threads share the instance lock);
+    # a second process appending to the same files would assign conflicting rows.
+    def __init__(self, cache_dir, model_name):
+        safe_model_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.cache_dir = os.path.join(cache_dir, safe_model_name)
+        self.model_name = model_name
+        self.vectors_path = os.path.join(self.cache_dir, "embeddings.f32")
+        self.index_path = os.path.join(self.cache_dir, "index.txt")
+        self.meta_path = os.path.join(self.cache_dir, "meta.json")
+        self.dim = None
+        self.rows = {}
+        # Set when the cache files must be started afresh on the next write
+        self._reset = True
+        self.hits = 0
+        self.misses = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        # meta.json is written last, so without it the other files are leftovers of an interrupted
+        # first write; without the vector or index file (deleted by hand) there are no usable rows
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r") as f:
+            self.dim = json.load(f)["dim"]
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.index_path)):
+            return
+        self._reset = False
+        with open(self.index_path, "rb") as f:
+            lines = f.read().split(b"\n")
+        # A crash between or during the two appends can leave the files out of step (or a key cut
+        # short); trust the complete rows both files hold and cut the rest off, so the next append
+        # lands right after them
+        keys = [line.decode("ascii") for line in lines[:-1]]
+        vectors_size = os.path.getsize(self.vectors_path)
+        n_rows = min(len(keys), vectors_size // (4 * self.dim))
+        index_size = sum(len(key) + 1 for key in keys[:n_rows])
+        if index_size != sum(len(line) + 1 for line in lines) - 1:
+            os.truncate(self.index_path, index_size)
+        if vectors_size != n_rows * 4 * self.dim:
+            os.truncate(self.vectors_path, n_rows * 4 * self.dim)
+        self.rows = {key: row for row, key in enumerate(keys[:n_rows])}
+
+    def _get_matrix(self):
+        # (Re)map the vector file when rows have been appended since it was last mapped
+        n_rows = len(self.rows)
+        if self._matrix is None or self._matrix.shape[0] != n_rows:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dim))
+        return self._matrix
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get_many(self, keys):
+        # Return a list with a vector for every cached key and None for the rest
+        with self._lock:
+            cached_rows = [self.rows.get(key) for key in keys]
+            matrix = self._get_matrix() if self.rows else None
+            vectors = [None if row is None else matrix[row].tolist() for row in cached_rows]
+            hits = sum(1 for row in cached_rows if row is not None)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return vectors
+
+    def put_many(self, keys, vectors):
+        # Append new vectors and their keys to the cache files
+        with self._lock:
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self.rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            matrix = np.asarray(list(new.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match cache dimension {self.dim}")
+            # Write vectors before keys, so an index entry never points past the end of the matrix.
+            # A fresh cache truncates whatever an interrupted first write left behind.
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.vectors_path, "wb" if self._reset else "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self.index_path, "w" if self._reset else "a") as f:
+                f.write("".join(f"{key}\n" for key in new))
+            if self._reset:
+                # meta.json last and atomically: it marks the other two files as valid
+                temp_path = f"{self.meta_path}.{os.getpid()}.tmp"
+                with open(temp_path, "w") as f:
+                    json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+                os.replace(temp_path, self.meta_path)
+                self._reset = False
+            for key in new:
+                self.rows[key] = len(self.rows)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class CachedEmbeddings:
+    # Embeddings wrapper that only sends texts missing from the cache to the underlying model.
+    # It implements langchain's Embeddings interface (embed_documents / embed_query) without
+    # subclassing it, so that importing this module does not load langchain.
+    def __init__(self, embeddings, cache_dir="./embedding_cache", model_name=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model", type(embeddings).__name__)
+        self.cache = EmbeddingCache(cache_dir, self.model_name)
+        self.embedding_calls = 0
+
+    def embed_documents(self, texts):
+        with span("embedding", texts=len(texts)) as embedding_span:
+            keys = [embedding_cache_key(text, self.model_name) for text in texts]
+            vectors = self.cache.get_many(keys)
+
+            # Embed each distinct missing text once, in a single batched call
+            missing = {}
+            for i, vector in enumerate(vectors):
+                if vector is None:
+                    missing.setdefault(keys[i], texts[i])
+            embedding_span.set(cache_misses=len(missing))
+            if missing:
+                self.embedding_calls += 1
+                record_api_call("embedding", prompt_tokens=sum(estimate_tokens(text) for text in missing.values()))
+                new_vectors = self.embeddings.embed_documents(list(missing.values()))
+                self.cache.put_many(list(missing.keys()), new_vectors)
+                by_key = dict(zip(missing.keys(), new_vectors))
+                vectors = [by_key[keys[i]] if vector is None else vector for i, vector in enumerate(vectors)]
+
+            return vectors
+
+    def embed_query(self, text):
+        # Queries are one-off, so they go straight to the model
+        with span("embedding", texts=1):
+            record_api_call("embedding", prompt_tokens=estimate_tokens(text))
+            return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts):
+        # A batch of queries in one call, likewise uncached: caching them would grow the listing
+        # cache with every batch job
+        with span("embedding", texts=len(texts)):
+            record_api_call("embedding", prompt_tokens=sum(estimate_tokens(text) for text in texts))
+            return self.embeddings.embed_documents(texts)
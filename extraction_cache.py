@@ -0,0 +1,101 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ExtractionCache:
+    # Two-level LRU cache for extracted search parameters: an in-memory OrderedDict in front of
+    # an SQLite table. SQLite (WAL mode, busy timeout) makes the disk level safe to share between
+    # worker processes; each process opens its own connection lazily, so instances can be pickled.
+    def __init__(self, path="./extraction_cache.sqlite", max_entries=10000, memory_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def __getstate__(self):
+        # Connections and locks cannot cross process boundaries; the new process reopens them
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        state["_lock"] = None
+        state["_memory"] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                " key TEXT PRIMARY KEY,"
+                " filters TEXT NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS extractions_lru ON extractions (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key, filters):
+        self._memory[key] = filters
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        # Return a copy of the cached filters, or None on a miss
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return dict(self._memory[key])
+            conn = self._connection()
+            row = conn.execute("SELECT filters FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE extractions SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            filters = json.loads(row[0])
+            self._remember(key, filters)
+            self.disk_hits += 1
+            return dict(filters)
+
+    def put(self, key, filters):
+        with self._lock:
+            self._remember(key, dict(filters))
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?)",
+                (key, json.dumps(filters, ensure_ascii=False), time.time())
+            )
+            # Evict the least recently used rows beyond the size cap
+            conn.execute(
+                "DELETE FROM extractions WHERE key IN ("
+                " SELECT key FROM extractions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.commit()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        with self._lock:
+            entries = self._connection().execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+        return {
+            "entries": entries,
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        }
@@ -1,7 +1,12 @@
 import os
 import json
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from dedup import NearDuplicateDetector, deduplicate
+from instrumentation import span, traced
+from rate_limiter import RateLimiter, estimate_tokens, invoke_with_retry
 
 # Define a prompt template for generating real estate listings in Berlin, Germany
 listing_template = """
@@ -27,11 +32,14 @@ Description: Welcome to this stylish Altbau apartment in the heart of vibrant Kr
 Neighborhood Description: Kreuzberg is one of Berlin's most diverse and culturally rich boroughs, known for its alternative scene, vibrant nightlife, and multicultural atmosphere. The apartment is steps away from the picturesque Landwehr Canal, perfect for summer picnics and leisurely walks. Enjoy the famous Turkish Market, countless international restaurants, trendy cafés, and independent boutiques. With excellent public transportation connections via the nearby Görlitzer Bahnhof U-Bahn station, you can easily reach all parts of Berlin.
 """
 
-# Create a prompt template
-prompt = PromptTemplate(
-    input_variables=["property_type", "borough", "bedrooms"],
-    template=listing_template
-)
+@lru_cache(maxsize=None)
+def get_listing_prompt():
+    # Built on first use so that loading cached listings never imports langchain
+    from langchain.prompts import PromptTemplate
+    return PromptTemplate(
+        input_variables=["property_type", "borough", "bedrooms"],
+        template=listing_template
+    )
 
 # Define different property types common in Berlin
 property_types = [
@@ -60,36 +68,169 @@ berlin_boroughs = [
     "Wilmersdorf"
 ]
 
-def generate_listings(num_listings=20, output_file='berlin_real_estate_listings.json', model_name="gpt-4o", temperature=0.0, max_tokens=1000):
-    # Initialize the LLM
-    llm = ChatOpenAI(
+# Bedroom counts to cycle through
+bedroom_counts = [1, 2, 3, 4]
+
+def build_listing_prompt(i):
+    # Select property type, borough, and bedroom count (cycling through the lists)
+    property_type = property_types[i % len(property_types)]
+    borough = berlin_boroughs[i % len(berlin_boroughs)]
+    bedrooms = bedroom_counts[i % len(bedroom_counts)]
+    
+    # Format the prompt with the selected types
+    return get_listing_prompt().format(
+        property_type=property_type,
+        borough=borough,
+        bedrooms=bedrooms
+    )
+
+def iter_generated_listings(indices, llm, max_tokens=1000, concurrency=1, requests_per_minute=None, tokens_per_minute=None, max_retries=3):
+    # Yield (index, listing) pairs in the order of `indices`, generating up to `concurrency` at a time
+    rate_limiter = None
+    if requests_per_minute or tokens_per_minute:
+        # Only throttle when a limit is configured
+        rate_limiter = RateLimiter(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+    
+    def generate_one(i):
+        formatted_prompt = build_listing_prompt(i)
+        
+        # Generate the listing using the LLM, budgeting the prompt plus the maximum completion
+        with span("generation", index=i):
+            response = invoke_with_retry(
+                llm,
+                formatted_prompt,
+                max_retries=max_retries,
+                rate_limiter=rate_limiter,
+                tokens=estimate_tokens(formatted_prompt) + max_tokens
+            )
+        return response.content.strip()
+    
+    if concurrency <= 1:
+        for i in indices:
+            yield i, generate_one(i)
+        return
+    
+    # Keep a bounded window of in-flight requests and hand results out in submission order,
+    # so the output matches the sequential cycling through property types, boroughs and bedroom counts
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending = deque()
+    index_iter = iter(indices)
+    try:
+        for i in index_iter:
+            pending.append((i, executor.submit(generate_one, i)))
+            if len(pending) >= concurrency * 2:
+                break
+        while pending:
+            i, future = pending.popleft()
+            listing = future.result()
+            next_index = next(index_iter, None)
+            if next_index is not None:
+                pending.append((next_index, executor.submit(generate_one, next_index)))
+            yield i, listing
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _create_llm(model_name, temperature, max_tokens):
+    from langchain.chat_models import ChatOpenAI
+    return ChatOpenAI(
         model_name=model_name,
         temperature=temperature,
         max_tokens=max_tokens
     )
+
+def read_listing_records(listings_file, truncate_partial=False):
+    # Lazily yield (index, listing_text) records from a JSONL listings file.
+    # A partial last line (e.g. from a crash mid-write) is ignored, and cut off if truncate_partial is set.
+    # A corrupt line anywhere else is skipped, so the valid records after it are kept.
+    file_size = os.path.getsize(listings_file)
+    offset = 0
+    partial_at = None
+    with open(listings_file, 'rb') as f:
+        for line in f:
+            line_start, offset = offset, offset + len(line)
+            try:
+                record = json.loads(line)
+                if not line.endswith(b'\n'):
+                    raise ValueError("Incomplete line")
+            except ValueError:
+                if offset >= file_size:
+                    print(f"Ignoring incomplete record at byte {line_start} of {listings_file}")
+                    partial_at = line_start
+                else:
+                    print(f"Skipping corrupt record at byte {line_start} of {listings_file}")
+                continue
+            yield record["index"], record["listing_text"]
+    if truncate_partial and partial_at is not None:
+        with open(listings_file, 'r+b') as f:
+            f.truncate(partial_at)
+
+def _rewrite_in_index_order(listings_file):
+    # Rewrite a JSONL listings file sorted by the stored index (dropping corrupt lines on the way).
+    # The new file is written next to the old one and swapped in, so a crash leaves one of them intact.
+    records = sorted(read_listing_records(listings_file), key=lambda record: record[0])
+    tmp_file = listings_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for i, listing in records:
+            f.write(json.dumps({"index": i, "listing_text": listing}, ensure_ascii=False) + "\n")
+    os.replace(tmp_file, listings_file)
+
+def generate_listings_jsonl(num_listings=20, output_file='berlin_real_estate_listings.jsonl', model_name="gpt-4o", temperature=0.0, max_tokens=1000,
+                            concurrency=1, requests_per_minute=None, tokens_per_minute=None, max_retries=3, resume=True, llm=None):
+    # Append listings to a JSONL file, flushing each one as soon as it is generated.
+    # With resume=True, indices already on disk are skipped; otherwise the file is started over.
+    # If a resume fills gaps (e.g. a corrupt line in the middle), the file is rewritten in index order afterwards.
+    completed = set()
+    in_order = True
+    if resume and os.path.exists(output_file):
+        on_disk = [index for index, _ in read_listing_records(output_file, truncate_partial=True)]
+        completed = set(on_disk)
+        in_order = all(a < b for a, b in zip(on_disk, on_disk[1:]))
+        print(f"Resuming: {len(completed)} listings already in '{output_file}'")
+    
+    missing = [i for i in range(num_listings) if i not in completed]
+    if not missing:
+        print(f"All {num_listings} listings already present in '{output_file}'")
+        if not in_order:
+            _rewrite_in_index_order(output_file)
+            print(f"Rewrote '{output_file}' in index order")
+        return 0
+    
+    if llm is None:
+        llm = _create_llm(model_name, temperature, max_tokens)
+    
+    generated = 0
+    with open(output_file, 'a' if resume else 'w', encoding='utf-8') as f:
+        for i, listing in iter_generated_listings(missing, llm, max_tokens, concurrency, requests_per_minute, tokens_per_minute, max_retries):
+            f.write(json.dumps({"index": i, "listing_text": listing}, ensure_ascii=False) + "\n")
+            f.flush()
+            generated += 1
+            
+            # Print progress
+            print(f"Generated listing {i+1}/{num_listings}")
+    
+    print(f"\nGenerated {generated} listings and appended them to '{output_file}'")
+    if not in_order or (completed and generated and missing[0] < max(completed)):
+        _rewrite_in_index_order(output_file)
+        print(f"Rewrote '{output_file}' in index order")
+    return generated
+
+def generate_listings(num_listings=20, output_file='berlin_real_estate_listings.json', model_name="gpt-4o", temperature=0.0, max_tokens=1000,
+                      concurrency=1, requests_per_minute=None, tokens_per_minute=None, max_retries=3, resume=False, llm=None):
+    # JSONL output is written incrementally and can be resumed
+    if output_file.endswith('.jsonl'):
+        generate_listings_jsonl(num_listings, output_file, model_name, temperature, max_tokens,
+                                concurrency, requests_per_minute, tokens_per_minute, max_retries, resume, llm)
+        return [listing for _, listing in read_listing_records(output_file)]
+    
+    # Initialize the LLM (a pre-built model can be passed in, e.g. a fake model for benchmarks)
+    if llm is None:
+        llm = _create_llm(model_name, temperature, max_tokens)
     
     # Generate listings
     listings = []
-
-    bedroom_counts = [1, 2, 3, 4]
-    for i in range(num_listings):
-        # Select property type, borough, and bedroom count (cycling through the lists)
-        property_type = property_types[i % len(property_types)]
-        borough = berlin_boroughs[i % len(berlin_boroughs)]
-        bedrooms = bedroom_counts[i % len(bedroom_counts)]
-        
-        # Format the prompt with the selected types
-        formatted_prompt = prompt.format(
-            property_type=property_type,
-            borough=borough,
-            bedrooms=bedrooms
-        )
-        
-        # Generate the listing using the LLM
-        listing = llm.invoke(formatted_prompt).content
-        
+    for i, listing in iter_generated_listings(range(num_listings), llm, max_tokens, concurrency, requests_per_minute, tokens_per_minute, max_retries):
         # Add to our collection
-        listings.append(listing.strip())
+        listings.append(listing)
         
         # Print progress
         print(f"Generated listing {i+1}/{num_listings}")
@@ -102,14 +243,74 @@ def generate_listings(num_listings=20, output_file='berlin_real_estate_listings.
     
     return listings
 
-def load_or_generate_listings(listings_file='berlin_real_estate_listings.json', num_listings=20, model_name="gpt-4o", temperature=0.0, max_tokens=1000):
+def iter_listings(listings_file):
+    # Lazily yield listing strings from a JSONL file, or from a legacy JSON array file
+    if listings_file.endswith('.jsonl'):
+        for _, listing in read_listing_records(listings_file):
+            yield listing
+        return
+    
+    with open(listings_file, 'r') as f:
+        listings = json.load(f)
+    for listing in listings:
+        yield listing.get('listing_text', '') if isinstance(listing, dict) else listing
+
+def _report_duplicates(listings, detector):
+    yield from listings
+    print(f"Near-duplicate filter: {detector.report()}")
+
+@traced("listing_load")
+def load_or_generate_listings(listings_file='berlin_real_estate_listings.json', num_listings=20, model_name="gpt-4o", temperature=0.0, max_tokens=1000,
+                              concurrency=1, requests_per_minute=None, tokens_per_minute=None, stream=False, resume=True, dedup=False):
+    # With dedup=True, listings that are near-duplicates (MinHash/LSH, see dedup.py) of an earlier
+    # listing are dropped as they are read, before anything embeds or indexes them. Cycling through
+    # property types, boroughs and bedroom counts at temperature 0 produces many of those.
+    listings = _load_or_generate_listings(listings_file, num_listings, model_name, temperature, max_tokens, concurrency,
+                                          requests_per_minute, tokens_per_minute, stream, resume)
+    if not dedup:
+        return listings
+    detector = NearDuplicateDetector()
+    if stream:
+        return _report_duplicates(deduplicate(listings, detector), detector)
+    listings = list(deduplicate(listings, detector))
+    print(f"Near-duplicate filter: {detector.report()}")
+    return listings
+
+def _load_or_generate_listings(listings_file, num_listings, model_name, temperature, max_tokens, concurrency, requests_per_minute, tokens_per_minute,
+                               stream, resume):
+    # With stream=True an iterator is returned that reads listings lazily from disk
+    if listings_file.endswith('.jsonl') and (resume or not os.path.exists(listings_file)):
+        # Generate whatever is missing (no-op when the file is complete), then read back from disk
+        if os.path.exists(listings_file):
+            print(f"Found existing listings in {listings_file}")
+        else:
+            print("No existing listings found. Generating new listings...")
+        generate_listings_jsonl(
+            num_listings=num_listings,
+            output_file=listings_file,
+            model_name=model_name,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            concurrency=concurrency,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            resume=True
+        )
+        if stream:
+            return iter_listings(listings_file)
+        listings = list(iter_listings(listings_file))
+        print(f"Loaded {len(listings)} listings")
+        return listings
+    
     # Check if listings already exist
     if os.path.exists(listings_file):
         print(f"Found existing listings in {listings_file}")
         
+        if stream:
+            return iter_listings(listings_file)
+        
         # Load existing listings
-        with open(listings_file, 'r') as f:
-            listings = json.load(f)
+        listings = list(iter_listings(listings_file))
         print(f"Loaded {len(listings)} existing listings")
     else:
         print("No existing listings found. Generating new listings...")
@@ -120,8 +321,13 @@ def load_or_generate_listings(listings_file='berlin_real_estate_listings.json',
             output_file=listings_file,
             model_name=model_name,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            concurrency=concurrency,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute
         )
+        if stream:
+            return iter(listings)
     
     # Ensure consistent return type (list of strings)
     if listings and isinstance(listings[0], dict):
@@ -0,0 +1,280 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Lightweight spans and per-stage metrics. Tracing is off unless enable_tracing() is called (or
+# HOMEMATCH_TRACE=1 is set); while off, span() returns a shared no-op context manager, so an
+# instrumented call costs one global lookup and an empty with-block.
+
+# Histogram bucket upper bounds in seconds, as exported to Prometheus
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _StageMetrics:
+    def __init__(self, reservoir_size):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=reservoir_size)  # latest durations, for exact percentiles
+        self.api_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+class Tracer:
+    # Collects span durations per stage (histogram + recent-sample reservoir), API-call and token
+    # counters per stage, and optionally the individual spans for a JSON trace file
+    def __init__(self, keep_spans=False, reservoir_size=10000, max_spans=100000):
+        self.keep_spans = keep_spans
+        self.reservoir_size = reservoir_size
+        self.stages = {}
+        self.spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    def _stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages.setdefault(name, _StageMetrics(self.reservoir_size))
+        return stage
+
+    def record(self, name, start, duration, attributes, error, parent):
+        with self._lock:
+            stage = self._stage(name)
+            stage.count += 1
+            stage.errors += error
+            stage.total_seconds += duration
+            stage.recent.append(duration)
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    stage.bucket_counts[i] += 1
+                    break
+            if self.keep_spans:
+                self.spans.append((name, start - self._origin, duration, threading.get_ident(), parent, attributes, error))
+
+    def record_api_call(self, stage_name, prompt_tokens=0, completion_tokens=0):
+        with self._lock:
+            stage = self._stage(stage_name)
+            stage.api_calls += 1
+            stage.prompt_tokens += prompt_tokens
+            stage.completion_tokens += completion_tokens
+
+    def current_stage(self):
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+
+class _Span:
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        stack = getattr(self.tracer._local, "stack", None)
+        if stack is None:
+            stack = self.tracer._local.stack = []
+        self.parent = stack[-1] if stack else None
+        stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        self.tracer._local.stack.pop()
+        self.tracer.record(self.name, self.start, duration, self.attributes, exc_type is not None, self.parent)
+        return False
+
+    def set(self, **attributes):
+        # Attach attributes discovered inside the span (e.g. result counts)
+        self.attributes.update(attributes)
+
+
+_tracer = None
+
+
+def enable_tracing(keep_spans=False, reservoir_size=10000, max_spans=100000):
+    # Start collecting metrics (and the latest max_spans individual spans if keep_spans, for write_trace)
+    global _tracer
+    _tracer = Tracer(keep_spans=keep_spans, reservoir_size=reservoir_size, max_spans=max_spans)
+    return _tracer
+
+
+def disable_tracing():
+    global _tracer
+    _tracer = None
+
+
+def tracing_enabled():
+    return _tracer is not None
+
+
+def span(name, **attributes):
+    # Time a pipeline stage: `with span("vector_search", k=3): ...`
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP_SPAN
+    return _Span(tracer, name, attributes)
+
+
+def traced(name):
+    # Decorator form of span() for functions that are a stage as a whole
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with _Span(_tracer, name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_api_call(stage=None, prompt_tokens=0, completion_tokens=0):
+    # Count one API request (and its estimated tokens) against `stage`, by default the innermost open span
+    tracer = _tracer
+    if tracer is None:
+        return
+    tracer.record_api_call(stage or tracer.current_stage() or "unscoped", prompt_tokens, completion_tokens)
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))] if sorted_values else None
+
+
+def metrics_snapshot():
+    # Per-stage summary: call counts, total time, p50/p95/p99 (seconds) and API usage
+    tracer = _tracer
+    if tracer is None:
+        return {}
+    with tracer._lock:
+        snapshot = {}
+        for name, stage in tracer.stages.items():
+            recent = sorted(stage.recent)
+            snapshot[name] = {
+                "count": stage.count,
+                "errors": stage.errors,
+                "total_seconds": stage.total_seconds,
+                "p50": _percentile(recent, 0.5),
+                "p95": _percentile(recent, 0.95),
+                "p99": _percentile(recent, 0.99),
+                "api_calls": stage.api_calls,
+                "prompt_tokens": stage.prompt_tokens,
+                "completion_tokens": stage.completion_tokens
+            }
+        return snapshot
+
+
+def prometheus_metrics():
+    # Prometheus text exposition format
+    tracer = _tracer
+    if tracer is None:
+        return ""
+    lines = [
+        "# HELP homematch_stage_seconds Duration of pipeline stages.",
+        "# TYPE homematch_stage_seconds histogram"
+    ]
+    with tracer._lock:
+        stages = sorted(tracer.stages.items())
+        for name, stage in stages:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stage.bucket_counts):
+                cumulative += count
+                lines.append(f'homematch_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'homematch_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stage.count}')
+            lines.append(f'homematch_stage_seconds_sum{{stage="{name}"}} {stage.total_seconds}')
+            lines.append(f'homematch_stage_seconds_count{{stage="{name}"}} {stage.count}')
+        for metric, help_text, attribute in [
+            ("homematch_stage_errors_total", "Stages that raised an exception.", "errors"),
+            ("homematch_api_calls_total", "API requests per stage.", "api_calls"),
+            ("homematch_prompt_tokens_total", "Estimated prompt tokens per stage.", "prompt_tokens"),
+            ("homematch_completion_tokens_total", "Estimated completion tokens per stage.", "completion_tokens")
+        ]:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, stage in stages:
+                lines.append(f'{metric}{{stage="{name}"}} {getattr(stage, attribute)}')
+    return "\n".join(lines) + "\n"
+
+
+def print_stage_summary():
+    # Human-readable view of metrics_snapshot(), slowest p99 first
+    snapshot = metrics_snapshot()
+    print(f"\n{'stage':<20}  {'count':>6}  {'p50_ms':>8}  {'p95_ms':>8}  {'p99_ms':>8}  {'api_calls':>9}  {'tokens':>8}")
+    for name, stage in sorted(snapshot.items(), key=lambda item: -(item[1]["p99"] or 0)):
+        cells = [f"{stage[q] * 1000:>8.1f}" if stage[q] is not None else f"{'-':>8}" for q in ("p50", "p95", "p99")]
+        print(f"{name:<20}  {stage['count']:>6}  {'  '.join(cells)}  {stage['api_calls']:>9}  "
+              f"{stage['prompt_tokens'] + stage['completion_tokens']:>8}")
+
+
+def write_trace(path):
+    # Write the recorded spans in Chrome trace-event format (open in chrome://tracing or Perfetto)
+    tracer = _tracer
+    if tracer is None or not tracer.keep_spans:
+        raise RuntimeError("Span recording is not enabled; call enable_tracing(keep_spans=True)")
+    with tracer._lock:
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": duration * 1e6,
+                "pid": os.getpid(),
+                "tid": thread_id,
+                "args": dict(attributes, parent=parent, error=error)
+            }
+            for name, start, duration, thread_id, parent, attributes, error in tracer.spans
+        ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "metrics": metrics_snapshot()}, f, default=str)
+
+
+def start_metrics_server(port=9464, host="127.0.0.1"):
+    # Serve prometheus_metrics() on http://host:port/metrics from a daemon thread
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# HOMEMATCH_TRACE=1 turns tracing on for any entry point; HOMEMATCH_TRACE_FILE also writes a trace at exit
+if os.environ.get("HOMEMATCH_TRACE") or os.environ.get("HOMEMATCH_TRACE_FILE"):
+    enable_tracing(keep_spans=bool(os.environ.get("HOMEMATCH_TRACE_FILE")))
+    if os.environ.get("HOMEMATCH_TRACE_FILE"):
+        atexit.register(lambda: _tracer is not None and _tracer.keep_spans and write_trace(os.environ["HOMEMATCH_TRACE_FILE"]))
@@ -0,0 +1,156 @@
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from itertools import chain
+
+import numpy as np
+
+# Tokens are runs of word characters; hyphenated compounds ("u-bahn", "altbau-wohnung") are one
+# token that is indexed both whole and as its parts
+TOKEN_PATTERN = re.compile(r"\w+(?:-\w+)*")
+
+# Words too common in listings and preferences (English and German) to say anything about a match
+STOPWORDS = frozenset("""
+a about all also an and any are as at be been but by can close do for from has have i if in into is it its
+just like looking me more most my near need nearby not of on or our some that the their there this to
+up very want we what which with within would you your
+der die das den dem des ein eine einer einem einen und oder mit in im am an auf aus bei für ist nicht
+sehr zu zum zur von vom
+""".split())
+
+
+def stem(term):
+    # Minimal plural folding, so "balconies" finds "balcony" and "gyms" finds "gym"
+    if len(term) > 4 and term.endswith("ies"):
+        return term[:-3] + "y"
+    if len(term) > 3 and term.endswith("s") and not term.endswith(("ss", "us", "is")):
+        return term[:-1]
+    return term
+
+
+def _raw_tokens(text):
+    return TOKEN_PATTERN.findall(unicodedata.normalize("NFC", text).lower())
+
+
+def token_terms(token):
+    # Index terms of one raw token: the stemmed token, plus its parts if it is a compound
+    parts = token.split("-")
+    words = [token] + parts if len(parts) > 1 else parts
+    return [stem(word) for word in words if word not in STOPWORDS]
+
+
+def tokenize(text):
+    # Index terms of a text, in order, with stopwords removed
+    return list(chain.from_iterable(token_terms(token) for token in _raw_tokens(text)))
+
+
+class BM25Index:
+    # In-process inverted index with Okapi BM25 scoring. Postings are stored per term as a CSR
+    # layout (offsets into one row-id array) together with each posting's precomputed BM25 term
+    # weight, so a query is one scaled scatter-add per query term plus a top-k selection.
+    # Rows are positions in `ids`, the document ids of the vector store the index was built from.
+    def __init__(self, ids, terms, offsets, rows, weights, idf, k1=1.2, b=0.75):
+        self.ids = ids
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+        self.weights = weights
+        self.idf = idf
+        self.k1 = k1
+        self.b = b
+        self.term_index = {term: i for i, term in enumerate(terms.tolist())}
+        self.row_index = {doc_id: row for row, doc_id in enumerate(ids.tolist())}
+
+    @classmethod
+    def build(cls, ids, texts, k1=1.2, b=0.75):
+        # Count raw tokens per document; new tokens get the next id from the vocabulary's length
+        vocabulary = defaultdict()
+        vocabulary.default_factory = vocabulary.__len__
+        token_ids = []
+        token_counts = []
+        distinct_per_row = []
+        for text in texts:
+            counts = Counter(_raw_tokens(text))
+            token_ids.extend(map(vocabulary.__getitem__, counts))
+            token_counts.extend(counts.values())
+            distinct_per_row.append(len(counts))
+
+        # Map each distinct token to its terms once (stemming, stopwords, compound parts) instead of
+        # once per occurrence, then expand every (row, token) posting into its terms' postings
+        term_ids = {}
+        token_term_ids = [[term_ids.setdefault(term, len(term_ids)) for term in token_terms(token)] for token in vocabulary]
+        terms_per_token = np.array([len(ids) for ids in token_term_ids], dtype=np.int64)
+        first_term = np.cumsum(terms_per_token) - terms_per_token
+        flat_term_ids = np.fromiter(chain.from_iterable(token_term_ids), dtype=np.int64, count=int(terms_per_token.sum()))
+        num_rows = len(distinct_per_row)
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        repeats = terms_per_token[token_ids]
+        within = np.arange(int(repeats.sum()), dtype=np.int64) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        posting_terms = flat_term_ids[np.repeat(first_term[token_ids], repeats) + within]
+        posting_rows = np.repeat(np.repeat(np.arange(num_rows, dtype=np.int64), distinct_per_row), repeats)
+        tfs = np.repeat(np.asarray(token_counts, dtype=np.float32), repeats)
+
+        # Sort postings by (term, row) and merge the ones that map onto the same term (e.g. "gym" and "gyms")
+        keys = posting_terms * max(num_rows, 1) + posting_rows
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else np.zeros(0, dtype=np.int64)
+        tfs = np.add.reduceat(tfs[order], starts) if len(starts) else tfs
+        posting_terms = posting_terms[order][starts]
+        posting_rows = posting_rows[order][starts]
+
+        doc_lengths = np.bincount(posting_rows, weights=tfs, minlength=num_rows)
+        average_length = max(float(doc_lengths.mean()) if num_rows else 0.0, 1e-9)
+        weights = tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * doc_lengths[posting_rows] / average_length))
+        document_frequency = np.bincount(posting_terms, minlength=len(term_ids))
+        offsets = np.zeros(len(term_ids) + 1, dtype=np.int64)
+        np.cumsum(document_frequency, out=offsets[1:])
+        idf = np.log(1 + (num_rows - document_frequency + 0.5) / (document_frequency + 0.5))
+
+        return cls(np.asarray(ids), np.array(list(term_ids), dtype=str), offsets, posting_rows.astype(np.int32),
+                   weights.astype(np.float32), idf.astype(np.float32), k1, b)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, "lexical_index.npz"), ids=self.ids, terms=self.terms, offsets=self.offsets, rows=self.rows,
+                 weights=self.weights, idf=self.idf, params=np.array([self.k1, self.b]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(os.path.join(path, "lexical_index.npz")) as data:
+            k1, b = data["params"].tolist()
+            return cls(data["ids"], data["terms"], data["offsets"], data["rows"], data["weights"], data["idf"], k1, b)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "lexical_index.npz"))
+
+    def count(self):
+        return len(self.ids)
+
+    def scores(self, query_text):
+        # BM25 score of every row for the query (0 for rows sharing no term with it)
+        scores = np.zeros(self.count(), dtype=np.float32)
+        for term in set(tokenize(query_text)):
+            term_id = self.term_index.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # Row ids are unique within one posting list, so the fancy-indexed add is safe
+            scores[self.rows[start:end]] += self.idf[term_id] * self.weights[start:end]
+        return scores
+
+    def search(self, query_text, k=10, candidates=None):
+        # Top-k (row, score) pairs, best first; `candidates` optionally restricts the result to an
+        # array of row ids. Rows that share no term with the query are never returned.
+        scores = self.scores(query_text)
+        if candidates is not None:
+            candidates = np.asarray(candidates, dtype=np.int64)
+            scores = scores[candidates]
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        rows = matched if candidates is None else candidates[matched]
+        return [(int(row), float(scores[i])) for row, i in zip(rows, matched)]
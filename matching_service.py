@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from batch_matching import match_profile, profile_preferences, serialize_matches
+from description_cache import normalize_preferences
+from HomeMatch import find_matching_listings
+from instrumentation import enable_tracing, prometheus_metrics, tracing_enabled
+from metadata_extraction import get_chat_model
+from numpy_index import NumpyVectorStore
+from personalized_descriptions import get_llm, stream_personalized_descriptions
+
+# Long-running HTTP front end for the matching pipeline. The vector store and the API clients are
+# created once per process; the blocking pipeline runs on a thread pool next to the event loop.
+
+MAX_RESULTS = 20
+_END = object()
+
+
+def configure_http_pool(pool_size):
+    # openai 0.28 opens one requests.Session per thread by default; share a single session
+    # with a connection pool sized for every worker thread instead, so connections are reused
+    import openai
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    openai.requestssession = session
+    return session
+
+
+def parse_match_request(payload, default_n_results=3):
+    # Validate a JSON request body into (preferences, n_results, personalize, low_latency)
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    if "preferences" in payload and not isinstance(payload["preferences"], str):
+        raise ValueError("'preferences' must be a string")
+    for key in ("answers", "questions"):
+        if key in payload and not (isinstance(payload[key], list) and all(isinstance(item, str) for item in payload[key])):
+            raise ValueError(f"'{key}' must be a list of strings")
+    preferences = profile_preferences(payload)
+    if not preferences.strip():
+        raise ValueError("'preferences' (or 'answers') is required")
+    n_results = payload.get("n_results", default_n_results)
+    # bool is a subclass of int, so true/false would pass as 1/0
+    if isinstance(n_results, bool) or not isinstance(n_results, int) or not 1 <= n_results <= MAX_RESULTS:
+        raise ValueError(f"'n_results' must be an integer between 1 and {MAX_RESULTS}")
+    personalize, low_latency = payload.get("personalize", True), payload.get("low_latency", False)
+    if not isinstance(personalize, bool) or not isinstance(low_latency, bool):
+        raise ValueError("'personalize' and 'low_latency' must be true or false")
+    return preferences, n_results, personalize, low_latency
+
+
+class MatchingService:
+    # Shared state of the HTTP service: warm vector store, pooled clients, worker threads and the
+    # table of in-flight requests. Identical requests (same normalized preferences and options)
+    # that arrive while one is being computed wait for that result instead of starting their own.
+    def __init__(self, vectorstore, n_results=3, max_workers=16, chat_model=None, llm=None, extraction_cache=None, description_cache=None,
+                 retrieval="vector", lexical_index=None, diversity=None):
+        self.vectorstore = vectorstore
+        self.retrieval = retrieval
+        self.lexical_index = lexical_index
+        self.diversity = diversity
+        self.n_results = n_results
+        self.chat_model = chat_model or get_chat_model()
+        self.llm = llm or get_llm()
+        self.extraction_cache = extraction_cache
+        self.description_cache = description_cache
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.requests = 0
+        self.coalesced = 0
+        self._in_flight = {}
+
+    def count(self):
+        if isinstance(self.vectorstore, NumpyVectorStore):
+            return self.vectorstore.count()
+        return self.vectorstore._collection.count()
+
+    async def _coalesce(self, key, fn, *args):
+        # Run fn(*args) on the worker pool unless an identical call is already running
+        self.requests += 1
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # A client that disconnects must not cancel the work other waiters depend on
+        return await asyncio.shield(future)
+
+    async def match(self, preferences, n_results, personalize=True, low_latency=False):
+        key = ("match", normalize_preferences(preferences), n_results, personalize, low_latency)
+        record = await self._coalesce(key, match_profile, self.vectorstore, None, preferences, n_results, personalize, low_latency,
+                                      self.chat_model, self.llm, self.extraction_cache, self.description_cache, self.retrieval, self.lexical_index,
+                                      self.diversity)
+        return {"matches": record["matches"], "timings": record["timings"]}
+
+    async def find(self, preferences, n_results, low_latency=False):
+        key = ("find", normalize_preferences(preferences), n_results, low_latency)
+        
+        def find():
+            timings = {}
+            matches = find_matching_listings(self.vectorstore, preferences, n_results=n_results, low_latency=low_latency, timings=timings,
+                                             chat_model=self.chat_model, extraction_cache=self.extraction_cache, retrieval=self.retrieval,
+                                             lexical_index=self.lexical_index, diversity=self.diversity)
+            return matches, timings
+        matches, timings = await self._coalesce(key, find)
+        return matches, dict(timings)
+
+    async def stream_descriptions(self, matches, preferences):
+        # Bridge the threaded token stream into the event loop, yielding (listing_index, token) pairs
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def pump():
+            try:
+                for event in stream_personalized_descriptions(matches, preferences, concurrency=len(matches), llm=self.llm, cache=self.description_cache):
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, (None, e))
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, _END)
+
+        self.executor.submit(pump)
+        while True:
+            event = await events.get()
+            if event is _END:
+                return
+            if isinstance(event[1], Exception):
+                raise event[1]
+            yield event
+
+
+async def _read_request(request, service):
+    try:
+        return parse_match_request(await request.json(), service.n_results)
+    except ValueError as e:
+        # Also covers malformed JSON (json.JSONDecodeError is a ValueError)
+        raise web.HTTPBadRequest(text=json.dumps({"error": str(e)}), content_type="application/json")
+
+
+async def handle_match(request):
+    service = request.app["service"]
+    preferences, n_results, personalize, low_latency = await _read_request(request, service)
+    return web.json_response(await service.match(preferences, n_results, personalize, low_latency))
+
+
+async def handle_match_stream(request):
+    # Newline-delimited JSON: the matches as soon as retrieval is done, then description tokens
+    service = request.app["service"]
+    preferences, n_results, personalize, low_latency = await _read_request(request, service)
+    start = time.perf_counter()
+    matches, timings = await service.find(preferences, n_results, low_latency)
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+
+    async def send(event):
+        await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    await send({"event": "matches", "matches": serialize_matches(matches)})
+    if personalize and matches:
+        try:
+            async for i, token in service.stream_descriptions(matches, preferences):
+                await send({"event": "token", "listing": i, "token": token} if token is not None else {"event": "listing_done", "listing": i})
+        except Exception as e:
+            await send({"event": "error", "error": f"{type(e).__name__}: {e}"})
+    timings["total"] = time.perf_counter() - start
+    await send({"event": "end", "timings": timings})
+    await response.write_eof()
+    return response
+
+
+async def handle_health(request):
+    service = request.app["service"]
+    return web.json_response({
+        "status": "ok",
+        "listings": service.count(),
+        "retrieval": service.retrieval,
+        "diversity": service.diversity,
+        "requests": service.requests,
+        "coalesced": service.coalesced,
+        "in_flight": len(service._in_flight)
+    })
+
+
+async def handle_metrics(request):
+    # Prometheus scrape endpoint (empty unless tracing is enabled)
+    return web.Response(text=prometheus_metrics(), content_type="text/plain", headers={"X-Tracing": str(tracing_enabled()).lower()})
+
+
+def create_app(service):
+    app = web.Application()
+    app["service"] = service
+    app.router.add_post("/match", handle_match)
+    app.router.add_post("/match/stream", handle_match_stream)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+
+    async def shutdown(app):
+        service.executor.shutdown(wait=False, cancel_futures=True)
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+def main():
+    from generate_listings import load_or_generate_listings
+    from vector_database import RETRIEVAL_MODES, setup_lexical_index, setup_vector_database_from_listings
+
+    parser = argparse.ArgumentParser(description="Serve HomeMatch matching over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=16, help="Threads running the blocking pipeline")
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy", "sharded"])
+    parser.add_argument("--dedup", action="store_true", help="Drop near-duplicate listings before indexing")
+    parser.add_argument("--shard-workers", type=int, default=0, help="Sharded backend: worker processes scanning borough shards in parallel")
+    parser.add_argument("--retrieval", default="vector", choices=RETRIEVAL_MODES,
+                        help="hybrid fuses BM25 with vector search; lexical answers from BM25 without embedding calls")
+    parser.add_argument("--diversity", type=float,
+                        help="Re-rank over-fetched vector results with MMR; 0-1, higher trades relevance for variety")
+    parser.add_argument("--nprobe", type=int,
+                        help="NumPy backends: search through an IVF index probing this many lists per query (built on first use)")
+    parser.add_argument("--quantization", choices=["int8"],
+                        help="NumPy backends: scan a low-precision copy of the embeddings, re-ranking the best matches at full precision")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's per-request output")
+    parser.add_argument("--trace", action="store_true", help="Collect per-stage metrics, exported on /metrics")
+    args = parser.parse_args()
+    
+    if args.trace:
+        enable_tracing()
+
+    # Everything expensive happens once, before the first request
+    vectorstore = setup_vector_database_from_listings(load_or_generate_listings(dedup=args.dedup), backend=args.backend,
+                                                      ann={"nprobe": args.nprobe} if args.nprobe and args.backend != "chroma" else None,
+                                                      quantization=args.quantization, shard_workers=args.shard_workers)
+    lexical_index = setup_lexical_index(vectorstore) if args.retrieval != "vector" else None
+    configure_http_pool(args.workers * (args.n_results + 1))
+    service = MatchingService(vectorstore, n_results=args.n_results, max_workers=args.workers, retrieval=args.retrieval, lexical_index=lexical_index,
+                              diversity=args.diversity)
+    print(f"HomeMatch service on http://{args.host}:{args.port} ({service.count()} listings)", flush=True)
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+    web.run_app(create_app(service), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
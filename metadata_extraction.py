@@ -1,43 +1,104 @@
+import hashlib
 import os
 import json
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
-from langchain.schema.messages import SystemMessage
-from langchain.output_parsers import ResponseSchema, StructuredOutputParser
+import re
+from functools import lru_cache
 
-def extract_search_parameters_llm(user_preferences, model_name="gpt-4o", temperature=0.0):
-    # Create a parser for the output
+from embedding_cache import normalize_text
+from extraction_cache import ExtractionCache
+from instrumentation import record_api_call, span, traced
+from rate_limiter import estimate_tokens
+
+# Output schema and prompt text for the LLM path. The langchain parser and prompt built from them are
+# only created on the first LLM call (get_extraction_prompt), so the fast path never imports langchain.
+RESPONSE_SCHEMAS = [
+    ("bedrooms", "The number of bedrooms required (as a string). Only include if explicitly mentioned."),
+    ("bathrooms", "The number of bathrooms required (as a string). Only include if explicitly mentioned."),
+    ("min_price", "The minimum price in euros (as a plain number string). Only include if explicitly mentioned."),
+    ("max_price", "The maximum price or budget in euros (as a plain number string). Only include if explicitly mentioned."),
+    ("min_size", "The minimum apartment size in square meters (as a plain number string). Only include if explicitly mentioned."),
+    ("max_size", "The maximum apartment size in square meters (as a plain number string). Only include if explicitly mentioned."),
+    ("boroughs", "Comma-separated Berlin boroughs the user wants to live in. Only include if explicitly mentioned.")
+]
+SYSTEM_MESSAGE = "You are a helpful assistant that extracts search parameters from user preferences."
+HUMAN_TEMPLATE = (
+    "Extract the following information from the user preferences:\n\n"
+    "User Preferences: {user_preferences}\n\n"
+    "Extract bedrooms, bathrooms, the price range in euros, the size range in square meters "
+    "and the requested boroughs if explicitly mentioned. "
+    "A budget or \"up to\" amount is a maximum, \"at least\" is a minimum. "
+    "If not mentioned, include the field with an empty string value. "
+    "Always include every field in your response, even if empty.\n\n"
+    "Important: Return valid JSON without any comments or trailing commas.\n\n"
+    "{format_instructions}"
+)
+
+@lru_cache(maxsize=None)
+def get_extraction_prompt():
+    # (prompt, parser, format_instructions), built once and shared by every extraction call
+    from langchain.output_parsers import ResponseSchema, StructuredOutputParser
+    from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
+    from langchain.schema.messages import SystemMessage
     parser = StructuredOutputParser.from_response_schemas([
-        ResponseSchema(name="bedrooms", description="The number of bedrooms required (as a string). Only include if explicitly mentioned.", required=False),
-        ResponseSchema(name="bathrooms", description="The number of bathrooms required (as a string). Only include if explicitly mentioned.", required=False)
+        ResponseSchema(name=name, description=description, required=False) for name, description in RESPONSE_SCHEMAS
     ])
-    
-    # Create a prompt template
     prompt = ChatPromptTemplate.from_messages([
-        SystemMessage(content="You are a helpful assistant that extracts search parameters from user preferences."),
-        HumanMessagePromptTemplate.from_template(
-            "Extract the following information from the user preferences:\n\n"
-            "User Preferences: {user_preferences}\n\n"
-            "Extract bedrooms and bathrooms if explicitly mentioned. "
-            "If not mentioned, include the field with an empty string value. "
-            "Always include both fields in your response, even if empty.\n\n"
-            "Important: Return valid JSON without any comments or trailing commas.\n\n"
-            "{format_instructions}"
-        )
+        SystemMessage(content=SYSTEM_MESSAGE),
+        HumanMessagePromptTemplate.from_template(HUMAN_TEMPLATE)
     ])
+    return prompt, parser, parser.get_format_instructions()
+
+@lru_cache(maxsize=None)
+def get_chat_model(model_name="gpt-4o", temperature=0.0):
+    # One shared chat model per configuration
+    from langchain.chat_models import ChatOpenAI
+    return ChatOpenAI(model=model_name, temperature=temperature)
+
+# Hash of everything that shapes the LLM output besides the input text; changing the prompt or
+# the schema invalidates previously cached extractions
+PROMPT_HASH = hashlib.sha256(json.dumps([SYSTEM_MESSAGE, HUMAN_TEMPLATE, RESPONSE_SCHEMAS]).encode("utf-8")).hexdigest()
+
+_default_cache = None
+
+def get_extraction_cache():
+    # Shared on-disk cache used when no cache is passed explicitly
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ExtractionCache()
+    return _default_cache
+
+def extraction_cache_key(user_preferences, model_name, temperature, chat_model=None):
+    # An injected chat model is keyed by its own parameters, not the defaults it replaces
+    if chat_model is not None:
+        model_name = getattr(chat_model, "model_name", None) or getattr(chat_model, "model", None) or type(chat_model).__name__
+        temperature = getattr(chat_model, "temperature", temperature)
+    payload = f"{model_name}\0{temperature}\0{PROMPT_HASH}\0{normalize_text(user_preferences).lower()}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def extract_search_parameters_llm(user_preferences, model_name="gpt-4o", temperature=0.0, chat_model=None, cache=None):
+    # Repeated inputs are answered from the cache without a network call (cache=False disables it)
+    if cache is None:
+        cache = get_extraction_cache()
+    cache_key = extraction_cache_key(user_preferences, model_name, temperature, chat_model)
+    if cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"Cached extraction: {cached}")
+            return cached
     
     # Format the prompt with the user preferences
-    format_instructions = parser.get_format_instructions()
+    prompt, parser, format_instructions = get_extraction_prompt()
     formatted_prompt = prompt.format_messages(
         user_preferences=user_preferences,
         format_instructions=format_instructions
     )
     
-    # Create a chat model
-    chat_model = ChatOpenAI(model=model_name, temperature=temperature)
-    
-    # Get the response
-    response = chat_model.invoke(formatted_prompt)
+    # Get the response (a chat model can be passed in, e.g. a fake model for benchmarks)
+    chat_model = chat_model or get_chat_model(model_name, temperature)
+    with span("llm_extraction"):
+        response = chat_model.invoke(formatted_prompt)
+        record_api_call(prompt_tokens=sum(estimate_tokens(message.content) for message in formatted_prompt),
+                        completion_tokens=estimate_tokens(response.content))
     print(f"LLM response: {response.content}")
     
     # Parse the response
@@ -45,6 +106,8 @@ def extract_search_parameters_llm(user_preferences, model_name="gpt-4o", tempera
         metadata_filters = parser.parse(response.content)
         # Remove empty values
         metadata_filters = {k: v for k, v in metadata_filters.items() if v}
+        if cache:
+            cache.put(cache_key, metadata_filters)
         return metadata_filters
     except Exception as e:
         print(f"Error parsing LLM response: {e}")
@@ -52,6 +115,160 @@ def extract_search_parameters_llm(user_preferences, model_name="gpt-4o", tempera
         return {}
 
 
+# Rule-based fast path: handles the common phrasings in English and German without an LLM call
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "single": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "couple of": 2,
+    "ein": 1, "eine": 1, "einem": 1, "einer": 1, "eins": 1, "zwei": 2, "drei": 3, "vier": 4, "fünf": 5,
+    "sechs": 6, "sieben": 7, "acht": 8, "neun": 9, "zehn": 10
+}
+
+BOROUGHS = {
+    "mitte": "Mitte", "kreuzberg": "Kreuzberg", "prenzlauer berg": "Prenzlauer Berg", "prenzlberg": "Prenzlauer Berg",
+    "charlottenburg": "Charlottenburg", "neukölln": "Neukölln", "neukoelln": "Neukölln", "neukolln": "Neukölln",
+    "friedrichshain": "Friedrichshain", "schöneberg": "Schöneberg", "schoeneberg": "Schöneberg", "schoneberg": "Schöneberg",
+    "wedding": "Wedding", "moabit": "Moabit", "wilmersdorf": "Wilmersdorf"
+}
+
+_COUNT = r"(?P<count>\d+|" + "|".join(sorted((re.escape(w) for w in NUMBER_WORDS), key=len, reverse=True)) + r")"
+_AMOUNT = r"€?\s*(?P<amount>\d[\d.,]*)\s*(?P<scale>k\b|tsd\.?|thousand|tausend|million|mio\.?|m\b)?\s*(?:€|euros?|eur\b)?"
+_MAX_WORDS = r"under|below|less than|up to|at most|max(?:imum)?|no more than|budget(?: of| is)?|bis(?: zu)?|unter|höchstens|maximal|weniger als"
+_MIN_WORDS = r"at least|from|over|above|more than|min(?:imum)?|starting at|ab|mindestens|über|mehr als"
+_SIZE_UNIT = r"(?:m²|m2|sqm|square met(?:er|re)s?|sq\.? ?m|quadratmeter|qm)"
+
+BEDROOM_PATTERN = re.compile(_COUNT + r"[\s-]*(?P<noun>bed(?:room)?s?\b|br\b|schlafzimmer(?:n)?\b)", re.IGNORECASE)
+BATHROOM_PATTERN = re.compile(_COUNT + r"[\s-]*(?P<noun>bath(?:room)?s?\b|badezimmer(?:n)?\b|bäder(?:n)?\b|bad\b)", re.IGNORECASE)
+# "a bed", "a bath" or "ein Bad" can be furniture or part of a phrase ("a bed and breakfast style
+# apartment"); only explicit room nouns or real numbers count as a room count
+ARTICLE_COUNTS = {"a", "an", "ein", "eine", "einem", "einer", "single"}
+LOOSE_ROOM_NOUNS = {"bed", "beds", "bath", "baths"}
+ROOM_QUALIFIER_PATTERN = re.compile(r"(?:" + _MAX_WORDS + r")\s*$", re.IGNORECASE)
+# Filters are inclusive minimums, so "over 1 bathroom" / "more than 2 bedrooms" mean one more
+ROOM_EXCLUSIVE_PATTERN = re.compile(r"(?:over|above|more than|mehr als|über)\s*$", re.IGNORECASE)
+BETWEEN_PATTERN = re.compile(
+    r"(?:between|zwischen)\s*€?\s*(?P<low>\d[\d.,]*)\s*(?P<low_scale>k\b|tsd\.?|thousand|million|mio\.?)?\s*(?:€|euros?|eur\b|" + _SIZE_UNIT + r")?"
+    r"\s*(?:and|und|-|to)\s*" + _AMOUNT.replace("amount", "high").replace("scale", "high_scale") + r"\s*(?P<unit>" + _SIZE_UNIT + r")?",
+    re.IGNORECASE
+)
+BOUND_PATTERN = re.compile(r"(?:(?:budget|price|preis|size|größe|wohnfläche)\s*(?:is|of|ist|von|:)?\s*)?(?P<bound>" + _MAX_WORDS + "|" + _MIN_WORDS + r")\s*" + _AMOUNT + r"\s*(?P<unit>" + _SIZE_UNIT + r")?", re.IGNORECASE)
+BOROUGH_PATTERN = re.compile(r"\b(" + "|".join(sorted(map(re.escape, BOROUGHS), key=len, reverse=True)) + r")\b", re.IGNORECASE)
+# A borough is only taken as a filter right after a positive location cue ("in Mitte", "near
+# Kreuzberg") or as the next item of such a list ("in Mitte or Kreuzberg"). A bare mention can be
+# a complaint ("Mitte is too expensive") and goes to the LLM.
+BOROUGH_CUE_PATTERN = re.compile(r"\b(?:in|near|around|close to|next to|im|bei|nahe|um)\s+(?:the\s+|der\s+|dem\s+)?$", re.IGNORECASE)
+BOROUGH_LIST_PATTERN = re.compile(r"\s*(?:,|/|or|and|oder|und)\s*(?:(?:in|im)\s+)?", re.IGNORECASE)
+# A negation anywhere earlier in the borough's clause ("I don't want Mitte", "anything other than
+# Wedding", "nicht in Wedding") means the borough is excluded, which the filters cannot express
+BOROUGH_NEGATION_PATTERN = re.compile(
+    r"\b(?:not|no|never|nor|but|except|excluding|exclude|without|avoid|hate|dislike|other than|rather than|instead of|"
+    r"\w+n['’]t|dont|doesnt|cant|wont|kein\w*|nicht|nie|niemals|ohne|außer|ausser|statt|anstatt)\b",
+    re.IGNORECASE
+)
+CLAUSE_BOUNDARY_PATTERN = re.compile(r"[.;:!?,]")
+# Anything numeric or filter-like left over after the rules ran makes the input ambiguous
+LEFTOVER_PATTERN = re.compile(
+    r"\d|€|\b(?:" + "|".join(w for w in NUMBER_WORDS if w not in ("a", "an", "ein", "eine", "einem", "einer")) + r")\b|"
+    r"\b(?:(?<!living )(?<!dining )rooms?|zimmer|price|budget|preis|size|größe|square|sqm|qm|bed(?:room)?s?|bath(?:room)?s?|studio)\b",
+    re.IGNORECASE
+)
+
+def _parse_count(text):
+    text = text.lower()
+    return int(text) if text.isdigit() else NUMBER_WORDS.get(text)
+
+def _parse_amount(amount, scale):
+    # "450.000" / "450,000" are thousands separators; "1.2" with a scale is a decimal
+    scale = (scale or "").lower().rstrip(".")
+    if scale and re.fullmatch(r"\d+[.,]\d{1,2}", amount):
+        value = float(amount.replace(",", "."))
+    else:
+        value = float(re.sub(r"[.,]", "", amount))
+    if scale in ("k", "tsd", "thousand", "tausend"):
+        value *= 1000
+    elif scale in ("million", "mio", "m"):
+        value *= 1000000
+    return int(value)
+
+def _is_size(match_text, unit):
+    return bool(unit) or bool(re.search(_SIZE_UNIT, match_text, re.IGNORECASE))
+
+def extract_search_parameters_fast(user_preferences):
+    # Returns (filters, confident). When confident is False the caller should escalate to the LLM.
+    filters = {}
+    text = user_preferences
+    consumed = []
+    
+    for key, pattern in (("bedrooms", BEDROOM_PATTERN), ("bathrooms", BATHROOM_PATTERN)):
+        for match in pattern.finditer(text):
+            if match.group("count").lower() in ARTICLE_COUNTS and match.group("noun").lower() in LOOSE_ROOM_NOUNS:
+                # Left unconsumed, so the leftover check sends it to the LLM
+                continue
+            count = _parse_count(match.group("count"))
+            # Filters are minimums, so "at most 2 bedrooms" cannot be expressed here
+            if count is None or ROOM_QUALIFIER_PATTERN.search(text[:match.start()]):
+                return {}, False
+            if ROOM_EXCLUSIVE_PATTERN.search(text[:match.start()]):
+                count += 1
+            if key in filters and filters[key] != str(count):
+                return {}, False
+            filters[key] = str(count)
+            consumed.append(match.span())
+    
+    for match in BETWEEN_PATTERN.finditer(text):
+        low = _parse_amount(match.group("low"), match.group("low_scale") or match.group("high_scale"))
+        high = _parse_amount(match.group("high"), match.group("high_scale"))
+        prefix = "size" if _is_size(match.group(0), match.group("unit")) else "price"
+        filters[f"min_{prefix}"], filters[f"max_{prefix}"] = str(low), str(high)
+        consumed.append(match.span())
+    
+    for match in BOUND_PATTERN.finditer(text):
+        if any(match.start() < end and start < match.end() for start, end in consumed):
+            continue
+        is_size = _is_size(match.group(0), match.group("unit"))
+        is_price = "€" in match.group(0) or re.search(r"euro|eur\b|k\b|tsd|thousand|tausend|million|mio", match.group(0), re.IGNORECASE)
+        if not is_size and not is_price:
+            # A bound without a unit ("at least 3") is ambiguous
+            return {}, False
+        bound = "max" if re.fullmatch(_MAX_WORDS, match.group("bound"), re.IGNORECASE) else "min"
+        filters[f"{bound}_{'size' if is_size else 'price'}"] = str(_parse_amount(match.group("amount"), match.group("scale")))
+        consumed.append(match.span())
+    
+    boroughs = []
+    last_end = None
+    for match in BOROUGH_PATTERN.finditer(text):
+        before = text[:match.start()]
+        clause_start = max((m.end() for m in CLAUSE_BOUNDARY_PATTERN.finditer(before)), default=0)
+        listed = last_end is not None and BOROUGH_LIST_PATTERN.fullmatch(text, last_end, match.start())
+        if BOROUGH_NEGATION_PATTERN.search(before, clause_start) or not (listed or BOROUGH_CUE_PATTERN.search(before)):
+            return {}, False
+        borough = BOROUGHS[match.group(1).lower()]
+        if borough not in boroughs:
+            boroughs.append(borough)
+        consumed.append(match.span())
+        last_end = match.end()
+    if boroughs:
+        filters["boroughs"] = ", ".join(boroughs)
+    
+    # Blank out everything the rules understood and check nothing filter-like is left
+    remaining = list(text)
+    for start, end in consumed:
+        remaining[start:end] = " " * (end - start)
+    if LEFTOVER_PATTERN.search("".join(remaining)):
+        return {}, False
+    return filters, True
+
+@traced("extraction")
+def extract_search_parameters(user_preferences, model_name="gpt-4o", temperature=0.0, use_fast_path=True, chat_model=None, cache=None):
+    # Try the rule-based parser first and only pay for an LLM call when the input is ambiguous
+    if use_fast_path:
+        filters, confident = extract_search_parameters_fast(user_preferences)
+        if confident:
+            print(f"Fast-path extraction: {filters}")
+            return filters
+    return extract_search_parameters_llm(user_preferences, model_name=model_name, temperature=temperature, chat_model=chat_model, cache=cache)
+
+
 # Test function for isolated testing
 def test_extraction():
     # Test cases
@@ -60,11 +277,14 @@ def test_extraction():
         "Looking for a spacious 3-bedroom place with 2 bathrooms and at least 100 square meters.",
         "I need an apartment close to public transportation with a balcony.",
         "I'm looking for a place with 2 bedrooms.",  # Test case with only bedrooms
-        "I need a home with at least 1 bathrooms."  # Test case with only bathrooms
+        "I need a home with at least 1 bathrooms.",  # Test case with only bathrooms
+        "A flat in Neukölln or Wedding under €400,000 with at least 60 square meters."  # Test case with price, size and boroughs
     ]
     
     for i, pref in enumerate(test_preferences, 1):
         print(f"Test {i}: {pref}")
+        fast_filters, confident = extract_search_parameters_fast(pref)
+        print(f"Fast-path filters: {fast_filters if confident else 'ambiguous, needs LLM'}")
         filters = extract_search_parameters_llm(pref)
         print(f"Extracted filters: {filters}\n")
 
@@ -0,0 +1,90 @@
+import numpy as np
+
+# Fields with sorted-array range indexes and fields with one bitmap per distinct value
+RANGE_FIELDS = ["bedrooms", "bathrooms", "price", "size"]
+BITMAP_FIELDS = ["borough"]
+
+
+class MetadataIndex:
+    # Columnar pre-filter index built once per corpus. Numeric fields keep their values sorted
+    # (with the matching row order) so a range is two binary searches; categorical fields keep
+    # one boolean bitmap per value. Filters are evaluated into a candidate row-id array, so
+    # similarity scoring only runs on the rows that survive.
+    def __init__(self, columns):
+        self.num_rows = len(next(iter(columns.values())))
+        self.sorted_rows = {}
+        self.sorted_values = {}
+        for field in RANGE_FIELDS:
+            if field not in columns:
+                continue
+            values = np.asarray(columns[field])
+            present = np.flatnonzero(values >= 0)  # -1 marks a missing value
+            order = present[np.argsort(values[present], kind="stable")]
+            self.sorted_rows[field] = order
+            self.sorted_values[field] = values[order]
+        self.bitmaps = {}
+        for field in BITMAP_FIELDS:
+            if field not in columns:
+                continue
+            values = np.asarray(columns[field])
+            self.bitmaps[field] = {value: values == value for value in np.unique(values) if value}
+
+    def range_mask(self, field, low=None, high=None, include_low=True, include_high=True):
+        # Rows whose value lies in [low, high] (bounds optional), via binary search on the sorted column
+        mask = np.zeros(self.num_rows, dtype=bool)
+        if field not in self.sorted_values:
+            return mask
+        values = self.sorted_values[field]
+        start = 0 if low is None else np.searchsorted(values, low, side="left" if include_low else "right")
+        end = len(values) if high is None else np.searchsorted(values, high, side="right" if include_high else "left")
+        mask[self.sorted_rows[field][start:end]] = True
+        return mask
+
+    def value_mask(self, field, values):
+        # Union of the bitmaps of the requested values
+        mask = np.zeros(self.num_rows, dtype=bool)
+        for value in values:
+            bitmap = self.bitmaps.get(field, {}).get(value)
+            if bitmap is not None:
+                mask |= bitmap
+        return mask
+
+    def _condition_mask(self, field, condition):
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        mask = np.ones(self.num_rows, dtype=bool)
+        for op, value in condition.items():
+            if field in self.bitmaps and op in ("$eq", "$in"):
+                mask &= self.value_mask(field, value if op == "$in" else [value])
+            elif field in self.sorted_values and op in ("$eq", "$gt", "$gte", "$lt", "$lte"):
+                if op == "$eq":
+                    mask &= self.range_mask(field, value, value)
+                elif op in ("$gt", "$gte"):
+                    mask &= self.range_mask(field, low=value, include_low=op == "$gte")
+                else:
+                    mask &= self.range_mask(field, high=value, include_high=op == "$lte")
+            elif field in self.sorted_values and op == "$in":
+                mask &= np.logical_or.reduce([self.range_mask(field, v, v) for v in value] or [np.zeros(self.num_rows, dtype=bool)])
+            else:
+                raise ValueError(f"Unsupported filter on {field}: {op}")
+        return mask
+
+    def mask(self, where):
+        # Evaluate a Chroma-style `where` clause into a boolean row mask (None means no filtering)
+        if not where:
+            return None
+        mask = np.ones(self.num_rows, dtype=bool)
+        for key, value in where.items():
+            if key == "$and":
+                for clause in value:
+                    mask &= self.mask(clause)
+            elif key == "$or":
+                mask &= np.logical_or.reduce([self.mask(clause) for clause in value])
+            else:
+                mask &= self._condition_mask(key, value)
+        return mask
+
+    def candidates(self, where):
+        # Sorted array of row ids matching the filter, or None when nothing is filtered
+        mask = self.mask(where)
+        return None if mask is None else np.flatnonzero(mask)
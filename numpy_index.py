@@ -0,0 +1,266 @@
+import json
+import os
+
+import numpy as np
+
+from ann_index import IVFIndex
+from metadata_index import MetadataIndex
+from quantization import QuantizedVectors
+
+# Metadata fields stored as int columns (-1 marks a missing value) and as string columns
+NUMERIC_FIELDS = ["bedrooms", "bathrooms", "price", "size"]
+STRING_FIELDS = ["borough"]
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+
+class NumpyVectorStore:
+    # In-process exact-search index: unit-normalized float32 embeddings in a memory-mapped .npy file,
+    # metadata in columnar NumPy arrays. Scores are squared L2 distances like Chroma's default space
+    # (lower is more similar), so results are interchangeable with the Chroma backend.
+    # An optional IVF index (build_ann_index) makes searches approximate for large corpora; an
+    # optional int8 copy (build_quantized) makes the exact scan cheaper in memory.
+    def __init__(self, path, embedding_function, embeddings, columns, documents, ann_index=None, quantized=None):
+        self.path = path
+        self._embedding_function = embedding_function
+        self.embeddings = embeddings
+        self.columns = columns
+        self.documents = documents
+        self.ann_index = ann_index
+        self.quantized = quantized
+        self.metadata_index = MetadataIndex({field: columns[field] for field in NUMERIC_FIELDS + STRING_FIELDS})
+
+    @classmethod
+    def from_records(cls, records, embedding_function, path, batch_size=1000, columns=None):
+        # Build and persist an index from prepare_listing_records() output. An IVF index or quantized
+        # copy built for earlier contents is dropped; call build_ann_index()/build_quantized() again.
+        # `columns` are typed metadata columns in record order (extract_listing_metadata_batch);
+        # without them the columns are built from the records' metadata dicts.
+        os.makedirs(path, exist_ok=True)
+        IVFIndex.remove(path)
+        QuantizedVectors.remove(path)
+        ids = list(records.keys())
+        texts = [records[doc_id][0] for doc_id in ids]
+        metadatas = [records[doc_id][1] for doc_id in ids]
+
+        # Embed in batches and write straight into a memory-mapped .npy file
+        matrix = None
+        for start in range(0, len(texts), batch_size):
+            vectors = np.asarray(embedding_function.embed_documents(texts[start:start + batch_size]), dtype=np.float32)
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(os.path.join(path, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(len(texts), vectors.shape[1]))
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            matrix[start:start + len(vectors)] = vectors / np.maximum(norms, 1e-12)
+        if matrix is None:
+            raise ValueError("Listings parameter must be provided and non-empty")
+        matrix.flush()
+        del matrix
+
+        typed_columns = columns
+        columns = {"ids": np.array(ids), "content_hash": np.array([m.get("content_hash", "") for m in metadatas])}
+        if typed_columns is not None:
+            for field in NUMERIC_FIELDS:
+                columns[field] = typed_columns[field]
+            # Borough codes are stored as names; -1 (missing) picks the appended empty string
+            columns["borough"] = np.append(typed_columns["borough_categories"], "")[typed_columns["borough"]]
+        else:
+            for field in NUMERIC_FIELDS:
+                columns[field] = np.array([_to_int(m.get(field)) for m in metadatas], dtype=np.int64 if field == "price" else np.int32)
+            for field in STRING_FIELDS:
+                columns[field] = np.array([str(m.get(field, "")) for m in metadatas])
+        np.savez(os.path.join(path, "columns.npz"), **columns)
+        with open(os.path.join(path, "documents.json"), "w", encoding="utf-8") as f:
+            json.dump(texts, f, ensure_ascii=False)
+
+        return cls.load(path, embedding_function)
+
+    @classmethod
+    def load(cls, path, embedding_function):
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        with np.load(os.path.join(path, "columns.npz")) as data:
+            columns = {name: data[name] for name in data.files}
+        with open(os.path.join(path, "documents.json"), "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        ann_index = IVFIndex.load(path) if IVFIndex.exists(path) else None
+        quantized = QuantizedVectors.load(path) if QuantizedVectors.exists(path) else None
+        return cls(path, embedding_function, embeddings, columns, documents, ann_index, quantized)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "columns.npz"))
+
+    def count(self):
+        return len(self.documents)
+
+    def build_ann_index(self, n_lists=None, nprobe=None):
+        # Build and persist the IVF index next to embeddings.npy; loaded again by load()
+        self.ann_index = IVFIndex.build(self.embeddings, self.path, n_lists=n_lists, nprobe=nprobe)
+        return self.ann_index
+
+    def build_quantized(self, dtype="int8", rerank=4):
+        # Build and persist the quantized copy next to embeddings.npy; loaded again by load()
+        self.quantized = QuantizedVectors.build(self.embeddings, self.path, dtype=dtype, rerank=rerank)
+        return self.quantized
+
+    def _condition_mask(self, field, condition):
+        # Evaluate a single Chroma-style field condition over one column
+        column = self.columns.get(field)
+        if column is None:
+            return np.zeros(self.count(), dtype=bool)
+        present = column >= 0 if field in NUMERIC_FIELDS else column != ""
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        mask = present.copy()
+        for op, value in condition.items():
+            if op == "$eq":
+                mask &= column == value
+            elif op == "$ne":
+                mask &= column != value
+            elif op == "$gt":
+                mask &= column > value
+            elif op == "$gte":
+                mask &= column >= value
+            elif op == "$lt":
+                mask &= column < value
+            elif op == "$lte":
+                mask &= column <= value
+            elif op == "$in":
+                mask &= np.isin(column, value)
+            elif op == "$nin":
+                mask &= ~np.isin(column, value)
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+        return mask
+
+    def filter_mask(self, where):
+        # Evaluate a Chroma `where` clause into a boolean row mask (None means no filtering)
+        if not where:
+            return None
+        mask = np.ones(self.count(), dtype=bool)
+        for key, value in where.items():
+            if key == "$and":
+                for clause in value:
+                    mask &= self.filter_mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(self.count(), dtype=bool)
+                for clause in value:
+                    any_mask |= self.filter_mask(clause)
+                mask &= any_mask
+            else:
+                mask &= self._condition_mask(key, value)
+        return mask
+
+    def _metadata(self, row):
+        metadata = {}
+        for field in NUMERIC_FIELDS:
+            value = int(self.columns[field][row])
+            if value >= 0:
+                metadata[field] = value
+        for field in STRING_FIELDS:
+            if self.columns[field][row]:
+                metadata[field] = str(self.columns[field][row])
+        metadata["content_hash"] = str(self.columns["content_hash"][row])
+        return metadata
+
+    def prefilter_mask(self, where):
+        # filter_mask() through the pre-filter index, which turns the filter into candidate rows
+        # without scanning every column; operators it doesn't support fall back to the column scan
+        try:
+            return self.metadata_index.mask(where)
+        except ValueError:
+            return self.filter_mask(where)
+
+    def _exact_search(self, queries, k, rows=None):
+        # Top-k (rows, similarities) per query by brute force over `rows` (default: every row)
+        num_rows = self.count() if rows is None else len(rows)
+        if num_rows == 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        if self.quantized is not None and num_rows > k * self.quantized.rerank:
+            return self._quantized_search(queries, k, rows)
+        matrix = self.embeddings if rows is None else self.embeddings[rows]
+        similarities = queries @ matrix.T
+        k = min(k, similarities.shape[1])
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        results = []
+        for query_index, top_columns in enumerate(top):
+            top_columns = top_columns[np.argsort(-similarities[query_index, top_columns])]
+            results.append((top_columns if rows is None else rows[top_columns], similarities[query_index, top_columns]))
+        return results
+
+    def _quantized_search(self, queries, k, rows=None):
+        # First pass over the quantized copy keeps rerank * k candidates per query; only those rows
+        # are read from the full-precision memory map (in ascending order) and scored exactly
+        similarities = self.quantized.similarities(queries, rows)
+        shortlist = k * self.quantized.rerank
+        top = np.argpartition(-similarities, shortlist - 1, axis=1)[:, :shortlist]
+        results = []
+        for query, top_columns in zip(queries, top):
+            candidate_rows = np.sort(top_columns if rows is None else rows[top_columns])
+            exact = self.embeddings[candidate_rows] @ query
+            best = np.argsort(-exact)[:k]
+            results.append((candidate_rows[best], exact[best]))
+        return results
+
+    def _use_ann(self, matching_rows, nprobe):
+        # Worth it only when the filter leaves more rows than the probed lists hold on average;
+        # nprobe=0 asks for an exact search
+        if self.ann_index is None or nprobe == 0:
+            return False
+        probed = min(self.ann_index.n_lists(), nprobe or self.ann_index.nprobe)
+        return matching_rows > probed * self.count() / self.ann_index.n_lists()
+
+    def similarity_search_by_vectors(self, query_embeddings, k=3, filter=None, candidates=None, nprobe=None):
+        # Top-k for a batch of query embeddings: exact (one matrix product plus argpartition, or a
+        # quantized first pass plus full-precision re-ranking if build_quantized was called), or
+        # through the IVF index if one was built (build_ann_index), probing `nprobe` lists per query
+        # (default: the index's own setting). `candidates` optionally restricts scoring to an array
+        # of row ids and always searches exactly.
+        hits = self._search(query_embeddings, k, filter, candidates, nprobe)
+        return [self._results(found_rows, similarities) for found_rows, similarities in hits]
+
+    def similarity_search_with_embeddings(self, query_embedding, k=4, filter=None, nprobe=None):
+        # Top-k (Document, score) pairs for one query embedding plus the stored unit-normalized
+        # embeddings of those rows (in the same order), for re-ranking without another lookup
+        found_rows, similarities = self._search([query_embedding], k, filter, None, nprobe)[0]
+        order = np.argsort(found_rows)
+        embeddings = np.empty((len(found_rows), self.embeddings.shape[1]), dtype=np.float32)
+        embeddings[order] = self.embeddings[found_rows[order]]  # ascending reads from the memory map
+        return self._results(found_rows, similarities), embeddings
+
+    def _results(self, found_rows, similarities):
+        from langchain.schema import Document  # deferred: results are the only langchain objects here
+        return [
+            (Document(page_content=self.documents[row], metadata=self._metadata(row)), float(2.0 - 2.0 * similarity))
+            for row, similarity in zip(found_rows.tolist(), similarities.tolist())
+        ]
+
+    def _search(self, query_embeddings, k, filter, candidates, nprobe):
+        # (rows, similarities) per query, best first
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        rows = candidates
+        mask = self.prefilter_mask(filter)
+        if mask is not None:
+            rows = np.flatnonzero(mask) if rows is None else rows[mask[rows]]
+        matching_rows = self.count() if rows is None else len(rows)
+
+        if candidates is None and self._use_ann(matching_rows, nprobe):
+            hits = self.ann_index.search(queries, k, nprobe, mask)
+            # A filter can leave fewer than k matches in the probed lists; search those queries exactly
+            short = [i for i, (found, _) in enumerate(hits) if len(found) < min(k, matching_rows)]
+            for i, exact in zip(short, self._exact_search(queries[short], k, rows) if short else []):
+                hits[i] = exact
+        else:
+            hits = self._exact_search(queries, k, rows)
+        return hits
+
+    def similarity_search_with_score(self, query, k=4, filter=None, nprobe=None):
+        # Same call shape as the langchain Chroma wrapper used by query_similar_listings
+        query_embedding = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vectors([query_embedding], k=k, filter=filter, nprobe=nprobe)[0]
@@ -1,21 +1,16 @@
+import contextvars
 import os
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-def create_personalized_description(listing_doc, user_preferences, model_name="gpt-4o", temperature=0.0, max_tokens=1000):
-    # Initialize the LLM
-    llm = ChatOpenAI(
-        model_name=model_name,
-        temperature=temperature,
-        max_tokens=max_tokens
-    )
-    
-    # Extract metadata and content from the listing document
-    metadata = listing_doc.metadata
-    content = listing_doc.page_content
-    
-    # Create a prompt template for generating personalized descriptions
-    personalization_template = """
+from description_cache import hash_text
+from embedding_cache import normalize_text
+from instrumentation import record_api_call, span
+from rate_limiter import estimate_tokens
+
+# Prompt template for generating personalized descriptions (compiled once, shared by all calls)
+personalization_template = """
     You are a real estate agent tasked with creating a personalized property description for a potential buyer.
     
     Original Property Listing:
@@ -41,15 +36,33 @@ def create_personalized_description(listing_doc, user_preferences, model_name="g
     
     Personalized Description:
     """
-    
-    # Create the prompt template
-    prompt = PromptTemplate(
+
+@lru_cache(maxsize=None)
+def get_personalization_prompt():
+    # langchain is only imported once a description actually has to be generated
+    from langchain.prompts import PromptTemplate
+    return PromptTemplate(
         input_variables=["borough", "price", "bedrooms", "bathrooms", "size", "description", "preferences"],
         template=personalization_template
     )
+
+@lru_cache(maxsize=None)
+def get_llm(model_name="gpt-4o", temperature=0.0, max_tokens=1000):
+    # One shared client per model configuration instead of a new client per description
+    from langchain.chat_models import ChatOpenAI
+    return ChatOpenAI(
+        model_name=model_name,
+        temperature=temperature,
+        max_tokens=max_tokens
+    )
+
+def format_personalization_prompt(listing_doc, user_preferences):
+    # Extract metadata and content from the listing document
+    metadata = listing_doc.metadata
+    content = listing_doc.page_content
     
     # Format the prompt with the listing information and user preferences
-    formatted_prompt = prompt.format(
+    return get_personalization_prompt().format(
         borough=metadata.get("borough", ""),
         price=metadata.get("price", ""),
         bedrooms=metadata.get("bedrooms", ""),
@@ -58,27 +71,130 @@ def create_personalized_description(listing_doc, user_preferences, model_name="g
         description=content,
         preferences=user_preferences
     )
+
+def listing_cache_id(listing_doc):
+    # Listings indexed by the vector database carry their content hash; otherwise hash the text
+    return listing_doc.metadata.get("content_hash") or hash_text(normalize_text(listing_doc.page_content))
+
+def model_cache_key(model_name, temperature, max_tokens, llm=None):
+    # Cached descriptions are only valid for the same model parameters and prompt template.
+    # An injected client is keyed by its own parameters, not the defaults it replaces.
+    if llm is not None:
+        model_name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+        temperature = getattr(llm, "temperature", temperature)
+        max_tokens = getattr(llm, "max_tokens", max_tokens)
+    return f"{model_name}|{temperature}|{max_tokens}|{hash_text(personalization_template)[:12]}"
+
+def create_personalized_description(listing_doc, user_preferences, model_name="gpt-4o", temperature=0.0, max_tokens=1000, llm=None):
+    # Reuse the shared LLM client unless one is passed in
+    llm = llm or get_llm(model_name, temperature, max_tokens)
+    formatted_prompt = format_personalization_prompt(listing_doc, user_preferences)
     
     # Generate the personalized description
-    personalized_description = llm.invoke(formatted_prompt).content
+    with span("personalization"):
+        personalized_description = llm.invoke(formatted_prompt).content
+        record_api_call(prompt_tokens=estimate_tokens(formatted_prompt), completion_tokens=estimate_tokens(personalized_description))
     
     return personalized_description.strip()
 
-def generate_personalized_listings(matched_listings, user_preferences, model_name="gpt-4o", temperature=0.0, max_tokens=1000):
+def stream_personalized_descriptions(matched_listings, user_preferences, model_name="gpt-4o", temperature=0.0, max_tokens=1000, concurrency=4, llm=None,
+                                     cache=None, preference_embedding=None):
+    # Personalize all matches in parallel (at most `concurrency` at a time) and yield
+    # (listing_index, token) pairs as tokens arrive. (listing_index, None) marks a finished listing.
+    # Descriptions found in the cache are yielded as a single token without calling the LLM
+    # (or creating a client, so a fully cached request never loads langchain).
+    model_key = model_cache_key(model_name, temperature, max_tokens, llm)
+    events = queue.Queue()
+    
+    def personalize(i, doc):
+        try:
+            parts = []
+            formatted_prompt = format_personalization_prompt(doc, user_preferences)
+            client = llm or get_llm(model_name, temperature, max_tokens)
+            with span("personalization", streamed=True):
+                for chunk in client.stream(formatted_prompt):
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        events.put((i, chunk.content))
+                record_api_call(prompt_tokens=estimate_tokens(formatted_prompt), completion_tokens=estimate_tokens("".join(parts)))
+            if cache is not None:
+                cache.put(listing_cache_id(doc), model_key, user_preferences, "".join(parts).strip(), preference_embedding)
+            events.put((i, None))
+        except Exception as e:
+            events.put((i, e))
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        for i, (doc, score) in enumerate(matched_listings):
+            cached = cache.get(listing_cache_id(doc), model_key, user_preferences, preference_embedding) if cache is not None else None
+            if cached is not None:
+                events.put((i, cached))
+                events.put((i, None))
+            else:
+                # In a copy of the caller's context (e.g. batch_matching's quiet flag)
+                executor.submit(contextvars.copy_context().run, personalize, i, doc)
+        
+        remaining = len(matched_listings)
+        while remaining:
+            i, token = events.get()
+            if isinstance(token, Exception):
+                raise token
+            if token is None:
+                remaining -= 1
+            yield i, token
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def generate_personalized_listings(matched_listings, user_preferences, model_name="gpt-4o", temperature=0.0, max_tokens=1000,
+                                   concurrency=1, on_token=None, llm=None, cache=None, embedding_function=None):
+    # With concurrency > 1 all descriptions are generated in parallel; on_token(listing_index, token)
+    # is called for every streamed token as it arrives. A DescriptionCache skips repeated work;
+    # its similarity matching needs an embedding_function to embed the preferences (once per call).
+    preference_embedding = None
+    if cache is not None and cache.similarity_threshold is not None and embedding_function is not None:
+        preference_embedding = embedding_function.embed_query(normalize_text(user_preferences))
+    
+    if concurrency > 1 or on_token is not None:
+        texts = [[] for _ in matched_listings]
+        for i, token in stream_personalized_descriptions(matched_listings, user_preferences, model_name, temperature, max_tokens, concurrency, llm,
+                                                         cache, preference_embedding):
+            if token is None:
+                print(f"Finished personalized description for listing {i+1}/{len(matched_listings)}")
+                continue
+            texts[i].append(token)
+            if on_token is not None:
+                on_token(i, token)
+        return [
+            {
+                "original_doc": doc,
+                "similarity_score": score,
+                "personalized_description": "".join(text).strip()
+            }
+            for (doc, score), text in zip(matched_listings, texts)
+        ]
+    
     # Create a list to store personalized descriptions
     personalized_listings = []
     
     for i, (doc, score) in enumerate(matched_listings):
         print(f"Generating personalized description for listing {i+1}/{len(matched_listings)}...")
         
-        # Create personalized description
-        personalized_description = create_personalized_description(
-            listing_doc=doc,
-            user_preferences=user_preferences,
-            model_name=model_name,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
+        # Reuse a cached description if there is one, otherwise create and cache it
+        model_key = model_cache_key(model_name, temperature, max_tokens, llm)
+        personalized_description = None
+        if cache is not None:
+            personalized_description = cache.get(listing_cache_id(doc), model_key, user_preferences, preference_embedding)
+        if personalized_description is None:
+            personalized_description = create_personalized_description(
+                listing_doc=doc,
+                user_preferences=user_preferences,
+                model_name=model_name,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                llm=llm
+            )
+            if cache is not None:
+                cache.put(listing_cache_id(doc), model_key, user_preferences, personalized_description, preference_embedding)
         
         # Add to list with original document and score
         personalized_listings.append({
@@ -0,0 +1,82 @@
+import random
+import threading
+import time
+from collections import deque
+
+from instrumentation import record_api_call
+
+
+def estimate_tokens(text):
+    # Rough token estimate (about 4 characters per token for English text)
+    return max(1, len(text) // 4)
+
+
+class RateLimiter:
+    # Sliding-window limiter for requests-per-minute and tokens-per-minute budgets.
+    # Thread-safe, so one instance can be shared by every worker of a pool.
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, window_seconds=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window_seconds = window_seconds
+        self._events = deque()  # (timestamp, tokens) for every admitted request
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        # Drop events that have left the window
+        while self._events and now - self._events[0][0] >= self.window_seconds:
+            _, tokens = self._events.popleft()
+            self._tokens_in_window -= tokens
+
+    def _wait_time(self, now, tokens):
+        # Return how long to wait before a request of this size fits in both budgets
+        wait = 0.0
+        if self.requests_per_minute and len(self._events) >= self.requests_per_minute:
+            oldest_index = len(self._events) - self.requests_per_minute
+            wait = max(wait, self._events[oldest_index][0] + self.window_seconds - now)
+        if self.tokens_per_minute and self._events:
+            # Requests larger than the whole budget are admitted once the window is empty
+            excess = self._tokens_in_window + min(tokens, self.tokens_per_minute) - self.tokens_per_minute
+            if excess > 0:
+                freed = 0
+                for timestamp, event_tokens in self._events:
+                    freed += event_tokens
+                    if freed >= excess:
+                        wait = max(wait, timestamp + self.window_seconds - now)
+                        break
+        return wait
+
+    def acquire(self, tokens=0):
+        # Block until the request fits in the rate limits, then record it
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+            time.sleep(wait)
+
+
+def invoke_with_retry(llm, prompt, max_retries=3, initial_backoff=1.0, max_backoff=30.0, rate_limiter=None, tokens=0):
+    # Call llm.invoke(), retrying failures with exponential backoff and jitter
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire(tokens)
+        try:
+            response = llm.invoke(prompt)
+            record_api_call(prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(response.content))
+            return response
+        except Exception as e:
+            # Failed attempts are requests too
+            record_api_call(prompt_tokens=estimate_tokens(prompt))
+            if attempt >= max_retries:
+                raise
+            backoff = min(max_backoff, initial_backoff * (2 ** attempt))
+            backoff = backoff * (0.5 + random.random() / 2)
+            print(f"LLM call failed ({e}), retrying in {backoff:.1f}s (attempt {attempt + 1}/{max_retries})")
+            time.sleep(backoff)
+            attempt += 1
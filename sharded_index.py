@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from numpy_index import NumpyVectorStore
+
+# Worker-process state: the shared embedding matrix, memory-mapped once per worker
+_worker_embeddings = None
+
+
+def _init_worker(path):
+    global _worker_embeddings
+    _worker_embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+
+
+def _shard_top_k(embeddings, start, end, queries, k, rows=None):
+    # Top-k (rows, similarities) per query within one shard: the row range [start, end), or the
+    # given sorted subset of it
+    matrix = embeddings[start:end] if rows is None else embeddings[rows]
+    similarities = queries @ matrix.T
+    k = min(k, similarities.shape[1])
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    found = (top + start) if rows is None else rows[top]
+    return found, np.take_along_axis(similarities, top, axis=1)
+
+
+def _search_shard(start, end, queries, k, rows=None):
+    # _shard_top_k in a worker process
+    return _shard_top_k(_worker_embeddings, start, end, queries, k, rows)
+
+
+class ShardedVectorStore(NumpyVectorStore):
+    # NumPy store partitioned into per-borough shards. Rows are stored grouped by borough, so every
+    # shard is a contiguous slice of embeddings.npy: a query restricted to a few boroughs scans just
+    # their slices, and an unrestricted one can be fanned out over a process pool (start_workers)
+    # that scans shards in parallel and merges the per-shard top-k. Everything else (filters,
+    # documents, lexical and ANN indexes) works as for NumpyVectorStore.
+    # Shards above `max_shard_rows` are split further so the pool's tasks stay balanced; scans of
+    # fewer than `parallel_min_rows` rows stay in process, where they cost less than the round trip.
+    def __init__(self, *args, max_shard_rows=50000, parallel_min_rows=100000, **kwargs):
+        super().__init__(*args, **kwargs)
+        boroughs = self.columns["borough"]
+        starts = np.flatnonzero(np.concatenate(([True], boroughs[1:] != boroughs[:-1]))) if len(boroughs) else np.zeros(0, dtype=np.int64)
+        self.shard_names = boroughs[starts].tolist()
+        self.shard_offsets = np.append(starts, len(boroughs)).astype(np.int64)
+        self.max_shard_rows = max_shard_rows
+        self.parallel_min_rows = parallel_min_rows
+        self.executor = None
+        self.workers = 0
+
+    @classmethod
+    def from_records(cls, records, embedding_function, path, batch_size=1000, columns=None):
+        # Same as NumpyVectorStore.from_records, with the records (and typed columns) reordered by borough first
+        ids = list(records)
+        if columns is None:
+            boroughs = [str(records[doc_id][1].get("borough", "")) for doc_id in ids]
+        else:
+            boroughs = np.append(columns["borough_categories"], "")[columns["borough"]].tolist()
+        order = sorted(range(len(ids)), key=boroughs.__getitem__)
+        if columns is not None:
+            columns = {name: values if name == "borough_categories" else values[order] for name, values in columns.items()}
+        return super().from_records({ids[row]: records[ids[row]] for row in order}, embedding_function, path, batch_size, columns)
+
+    def shard_sizes(self):
+        return dict(zip(self.shard_names, np.diff(self.shard_offsets).tolist()))
+
+    def start_workers(self, workers):
+        # Process pool for fanning out unrestricted scans. Workers are spawned rather than forked
+        # (the service calls this from a process with threads) and share the page cache of the
+        # memory-mapped embeddings, so each adds little memory.
+        self.close()
+        if workers > 1:
+            context = multiprocessing.get_context("spawn")
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(self.path,))
+            self.workers = workers
+        return self
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.executor = None
+        self.workers = 0
+
+    def _tasks(self, rows):
+        # (start, end, rows) per shard piece touched by `rows` (None: every row), each piece at most
+        # max_shard_rows long; rows is None for pieces covered completely
+        tasks = []
+        rows = None if rows is None else np.sort(rows)
+        for start, end in zip(self.shard_offsets[:-1].tolist(), self.shard_offsets[1:].tolist()):
+            for piece_start in range(start, end, self.max_shard_rows):
+                piece_end = min(end, piece_start + self.max_shard_rows)
+                if rows is None:
+                    tasks.append((piece_start, piece_end, None))
+                    continue
+                piece_rows = rows[np.searchsorted(rows, piece_start):np.searchsorted(rows, piece_end)]
+                if len(piece_rows) == piece_end - piece_start:
+                    tasks.append((piece_start, piece_end, None))
+                elif len(piece_rows):
+                    tasks.append((piece_start, piece_end, piece_rows))
+        return tasks
+
+    def _exact_search(self, queries, k, rows=None):
+        # Scan the touched shard pieces (whole pieces as plain slices of the memory map, not gathered
+        # copies), on the pool for large scans over several pieces, then merge. A quantized copy
+        # makes the first pass cheap already; it is scanned in process.
+        tasks = self._tasks(rows)
+        if self.quantized is not None or not tasks:
+            return super()._exact_search(queries, k, rows)
+        scanned_rows = self.count() if rows is None else len(rows)
+        if self.executor is not None and len(tasks) > 1 and scanned_rows >= self.parallel_min_rows:
+            futures = [self.executor.submit(_search_shard, start, end, queries, k, piece_rows) for start, end, piece_rows in tasks]
+            return self._merge([future.result() for future in futures], len(queries), k)
+        return self._merge([_shard_top_k(self.embeddings, start, end, queries, k, piece_rows) for start, end, piece_rows in tasks], len(queries), k)
+
+    @staticmethod
+    def _merge(shard_results, num_queries, k):
+        # Merge per-shard top-k into the global top-k per query, best first
+        rows = np.concatenate([found for found, _ in shard_results], axis=1)
+        similarities = np.concatenate([scores for _, scores in shard_results], axis=1)
+        results = []
+        for query_index in range(num_queries):
+            top = np.argsort(-similarities[query_index], kind="stable")[:k]
+            results.append((rows[query_index, top], similarities[query_index, top]))
+        return results
+
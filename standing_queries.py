@@ -0,0 +1,211 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from embedding_cache import normalize_text
+from instrumentation import traced
+from numpy_index import NUMERIC_FIELDS
+from vector_database import build_chroma_filter, create_embedding_function, embed_queries, prepare_listing_records
+
+# Reverse matching: saved buyer profiles are standing queries, and each batch of newly ingested
+# listings is matched against all of them at once instead of re-running every profile against the
+# whole corpus. Work per batch grows with the new listings (times the profiles), not the corpus.
+
+
+def preferences_hash(preferences):
+    # Identifies the preferences a profile was indexed from, so edited profiles get re-indexed
+    return hashlib.sha256(normalize_text(preferences).encode("utf-8")).hexdigest()
+
+
+def _filter_conditions(where):
+    # Flatten a build_chroma_filter() clause into (field, operator, value) triples
+    if not where:
+        return []
+    if "$and" in where:
+        return [condition for clause in where["$and"] for condition in _filter_conditions(clause)]
+    conditions = []
+    for field, condition in where.items():
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        conditions.extend((field, op, value) for op, value in condition.items())
+    return conditions
+
+
+class ProfileIndex:
+    # Buyer profiles as unit-normalized embeddings plus their extracted filters (Chroma `where`
+    # clauses). The filters are compiled into columns: an inclusive [low, high] bound per numeric
+    # field (NaN when unbounded) and a profile x borough membership matrix, so a batch of listings
+    # is checked against every profile with a few broadcast comparisons. `hashes` holds the
+    # preferences_hash each profile was built from ("" when unknown).
+    def __init__(self, ids, embeddings, wheres, hashes=None):
+        self.ids = ids
+        self.embeddings = embeddings
+        self.wheres = wheres
+        self.hashes = np.full(len(ids), "", dtype="<U64") if hashes is None else np.asarray(hashes, dtype="<U64")
+        self.low = {field: np.full(len(ids), np.nan) for field in NUMERIC_FIELDS}
+        self.high = {field: np.full(len(ids), np.nan) for field in NUMERIC_FIELDS}
+        self.borough_names = sorted({name for where in wheres for field, _, value in _filter_conditions(where) if field == "borough"
+                                     for name in (value if isinstance(value, list) else [value])})
+        borough_columns = {name: column for column, name in enumerate(self.borough_names)}
+        # One extra all-False column, picked by listings whose borough no profile asked for
+        self.borough_members = np.zeros((len(ids), len(self.borough_names) + 1), dtype=bool)
+        self.any_borough = np.ones(len(ids), dtype=bool)
+        for row, where in enumerate(wheres):
+            for field, op, value in _filter_conditions(where):
+                if field == "borough" and op in ("$eq", "$in"):
+                    self.any_borough[row] = False
+                    self.borough_members[row, [borough_columns[name] for name in (value if op == "$in" else [value])]] = True
+                elif field in NUMERIC_FIELDS and op in ("$eq", "$gte", "$gt", "$lte", "$lt"):
+                    # Listing fields are integers, so strict bounds become inclusive ones
+                    if op in ("$eq", "$gte", "$gt"):
+                        self.low[field][row] = np.fmax(self.low[field][row], value + (op == "$gt"))
+                    if op in ("$eq", "$lte", "$lt"):
+                        self.high[field][row] = np.fmin(self.high[field][row], value - (op == "$lt"))
+                else:
+                    raise ValueError(f"Unsupported profile filter: {field} {op} {value}")
+
+    @classmethod
+    def build(cls, ids, embeddings, filters, hashes=None):
+        # filters: one extracted-filters dict (as from extract_search_parameters) per profile
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return cls(np.array(ids, dtype=str), embeddings, [build_chroma_filter(f, verbose=False) for f in filters], hashes)
+
+    def add(self, other):
+        # Profiles of `other` added, replacing profiles with the same id
+        keep = ~np.isin(self.ids, other.ids)
+        return ProfileIndex(np.concatenate([self.ids[keep], other.ids]),
+                            np.concatenate([self.embeddings[keep], other.embeddings]).astype(np.float32),
+                            [where for where, kept in zip(self.wheres, keep) if kept] + other.wheres,
+                            np.concatenate([self.hashes[keep], other.hashes]))
+
+    def remove(self, ids):
+        keep = ~np.isin(self.ids, list(ids))
+        return ProfileIndex(self.ids[keep], self.embeddings[keep], [where for where, kept in zip(self.wheres, keep) if kept], self.hashes[keep])
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, "profiles.npz"), ids=self.ids, embeddings=self.embeddings,
+                 wheres=np.array([json.dumps(where) for where in self.wheres], dtype=str), hashes=self.hashes)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(os.path.join(path, "profiles.npz")) as data:
+            # Indexes saved before hashes were stored re-index every profile once
+            hashes = data["hashes"] if "hashes" in data.files else None
+            return cls(data["ids"], data["embeddings"], [json.loads(where) for where in data["wheres"].tolist()], hashes)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "profiles.npz"))
+
+    def count(self):
+        return len(self.ids)
+
+    def filter_mask(self, metadatas):
+        # (listings x profiles) boolean matrix: which profiles' filters each listing satisfies. Like
+        # Chroma, a listing without a value for a field fails every condition on that field.
+        mask = np.ones((len(metadatas), self.count()), dtype=bool)
+        for field in NUMERIC_FIELDS:
+            values = np.array([metadata.get(field, np.nan) for metadata in metadatas], dtype=np.float64)[:, None]
+            for bound, passes in ((self.low[field], values >= self.low[field]), (self.high[field], values <= self.high[field])):
+                mask &= passes | np.isnan(bound)
+        borough_columns = {name: column for column, name in enumerate(self.borough_names)}
+        codes = [borough_columns.get(metadata.get("borough"), -1) for metadata in metadatas]
+        mask &= self.any_borough | self.borough_members[:, codes].T
+        return mask
+
+    @traced("reverse_match")
+    def match(self, listing_embeddings, metadatas, min_similarity=0.8, batch_size=None):
+        # For each listing, the (profile_id, similarity) pairs of the profiles whose filters it
+        # satisfies and whose cosine similarity is at least min_similarity, best first. Listings are
+        # scored in batches so the (listings x profiles) matrices stay around 16M entries.
+        listing_embeddings = np.asarray(listing_embeddings, dtype=np.float32).reshape(len(metadatas), -1)
+        listing_embeddings = listing_embeddings / np.maximum(np.linalg.norm(listing_embeddings, axis=1, keepdims=True), 1e-12)
+        batch_size = batch_size or max(1, 2 ** 24 // max(self.count(), 1))
+        matches = []
+        for start in range(0, len(metadatas), batch_size):
+            similarities = listing_embeddings[start:start + batch_size] @ self.embeddings.T
+            hits = self.filter_mask(metadatas[start:start + batch_size]) & (similarities >= min_similarity)
+            for listing_row, profile_rows in enumerate(hits):
+                profile_rows = np.flatnonzero(profile_rows)
+                profile_rows = profile_rows[np.argsort(-similarities[listing_row, profile_rows], kind="stable")]
+                matches.append([(str(self.ids[row]), float(similarities[listing_row, row])) for row in profile_rows])
+        return matches
+
+
+def setup_profile_index(profiles, embedding_function, path="./profile_index", chat_model=None, extraction_cache=None):
+    # Load the profile index and (re-)index the (profile_id, preferences) pairs it doesn't hold yet
+    # or holds for different preferences: their filters are extracted like find_matching_listings
+    # does and their preferences are embedded (uncached: preferences are queries, and the
+    # embedding cache holds listings)
+    from metadata_extraction import extract_search_parameters
+    profile_index = ProfileIndex.load(path) if ProfileIndex.exists(path) else None
+    known = dict(zip(profile_index.ids.tolist(), profile_index.hashes.tolist())) if profile_index is not None else {}
+    new_profiles = [(profile_id, preferences, preferences_hash(preferences)) for profile_id, preferences in profiles]
+    new_profiles = [profile for profile in new_profiles if known.get(profile[0]) != profile[2]]
+    if new_profiles:
+        print(f"Indexing {len(new_profiles)} new or changed profiles...")
+        filters = [extract_search_parameters(preferences, chat_model=chat_model, cache=extraction_cache) for _, preferences, _ in new_profiles]
+        embeddings = embed_queries(embedding_function, [preferences for _, preferences, _ in new_profiles])
+        added = ProfileIndex.build([profile_id for profile_id, _, _ in new_profiles], embeddings, filters,
+                                   [digest for _, _, digest in new_profiles])
+        profile_index = added if profile_index is None else profile_index.add(added)
+        profile_index.save(path)
+    print(f"Profile index: {profile_index.count() if profile_index is not None else 0} profiles")
+    return profile_index
+
+
+def match_new_listings(profile_index, listings, embedding_function, min_similarity=0.8, batch_size=500):
+    # Alerts for newly ingested listings: yields one {"listing_id", "profiles": [{"id", "similarity"}]}
+    # record per listing that matches at least one profile. Embeddings go through the same
+    # (cached) embedding function as indexing, so listings indexed anyway are not embedded twice.
+    records = prepare_listing_records(listings)
+    ids = list(records)
+    for start in range(0, len(ids), batch_size):
+        batch_ids = ids[start:start + batch_size]
+        embeddings = embedding_function.embed_documents([records[doc_id][0] for doc_id in batch_ids])
+        metadatas = [records[doc_id][1] for doc_id in batch_ids]
+        for doc_id, metadata, profiles in zip(batch_ids, metadatas, profile_index.match(embeddings, metadatas, min_similarity)):
+            if profiles:
+                yield {
+                    "listing_id": doc_id,
+                    "metadata": {key: value for key, value in metadata.items() if key != "content_hash"},
+                    "profiles": [{"id": profile_id, "similarity": similarity} for profile_id, similarity in profiles]
+                }
+
+
+def main():
+    from batch_matching import read_profiles
+    from generate_listings import iter_listings
+
+    parser = argparse.ArgumentParser(description="Alert saved buyer profiles about newly ingested listings")
+    parser.add_argument("listings_file", help="New listings (JSONL, or a JSON array like berlin_real_estate_listings.json)")
+    parser.add_argument("--profiles", help='JSONL file of {"id": ..., "preferences": "..."} profiles to add to the index first')
+    parser.add_argument("--profile-index", default="./profile_index")
+    parser.add_argument("--output", default="alerts.jsonl", help="Alerts are appended, one JSON record per matching listing")
+    parser.add_argument("--min-similarity", type=float, default=0.8, help="Cosine similarity a listing needs to alert a profile")
+    args = parser.parse_args()
+
+    embedding_function = create_embedding_function()
+    profile_index = setup_profile_index(read_profiles(args.profiles) if args.profiles else [], embedding_function, args.profile_index)
+    if profile_index is None:
+        parser.error("No profiles indexed yet; pass --profiles")
+
+    start = time.perf_counter()
+    listings = list(iter_listings(args.listings_file))
+    alerts = 0
+    with open(args.output, "a", encoding="utf-8") as f:
+        for alert in match_new_listings(profile_index, listings, embedding_function, args.min_similarity):
+            f.write(json.dumps(alert, ensure_ascii=False) + "\n")
+            alerts += len(alert["profiles"])
+    print(f"Matched {len(listings)} new listings against {profile_index.count()} profiles in {time.perf_counter() - start:.1f}s: "
+          f"{alerts} alerts written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
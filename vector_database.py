@@ -1,164 +1,755 @@
+import hashlib
 import os
 import json
+import operator
 import re
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
-from langchain.schema import Document
+import shutil
+import threading
+
+import numpy as np
+
+from embedding_cache import CachedEmbeddings, normalize_text
+from instrumentation import span, traced
+from lexical_index import BM25Index
+from numpy_index import NumpyVectorStore
+from sharded_index import ShardedVectorStore
+
+# Header fields extracted as metadata, and the ones stored as integers
+METADATA_FIELDS = ["borough", "price", "bedrooms", "bathrooms", "size"]
+INTEGER_FIELDS = ["price", "bedrooms", "bathrooms", "size"]
+
+# One precompiled pattern for every "Key: value" header line, e.g. "Price: €450,000  " or
+# "**Size:** 85 m²". Known fields land in `field`, any other key (a title line) in `key`.
+HEADER_LINE_PATTERN = re.compile(
+    r"^[ \t*#-]*(?:(?P<field>" + "|".join(METADATA_FIELDS) + r")|(?P<key>[^:\n]+?))[ \t*]*:[ \t*]*(?P<value>[^\n]*)",
+    re.IGNORECASE | re.MULTILINE
+)
+LEADING_DIGITS_PATTERN = re.compile(r"\d+")
+
+# A number with optional separators and scale word: "450,000", "1.200.000 €", "450,000.00", "1.2 million"
+NUMBER_PATTERN = re.compile(r"(\d[\d.,]*)\s*(k|tsd|thousand|tausend|mio|millionen|million|m)?\b", re.IGNORECASE)
+NUMBER_SCALES = {"k": 1e3, "tsd": 1e3, "thousand": 1e3, "tausend": 1e3, "m": 1e6, "mio": 1e6, "million": 1e6, "millionen": 1e6}
+DECIMAL_PATTERN = re.compile(r"\d+[.,]\d+")
+COMMA_GROUPED_PATTERN = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?")
+DOT_GROUPED_PATTERN = re.compile(r"\d{1,3}(?:\.\d{3})+(?:,\d+)?")
+
+def parse_number(digits, scale=None):
+    # Float value of a NUMBER_PATTERN match, or None when the separators are ambiguous ("1,2.3").
+    # Digits grouped in threes are thousands with the other separator as decimal point ("450,000.00",
+    # "1.200.000,50"); a single separator before a scale word ("1.2 million") is a decimal point.
+    digits = digits.rstrip(".,")
+    if digits.isdigit():
+        number = float(digits)
+    elif scale and DECIMAL_PATTERN.fullmatch(digits):
+        number = float(digits.replace(",", "."))
+    elif COMMA_GROUPED_PATTERN.fullmatch(digits):
+        number = float(digits.replace(",", ""))
+    elif DOT_GROUPED_PATTERN.fullmatch(digits):
+        number = float(digits.replace(".", "").replace(",", "."))
+    elif DECIMAL_PATTERN.fullmatch(digits):
+        number = float(digits.replace(",", "."))
+    else:
+        return None
+    return number * NUMBER_SCALES[scale.lower()] if scale else number
+
+def _field_value(field, value):
+    # Integer fields take their leading digits, prices their full amount (decimals and scale words
+    # included). A value that doesn't parse unambiguously is kept as the raw string.
+    if field not in INTEGER_FIELDS:
+        return value
+    tokens = value.split(None, 1)
+    if field == 'price':
+        # A lone "€450,000" needs no search for a scale word
+        number = parse_number(tokens[0].strip('€')) if len(tokens) == 1 else None
+        if number is None:
+            match = NUMBER_PATTERN.search(value)
+            number = parse_number(*match.groups()) if match else None
+        return value if number is None else int(round(number))
+    if tokens and tokens[0].isdigit():
+        return int(tokens[0])
+    match = LEADING_DIGITS_PATTERN.search(value)
+    return int(match.group()) if match else value
+
+def _header_lines(listing_text):
+    # (field, key, value) matches of the header: the blank-line separated block holding the first
+    # header field, plus the "Key: value" lines of any blocks before it (a title). Without a header
+    # field, only blocks starting within the first five lines count, as in the original parser.
+    lines = []
+    start = 0
+    while True:
+        end = listing_text.find('\n\n', start)
+        block = HEADER_LINE_PATTERN.findall(listing_text, start, len(listing_text) if end < 0 else end)
+        for field, _, _ in block:
+            if field:
+                return lines + block
+        lines += block
+        if end < 0 or listing_text.count('\n', 0, end) >= 5:
+            return lines
+        start = end + 2
 
 def extract_listing_metadata(listing_text):
     metadata = {}
-    lines = listing_text.strip().split('\n')
-    
-    # Process the first section (basic information)
-    for i, line in enumerate(lines):
-        if ':' in line and i < 5:  # First 5 lines should contain the basic info
-            key, value = line.split(':', 1)
-            key = key.strip().lower()  # Ensure keys are lowercase
-            value = value.strip()
-            
-            # Process specific metadata fields for better filtering
-            if key == 'bedrooms':
-                # Extract just the number for bedrooms
-                bedroom_match = re.search(r'(\d+)', value)
-                if bedroom_match:
-                    metadata[key] = int(bedroom_match.group(1))  # Store as integer
-                else:
-                    metadata[key] = value
-            elif key == 'bathrooms':
-                # Extract just the number for bathrooms
-                bathroom_match = re.search(r'(\d+)', value)
-                if bathroom_match:
-                    metadata[key] = int(bathroom_match.group(1))  # Store as integer
-                else:
-                    metadata[key] = value
-            elif key == 'size':
-                # Extract just the number for size
-                size_match = re.search(r'(\d+)', value)
-                if size_match:
-                    metadata[key] = int(size_match.group(1))  # Store as integer
-                else:
-                    metadata[key] = value
-            elif key == 'price':
-                # Extract just the number for price
-                price_match = re.search(r'€([\d,]+)', value)
-                if price_match:
-                    # Remove commas and convert to integer
-                    price_str = price_match.group(1).replace(',', '')
-                    metadata[key] = int(price_str)
-                else:
-                    metadata[key] = value
-            else:
-                metadata[key] = value
+    
+    # Single pass over the header lines; the first occurrence of each key wins
+    for field, key, value in _header_lines(listing_text):
+        if field:
+            field = field.lower()  # Ensure keys are lowercase
+            if field not in metadata:
+                metadata[field] = _field_value(field, value.strip(' \t\r*'))
+        else:
+            key = key.strip().lower()
+            if key and key not in metadata:
+                metadata[key] = value.strip(' \t\r*')
     
     return metadata
 
-def setup_vector_database_from_listings(listings=None):
-    db_path = "./chroma_db"
+def extract_listing_metadata_batch(listing_texts):
+    # Parse a whole corpus straight into typed columns instead of one dict per listing. Returns
+    # int32 arrays for the integer fields (-1 when missing or not a number), int16 borough codes
+    # (-1 when missing) and the array of borough categories the codes index into.
+    # Raw values are collected first and each distinct value is typed once, since a corpus repeats
+    # the same prices, sizes and room counts many times over.
+    n = len(listing_texts)
+    raw = {field: [''] * n for field in METADATA_FIELDS}
+    for doc, listing_text in enumerate(listing_texts):
+        for field, _, value in _header_lines(listing_text):
+            if field:
+                column = raw[field.lower()]
+                if not column[doc]:
+                    column[doc] = value
     
-    # Check if database exists
-    db_exists = os.path.exists(db_path) and os.path.isdir(db_path) and len(os.listdir(db_path)) > 0
+    columns = {}
+    for field in INTEGER_FIELDS:
+        typed = {}
+        for value in set(raw[field]):
+            number = _field_value(field, value.strip(' \t\r*'))
+            typed[value] = number if isinstance(number, int) else -1
+        columns[field] = np.array([typed[value] for value in raw[field]], dtype=np.int32)
     
-    if not db_exists:
-        # Check if listings are provided and non-empty
-        if listings is None or len(listings) == 0:
-            raise ValueError("Listings parameter must be provided and non-empty")
-        print("Building vector database...")
-        # Create embeddings for the listings
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for i, listing in enumerate(listings):
-            # If the listing is already a string, use it directly
-            # Otherwise, try to extract the listing_text field
-            if isinstance(listing, dict):
-                listing_text = listing.get('listing_text', '')
-            else:
-                listing_text = listing
-            
-            # Extract metadata from the listing
-            metadata = extract_listing_metadata(listing_text)
-            
-            # Add the listing to the documents
-            documents.append(listing_text)
-            metadatas.append(metadata)
-            ids.append(f"listing_{i}")
-        
-        # Initialize the embedding function
-        embedding_function = OpenAIEmbeddings(
-            openai_api_key=os.environ.get("OPENAI_API_KEY"),
-            openai_api_base=os.environ.get("OPENAI_API_BASE")
-        )
-        
-        # Create and persist the vector database
-        vectorstore = Chroma.from_texts(
-            documents,
-            embedding_function,
-            metadatas=metadatas,
-            ids=ids,
-            persist_directory=db_path
-        )
+    boroughs = {value: value.strip(' \t\r*') for value in set(raw['borough'])}
+    categories = sorted(set(boroughs.values()) - {''})
+    codes = {name: code for code, name in enumerate(categories)}
+    codes[''] = -1
+    columns['borough'] = np.array([codes[boroughs[value]] for value in raw['borough']], dtype=np.int16)
+    columns['borough_categories'] = np.array(categories, dtype=str)
+    return columns
+
+class LazyOpenAIEmbeddings:
+    # Creates the OpenAIEmbeddings client (importing langchain and openai) on the first embedding
+    # call, so opening an existing index or serving cached embeddings doesn't pay for those imports
+    model = "text-embedding-ada-002"
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from langchain.embeddings.openai import OpenAIEmbeddings
+                    self._client = OpenAIEmbeddings(model=self.model, **self.kwargs)
+        return self._client
+
+    def embed_documents(self, texts):
+        return self.client.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.client.embed_query(text)
+
+def create_embedding_function(embedding_cache_dir="./embedding_cache"):
+    # Initialize the embedding function, backed by the on-disk cache unless disabled
+    embedding_function = LazyOpenAIEmbeddings(
+        openai_api_key=os.environ.get("OPENAI_API_KEY"),
+        openai_api_base=os.environ.get("OPENAI_API_BASE")
+    )
+    if embedding_cache_dir:
+        embedding_function = CachedEmbeddings(embedding_function, cache_dir=embedding_cache_dir)
+    return embedding_function
+
+def listing_content_hash(listing_text):
+    # Hash of the normalized listing text; identical listings always map to the same hash
+    return hashlib.sha256(normalize_text(listing_text).encode("utf-8")).hexdigest()
+
+def listing_id(content_hash):
+    # Stable, content-derived document id (inserting a listing no longer shifts the others)
+    return f"listing_{content_hash[:16]}"
+
+def prepare_listing_records(listings, parse_metadata=True):
+    # Map document id -> (listing_text, metadata) for every listing, dropping exact duplicates.
+    # With parse_metadata=False the metadata only holds the content hash (the NumPy backend parses
+    # the whole corpus into columns with extract_listing_metadata_batch instead).
+    records = {}
+    for listing in listings:
+        # If the listing is already a string, use it directly
+        # Otherwise, try to extract the listing_text field
+        if isinstance(listing, dict):
+            listing_text = listing.get('listing_text', '')
+        else:
+            listing_text = listing
         
-        # Persist the database
+        # Extract metadata from the listing and remember which content it was built from
+        content_hash = listing_content_hash(listing_text)
+        metadata = extract_listing_metadata(listing_text) if parse_metadata else {}
+        metadata["content_hash"] = content_hash
+        records[listing_id(content_hash)] = (listing_text, metadata)
+    return records
+
+def get_collection_hashes(collection, page_size=5000):
+    # Page through the collection and map every document id to its stored content hash
+    hashes = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        for doc_id, metadata in zip(page["ids"], page["metadatas"]):
+            hashes[doc_id] = (metadata or {}).get("content_hash")
+        if len(page["ids"]) < page_size:
+            return hashes
+        offset += page_size
+
+def sync_vector_database(vectorstore, listings, batch_size=500):
+    # Bring the collection in line with the listings source, touching only what changed
+    records = prepare_listing_records(listings)
+    collection = vectorstore._collection
+    existing = get_collection_hashes(collection)
+    
+    to_upsert = [doc_id for doc_id, (_, metadata) in records.items() if existing.get(doc_id) != metadata["content_hash"]]
+    to_delete = [doc_id for doc_id in existing if doc_id not in records]
+    
+    # Upsert new or changed listings in batches (embeddings go through the cache, if any)
+    for start in range(0, len(to_upsert), batch_size):
+        batch_ids = to_upsert[start:start + batch_size]
+        documents = [records[doc_id][0] for doc_id in batch_ids]
+        metadatas = [records[doc_id][1] for doc_id in batch_ids]
+        embeddings = vectorstore._embedding_function.embed_documents(documents)
+        collection.upsert(ids=batch_ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+    
+    # Delete listings that are no longer in the source
+    for start in range(0, len(to_delete), batch_size):
+        collection.delete(ids=to_delete[start:start + batch_size])
+    
+    if to_upsert or to_delete:
         vectorstore.persist()
-        
-        print(f"Added {len(documents)} listings to vector database")
+    
+    unchanged = len(records) - len(to_upsert)
+    print(f"Synced vector database: {len(to_upsert)} upserted, {len(to_delete)} deleted, {unchanged} unchanged")
+    return {"upserted": len(to_upsert), "deleted": len(to_delete), "unchanged": unchanged}
+
+def hnsw_metadata(ann):
+    # Chroma collection metadata for HNSW build/search parameters, e.g. {"M": 32, "construction_ef": 200,
+    # "search_ef": 64}; Chroma persists it with the collection in the database directory
+    return {f"hnsw:{name}": value for name, value in ann.items()} if ann else None
+
+def build_vector_database(listings, db_path="./chroma_db", embedding_function=None, ann=None):
+    # Check if listings are provided
+    if listings is None:
+        raise ValueError("Listings parameter must be provided and non-empty")
+    
+    if embedding_function is None:
+        embedding_function = create_embedding_function()
+    
+    print("Building vector database...")
+    from langchain.vectorstores import Chroma
+    vectorstore = Chroma(persist_directory=db_path, embedding_function=embedding_function, collection_metadata=hnsw_metadata(ann))
+    
+    # Populating an empty collection is a sync where every listing is new
+    summary = sync_vector_database(vectorstore, listings)
+    if summary["upserted"] == 0:
+        raise ValueError("Listings parameter must be provided and non-empty")
+    
+    print(f"Added {summary['upserted']} listings to vector database")
+    if isinstance(embedding_function, CachedEmbeddings):
+        stats = embedding_function.cache.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+    return vectorstore
+
+def setup_numpy_index(listings, db_path, embedding_function, rebuild=False, sync=True, ann=None, quantization=None, store_class=NumpyVectorStore):
+    # The NumPy index is rebuilt as a whole whenever the listings changed; the embedding cache
+    # keeps that cheap because unchanged listings are never re-embedded. With `ann` (IVF build
+    # parameters, {} for the defaults) an approximate index is built too, unless one exists, and
+    # with `quantization` ("int8") a low-precision copy for the exact scan.
+    if not rebuild and store_class.exists(db_path):
+        print(f"Loading existing NumPy index from {db_path}")
+        vectorstore = store_class.load(db_path, embedding_function)
+        print(f"Loaded {vectorstore.count()} documents from NumPy index")
+        unchanged = not sync or listings is None
+        if not unchanged:
+            records = prepare_listing_records(listings, parse_metadata=False)
+            unchanged = set(vectorstore.columns["content_hash"].tolist()) == {metadata["content_hash"] for _, metadata in records.values()}
+        if unchanged:
+            return _with_search_indexes(vectorstore, ann, quantization)
+        print("Listings changed, rebuilding NumPy index...")
+    else:
+        if listings is None:
+            raise ValueError("Listings parameter must be provided and non-empty")
+        records = prepare_listing_records(listings, parse_metadata=False)
+    
+    print("Building NumPy index...")
+    columns = extract_listing_metadata_batch([listing_text for listing_text, _ in records.values()])
+    vectorstore = store_class.from_records(records, embedding_function, db_path, columns=columns)
+    print(f"Added {vectorstore.count()} listings to NumPy index")
+    return _with_search_indexes(vectorstore, ann, quantization)
+
+def _with_search_indexes(vectorstore, ann, quantization):
+    if quantization is not None and (vectorstore.quantized is None or vectorstore.quantized.dtype() != quantization):
+        print(f"Building {quantization} copy of the embeddings...")
+        vectorstore.build_quantized(quantization)
+    if vectorstore.quantized is not None:
+        print(f"Quantized embeddings: {vectorstore.quantized.dtype()}, {vectorstore.quantized.nbytes() / 2 ** 20:.1f} MiB, "
+              f"best {vectorstore.quantized.rerank} x k candidates re-ranked at full precision")
+    if ann is None:
         return vectorstore
+    if vectorstore.ann_index is None:
+        print("Building IVF index...")
+        vectorstore.build_ann_index(**ann)
+    elif ann.get("n_lists") and min(ann["n_lists"], vectorstore.count()) != vectorstore.ann_index.n_lists():
+        print(f"Rebuilding IVF index with {ann['n_lists']} lists (was {vectorstore.ann_index.n_lists()})...")
+        vectorstore.build_ann_index(**ann)
+    elif ann.get("nprobe"):
+        # An existing index with the requested lists is kept; only the default nprobe follows the request
+        vectorstore.ann_index.nprobe = min(vectorstore.ann_index.n_lists(), ann["nprobe"])
+    print(f"IVF index: {vectorstore.ann_index.n_lists()} lists, {vectorstore.ann_index.nprobe} probed per query by default")
+    return vectorstore
+
+@traced("vector_store_setup")
+def setup_vector_database_from_listings(listings=None, db_path=None, rebuild=False, sync=True, embedding_cache_dir="./embedding_cache", backend="chroma",
+                                        ann=None, quantization=None, shard_workers=0):
+    # Embeddings go through the persistent cache, so a rebuild only embeds new or changed listings.
+    # `ann` holds approximate-index build parameters: IVF ({"n_lists", "nprobe"}) for the NumPy
+    # backend, HNSW ({"M", "construction_ef", "search_ef"}) for a newly created Chroma collection.
+    # `quantization` ("int8", NumPy backend only) scans a low-precision copy of the
+    # embeddings and re-ranks the best candidates at full precision.
+    # backend="sharded" is the NumPy store split into per-borough shards; with shard_workers > 1,
+    # scans over several shards run on that many worker processes.
+    embedding_function = create_embedding_function(embedding_cache_dir)
+    
+    # backend="numpy" keeps everything in process: brute-force search over a memory-mapped matrix
+    if backend == "numpy":
+        return setup_numpy_index(listings, db_path or "./numpy_index", embedding_function, rebuild, sync, ann, quantization)
+    if backend == "sharded":
+        vectorstore = setup_numpy_index(listings, db_path or "./sharded_index", embedding_function, rebuild, sync, ann, quantization, ShardedVectorStore)
+        print(f"{len(vectorstore.shard_names)} borough shards, {shard_workers or 'no'} worker processes")
+        return vectorstore.start_workers(shard_workers)
+    if backend != "chroma":
+        raise ValueError(f"Unknown vector database backend: {backend}")
+    if quantization is not None:
+        raise ValueError("quantization needs a NumPy backend; Chroma stores float32 vectors only")
+    db_path = db_path or "./chroma_db"
+    
+    if rebuild and os.path.isdir(db_path):
+        print(f"Removing existing vector database at {db_path} for rebuild")
+        shutil.rmtree(db_path)
+    
+    # Check if database exists
+    db_exists = os.path.exists(db_path) and os.path.isdir(db_path) and len(os.listdir(db_path)) > 0
+    
+    if not db_exists:
+        return build_vector_database(listings, db_path, embedding_function, ann)
     
     # Try to load existing database
+    from langchain.vectorstores import Chroma
     try:
         print(f"Loading existing vector database from {db_path}")
-        embedding_function = OpenAIEmbeddings(
-            openai_api_key=os.environ.get("OPENAI_API_KEY"),
-            openai_api_base=os.environ.get("OPENAI_API_BASE")
-        )
         vectorstore = Chroma(persist_directory=db_path, embedding_function=embedding_function)
         print(f"Loaded {vectorstore._collection.count()} documents from vector database")
-        return vectorstore
     except Exception as e:
         print(f"Error loading existing database: {e}")
         print("Rebuilding vector database...")
+        shutil.rmtree(db_path, ignore_errors=True)
+        return build_vector_database(listings, db_path, embedding_function, ann)
+    
+    # Pick up listings that were added, changed or removed since the database was built
+    if sync and listings is not None:
+        sync_vector_database(vectorstore, listings)
+    return vectorstore
 
-def query_similar_listings(vectorstore, query_text, n_results=3, metadata_filters=None):
-    # Apply metadata filters if provided
-    if metadata_filters:
-        filter_dict = {}
-        for key, value in metadata_filters.items():
-            if key in ["bedrooms", "bathrooms"]:
-                # For bedrooms and bathrooms, use greater than or equal to
-                try:
-                    # Convert to int and use $gte operator for minimum requirements
-                    numeric_value = int(value)
-                    filter_dict[key] = {"$gte": numeric_value}
+# Range filters extracted from user preferences: filter key -> (metadata field, Chroma operator)
+RANGE_FILTERS = {
+    "min_price": ("price", "$gte"),
+    "max_price": ("price", "$lte"),
+    "min_size": ("size", "$gte"),
+    "max_size": ("size", "$lte")
+}
+
+def parse_filter_number(value, field="price"):
+    # Parse numbers like "2", "€450,000", "450.000", "450k", "1.2 million" or "85 m²" into an int
+    # (see parse_number). Scale words only apply to prices, so a size of "100 m" stays 100.
+    match = NUMBER_PATTERN.search(str(value))
+    if not match:
+        raise ValueError(f"Not a number: {value}")
+    digits, scale = match.groups()
+    number = parse_number(digits, scale if field == "price" else None)
+    if number is None:
+        raise ValueError(f"Ambiguous number: {value}")
+    return int(round(number))
+
+def build_chroma_filter(metadata_filters, verbose=True):
+    # Translate extracted metadata filters into a Chroma `where` clause (None if nothing applies)
+    conditions = []
+    for key, value in (metadata_filters or {}).items():
+        if key in ["bedrooms", "bathrooms"]:
+            # For bedrooms and bathrooms, use greater than or equal to
+            try:
+                # Convert to int and use $gte operator for minimum requirements
+                numeric_value = int(value)
+                conditions.append({key: {"$gte": numeric_value}})
+                if verbose:
                     print(f"  - filtering {key} >= {numeric_value}")
-                except ValueError:
-                    # If not a valid number, skip this filter
+            except ValueError:
+                # If not a valid number, skip this filter
+                if verbose:
+                    print(f"  - skipping invalid {key} value: {value}")
+        elif key in RANGE_FILTERS:
+            # Price and size bounds become $gte/$lte range conditions
+            field, operator = RANGE_FILTERS[key]
+            try:
+                numeric_value = parse_filter_number(value, field)
+                conditions.append({field: {operator: numeric_value}})
+                if verbose:
+                    print(f"  - filtering {field} {'>=' if operator == '$gte' else '<='} {numeric_value}")
+            except ValueError:
+                if verbose:
                     print(f"  - skipping invalid {key} value: {value}")
+        elif key == "boroughs":
+            # Boroughs arrive as a list or a comma-separated string
+            names = value.split(",") if isinstance(value, str) else value
+            boroughs = [name.strip().title() for name in names if name.strip()]
+            if boroughs:
+                conditions.append({"borough": {"$in": boroughs}} if len(boroughs) > 1 else {"borough": boroughs[0]})
+                if verbose:
+                    print(f"  - filtering borough in {boroughs}")
+    
+    if not conditions:
+        return None
+    # Chroma only accepts one top-level condition, so combine several with $and
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+# Chroma comparison operators, for evaluating filters against metadata in Python
+FILTER_OPERATORS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$in": lambda value, expected: value in expected,
+    "$nin": lambda value, expected: value not in expected
+}
+
+def metadata_matches(metadata, where):
+    # Evaluate a Chroma-style `where` clause against one metadata dict
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(metadata_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(metadata_matches(metadata, clause) for clause in condition):
+                return False
+        else:
+            if key not in metadata:
+                return False
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, expected in condition.items():
+                try:
+                    if not FILTER_OPERATORS[op](metadata[key], expected):
+                        return False
+                except TypeError:
+                    # Unparsed metadata (e.g. a string where a number was expected) never matches
+                    return False
+    return True
+
+# How query_similar_listings retrieves: embeddings only, BM25 fused with embeddings, or BM25 only
+RETRIEVAL_MODES = ["vector", "hybrid", "lexical"]
+
+def store_documents(vectorstore, page_size=5000):
+    # (ids, texts) of every listing in the vector store, in storage order
+    if isinstance(vectorstore, NumpyVectorStore):
+        return vectorstore.columns["ids"].tolist(), vectorstore.documents
+    ids, texts = [], []
+    offset = 0
+    while True:
+        page = vectorstore._collection.get(include=["documents"], limit=page_size, offset=offset)
+        ids.extend(page["ids"])
+        texts.extend(page["documents"])
+        if len(page["ids"]) < page_size:
+            return ids, texts
+        offset += page_size
+
+def setup_lexical_index(vectorstore, path="./lexical_index", rebuild=False):
+    # Load the BM25 index over the listings in `vectorstore`, building it when it is missing or was
+    # built from other listings. Ids are content hashes, so equal ids mean equal listing texts.
+    if not rebuild and BM25Index.exists(path):
+        lexical_index = BM25Index.load(path)
+        if isinstance(vectorstore, NumpyVectorStore):
+            # Rows double as NumPy store rows, so the order has to match too
+            current = np.array_equal(lexical_index.ids, vectorstore.columns["ids"])
+        else:
+            current = set(lexical_index.ids.tolist()) == set(vectorstore._collection.get(include=[])["ids"])
+        if current:
+            print(f"Loaded lexical index with {lexical_index.count()} listings from {path}")
+            return lexical_index
+        print("Listings changed, rebuilding lexical index...")
+    
+    print("Building lexical index...")
+    ids, texts = store_documents(vectorstore)
+    lexical_index = BM25Index.build(ids, texts)
+    lexical_index.save(path)
+    print(f"Indexed {lexical_index.count()} listings ({len(lexical_index.terms)} terms)")
+    return lexical_index
+
+def _lexical_candidates(vectorstore, lexical_index, where):
+    # Row ids of the lexical index that satisfy a Chroma `where` clause (None means no filtering)
+    if not where:
+        return None
+    if isinstance(vectorstore, NumpyVectorStore):
+        return np.flatnonzero(vectorstore.prefilter_mask(where))
+    ids = vectorstore._collection.get(where=where, include=[])["ids"]
+    return np.array([lexical_index.row_index[doc_id] for doc_id in ids if doc_id in lexical_index.row_index], dtype=np.int64)
+
+def lexical_search(vectorstore, lexical_index, query_text, n_results=3, where=None):
+    # BM25 top-k over the listings, as (Document, score) tuples with higher scores being better.
+    # Needs no embedding call; documents and filters come from the vector store's local data.
+    from langchain.schema import Document
+    with span("lexical_search", k=n_results) as search_span:
+        try:
+            candidates = _lexical_candidates(vectorstore, lexical_index, where)
+        except Exception as e:
+            print(f"Error applying metadata filters: {e}")
+            print("Falling back to lexical search without filters")
+            candidates = None
+        hits = lexical_index.search(query_text, n_results, candidates)
+        search_span.set(results=len(hits))
+        if isinstance(vectorstore, NumpyVectorStore):
+            return [(Document(page_content=vectorstore.documents[row], metadata=vectorstore._metadata(row)), score) for row, score in hits]
+        if not hits:
+            return []
+        ids = [lexical_index.ids[row] for row, _ in hits]
+        page = vectorstore._collection.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {doc_id: (document, metadata) for doc_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"])}
+        return [
+            (Document(page_content=by_id[doc_id][0], metadata=by_id[doc_id][1] or {}), score)
+            for doc_id, (_, score) in zip(ids, hits) if doc_id in by_id
+        ]
+
+def reciprocal_rank_fusion(result_lists, n_results=3, k=60):
+    # Merge ranked (Document, score) lists: every list adds 1 / (k + rank) to each document it
+    # contains, so only ranks matter and distances and BM25 scores never have to be compared
+    fused = {}
+    for results in result_lists:
+        for rank, (doc, _) in enumerate(results, 1):
+            key = doc.metadata.get("content_hash") or doc.page_content
+            entry = fused.setdefault(key, [doc, 0.0])
+            entry[1] += 1.0 / (k + rank)
+    return sorted(((doc, score) for doc, score in fused.values()), key=lambda item: -item[1])[:n_results]
+
+def maximal_marginal_relevance(query_embedding, embeddings, k, diversity=0.3):
+    # Greedy MMR: each pick maximizes (1 - diversity) * similarity to the query minus diversity *
+    # its highest similarity to an earlier pick. One matrix product gives all candidate pairs, then
+    # every pick is a single vector update, so k picks from m candidates cost O(m^2 d + k m).
+    # Returns candidate indices in pick order (the first is always the most relevant).
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    k = min(k, len(embeddings))
+    if k == 0:
+        return []
+    embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    relevance = embeddings @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    pairwise = embeddings @ embeddings.T
+    picks = [int(np.argmax(relevance))]
+    redundancy = pairwise[picks[0]].copy()
+    available = np.ones(len(embeddings), dtype=bool)
+    available[picks[0]] = False
+    for _ in range(k - 1):
+        scores = np.where(available, (1.0 - diversity) * relevance - diversity * redundancy, -np.inf)
+        pick = int(np.argmax(scores))
+        picks.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, pairwise[pick], out=redundancy)
+    return picks
+
+def search_with_embeddings(vectorstore, query_embedding, n_results, where, nprobe=None):
+    # Top n_results (Document, distance) pairs for one query embedding, plus the stored embeddings
+    # of those listings from the same lookup
+    if isinstance(vectorstore, NumpyVectorStore):
+        return vectorstore.similarity_search_with_embeddings(query_embedding, k=n_results, filter=where, nprobe=nprobe)
+    from langchain.schema import Document
+    results = vectorstore._collection.query(
+        query_embeddings=[query_embedding],
+        n_results=n_results,
+        where=where,
+        include=["documents", "metadatas", "distances", "embeddings"]
+    )
+    documents = [
+        (Document(page_content=document, metadata=metadata or {}), distance)
+        for document, metadata, distance in zip(results["documents"][0], results["metadatas"][0], results["distances"][0])
+    ]
+    return documents, np.asarray(results["embeddings"][0], dtype=np.float32).reshape(len(documents), -1)
+
+@traced("vector_search")
+def diverse_search(vectorstore, query_text, n_results=3, metadata_filters=None, diversity=0.3, overfetch=4, nprobe=None):
+    # Over-fetch n_results * overfetch candidates with their embeddings in one lookup and keep the
+    # n_results picked by maximal_marginal_relevance, in pick order with their original distances
+    query_embedding = vectorstore._embedding_function.embed_query(query_text)
+    candidates = n_results * overfetch
+    where = build_chroma_filter(metadata_filters) if metadata_filters else None
+    try:
+        results, embeddings = search_with_embeddings(vectorstore, query_embedding, candidates, where, nprobe)
+    except Exception as e:
+        if where is None:
+            raise
+        print(f"Error applying metadata filters: {e}")
+        print("Falling back to semantic search without filters")
+        with span("filter_fallback"):
+            results, embeddings = search_with_embeddings(vectorstore, query_embedding, candidates, None, nprobe)
+    with span("mmr_rerank", candidates=len(results)):
+        return [results[i] for i in maximal_marginal_relevance(query_embedding, embeddings, n_results, diversity)]
+
+def query_similar_listings(vectorstore, query_text, n_results=3, metadata_filters=None, retrieval="vector", lexical_index=None, overfetch=4,
+                           nprobe=None, diversity=None):
+    # retrieval="hybrid" fuses the top n_results * overfetch of BM25 and vector search with
+    # reciprocal rank fusion, and answers from BM25 alone if the embedding call fails;
+    # retrieval="lexical" makes no API call at all. Both need a lexical_index (setup_lexical_index)
+    # and return higher-is-better scores, unlike the distances of vector search.
+    # nprobe sets the recall/latency trade-off of a NumPy store's IVF index for this query.
+    # diversity (0-1, vector retrieval only) re-ranks the top n_results * overfetch with MMR, so
+    # the results are not all near-copies of the best match; 0 or None returns the plain top-k.
+    if diversity:
+        if not 0.0 < diversity <= 1.0:
+            raise ValueError(f"diversity must be between 0 and 1, got {diversity}")
+        if retrieval != "vector":
+            raise ValueError("diversity re-ranking needs retrieval='vector'")
+        return diverse_search(vectorstore, query_text, n_results, metadata_filters, diversity, overfetch, nprobe)
+    if retrieval == "vector":
+        return semantic_search(vectorstore, query_text, n_results, metadata_filters, nprobe)
+    if retrieval not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {retrieval}")
+    if lexical_index is None:
+        raise ValueError(f"retrieval={retrieval!r} needs a lexical_index")
+    
+    where = build_chroma_filter(metadata_filters, verbose=False) if metadata_filters else None
+    if retrieval == "lexical":
+        return lexical_search(vectorstore, lexical_index, query_text, n_results, where)
+    
+    lexical_results = lexical_search(vectorstore, lexical_index, query_text, n_results * overfetch, where)
+    try:
+        vector_results = semantic_search(vectorstore, query_text, n_results * overfetch, metadata_filters, nprobe)
+    except Exception as e:
+        print(f"Vector search failed ({type(e).__name__}: {e}), using lexical results only")
+        with span("lexical_fallback"):
+            return lexical_results[:n_results]
+    return reciprocal_rank_fusion([vector_results, lexical_results], n_results)
+
+@traced("vector_search")
+def semantic_search(vectorstore, query_text, n_results=3, metadata_filters=None, nprobe=None):
+    # Only the NumPy store takes a per-query nprobe; Chroma's HNSW uses its persisted search_ef
+    search_kwargs = {"nprobe": nprobe} if isinstance(vectorstore, NumpyVectorStore) else {}
+    
+    # Apply metadata filters if provided
+    if metadata_filters:
+        filter_dict = build_chroma_filter(metadata_filters)
         
         # Perform the search with filters
         try:
             results = vectorstore.similarity_search_with_score(
                 query_text,
                 k=n_results,  # Get more results initially
-                filter=filter_dict
+                filter=filter_dict,
+                **search_kwargs
             )
             print(f"Found {len(results)} results with metadata filters: {filter_dict}")
         except Exception as e:
             print(f"Error applying metadata filters: {e}")
             print("Falling back to semantic search without filters")
-            results = vectorstore.similarity_search_with_score(
-                query_text,
-                k=n_results  # Get more results initially
-            )
+            with span("filter_fallback"):
+                results = vectorstore.similarity_search_with_score(
+                    query_text,
+                    k=n_results,  # Get more results initially
+                    **search_kwargs
+                )
     else:
         # No metadata filters, just do semantic search
         results = vectorstore.similarity_search_with_score(
             query_text,
-            k=n_results  # Get more results initially
+            k=n_results,  # Get more results initially
+            **search_kwargs
         )
     
     return results[:n_results]
 
+def _query_collection_batch(collection, query_embeddings, n_results, where):
+    # One Chroma query for several embeddings sharing the same filter
+    from langchain.schema import Document
+    results = collection.query(
+        query_embeddings=query_embeddings,
+        n_results=n_results,
+        where=where,
+        include=["documents", "metadatas", "distances"]
+    )
+    return [
+        [
+            (Document(page_content=document, metadata=metadata or {}), distance)
+            for document, metadata, distance in zip(documents, metadatas, distances)
+        ]
+        for documents, metadatas, distances in zip(results["documents"], results["metadatas"], results["distances"])
+    ]
+
+@traced("vector_search")
+def search_by_vectors(vectorstore, query_embeddings, n_results, where, nprobe=None):
+    # Dispatch a batch of pre-computed query embeddings to whichever backend holds the listings
+    if isinstance(vectorstore, NumpyVectorStore):
+        return vectorstore.similarity_search_by_vectors(query_embeddings, k=n_results, filter=where, nprobe=nprobe)
+    return _query_collection_batch(vectorstore._collection, query_embeddings, n_results, where)
+
+def embed_queries(embedding_function, texts):
+    # Query texts are one-off; the embedding cache is only for listings
+    if hasattr(embedding_function, "embed_queries"):
+        return embedding_function.embed_queries(texts)
+    return embedding_function.embed_documents(texts)
+
+def query_similar_listings_batch(vectorstore, query_texts, n_results=3, metadata_filters=None):
+    # Batched version of query_similar_listings: one embedding call for all queries and one
+    # Chroma query per distinct filter. metadata_filters is either one dict applied to every
+    # query or a list with one dict (or None) per query.
+    # Returns one list of (Document, score) tuples per query, in input order.
+    query_texts = list(query_texts)
+    if not query_texts:
+        return []
+    if metadata_filters is None or isinstance(metadata_filters, dict):
+        metadata_filters = [metadata_filters] * len(query_texts)
+    if len(metadata_filters) != len(query_texts):
+        raise ValueError("metadata_filters must have one entry per query")
+    
+    query_embeddings = embed_queries(vectorstore._embedding_function, query_texts)
+    
+    # Group queries that share the same Chroma filter so each group is a single search
+    groups = {}
+    for i, filters in enumerate(metadata_filters):
+        where = build_chroma_filter(filters, verbose=False)
+        key = json.dumps(where, sort_keys=True)
+        groups.setdefault(key, (where, []))[1].append(i)
+    
+    results = [None] * len(query_texts)
+    for where, indices in groups.values():
+        embeddings = [query_embeddings[i] for i in indices]
+        try:
+            group_results = search_by_vectors(vectorstore, embeddings, n_results, where)
+        except Exception as e:
+            if where is None:
+                raise
+            print(f"Error applying metadata filters {where}: {e}")
+            print("Falling back to semantic search without filters")
+            with span("filter_fallback"):
+                group_results = search_by_vectors(vectorstore, embeddings, n_results, None)
+        for i, query_results in zip(indices, group_results):
+            results[i] = query_results[:n_results]
+    
+    return results
+
 # This block only runs when the script is executed directly, not when imported
 if __name__ == "__main__":
     # Check if environment variables are set